@@ -4,6 +4,7 @@ from app.object.socket_obj import UDPSocket
 from app.receive_audio import ReceiveAudio
 from app.send_audio import SendAudio
 from app.p2p import P2PManager
+from app.clock_sync import ClockSync
 from app.fetch import Fetch
 from app.const import *
 from app.logger import setup_logger, INFO, DEBUG
@@ -58,19 +59,28 @@ class Client:
                     break
             
             threads_started = True
-            self.send_audio = SendAudio(self.config, self.socket, self.running)
+            self.clock = ClockSync(self.config, self.socket, (self.server_address, self.server.rendezvous_port), self.running)
+            clock_thread = threading.Thread(target=self.clock.run, daemon=True)
+
+            self.send_audio = SendAudio(self.config, self.socket, self.running, self.clock)
             send_audio_thread = threading.Thread(target=self.send_audio.start, daemon=True)
             send_audio_thread.start()
 
-            self.receive_audio = ReceiveAudio(self.config, self.socket, self.running)
+            self.receive_audio = ReceiveAudio(self.config, self.socket, self.running, self.clock)
             receive_audio_thread = threading.Thread(target=self.receive_audio.start, daemon=True)
             receive_audio_thread.start()
+            clock_thread.start() # Replies come in through ReceiveAudio
             
             self.p2p_manager = P2PManager(self.config, self.socket, self.running)
             self.p2p_manager.local_channel_member_list = self.local_channel_member_list
+            self.p2p_manager.server.rendezvous_port = self.server.rendezvous_port
+            self.p2p_manager.server.sfu_threshold = self.server.sfu_threshold
             p2p_manager_thread = threading.Thread(target=self.p2p_manager.update_member, args=(channel_id,), daemon=True)
             p2p_manager_thread.start()
 
+            keepalive_thread = threading.Thread(target=self.server.keepalive_loop, args=(channel_id, self.running), daemon=True)
+            keepalive_thread.start()
+
             while not self.running.is_set():
                 cmd = input("Enter command (exit): ")
                 if cmd == "exit":
@@ -93,6 +103,8 @@ class Client:
                     receive_audio_thread.join()
                 if "p2p_manager_thread" in locals():
                     p2p_manager_thread.join()
+                if "keepalive_thread" in locals():
+                    keepalive_thread.join()
             self.log.info("Stopped all threads")
             self.socket.stop()
             return False
\ No newline at end of file
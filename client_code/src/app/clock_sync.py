@@ -0,0 +1,116 @@
+import time
+import random
+import threading
+from collections import deque
+
+from app.logger import setup_logger, INFO, DEBUG
+from app.object.socket_obj import UDPSocket
+from app.const import *
+
+HISTORY = 8 # rounds used for the drift fit
+REPLY_WAIT = 0.5 # seconds to wait for late replies after the last request of a round
+
+class ClockSync:
+    """NTP-style estimate of the server clock, from timestamped UDP samples on the rendezvous port.
+
+    Every round sends `clock_samples` requests and keeps the reply with the
+    smallest round trip, the one least disturbed by queueing on the way. Rounds
+    repeat every `clock_sync_interval` seconds in the background, and a least
+    squares fit over the last rounds gives the drift of the local clock, so the
+    offset stays right between rounds. Replies reach us through ReceiveAudio,
+    which owns the socket's receive side and calls handle_reply().
+    """
+    def __init__(self, config, socket:UDPSocket, server:tuple, stop_event:threading.Event):
+        self.s = socket
+        self.server = server
+        self.stop_event = stop_event
+        self.samples = config.get("clock_samples", 8)
+        self.interval = config.get("clock_sync_interval", 15) # seconds between rounds
+        self.lock = threading.Lock()
+        self.seq = random.getrandbits(32)
+        self.round:set[int] = set() # sequence numbers of the current round
+        self.replies:list[tuple[float, float, float]] = [] # (rtt, offset, local receive time) of the current round
+        self.history:deque[tuple[float, float]] = deque(maxlen=HISTORY) # (local time, offset) of the best sample of each round
+        self.base_time = 0.0
+        self.base_offset = 0.0
+        self.drift = 0.0 # seconds the server clock gains on ours per second
+        self.rtt:float|None = None # round trip of the best sample of the last round
+        self.synced = threading.Event()
+
+        log_level = INFO if not config["debug"] else DEBUG
+        self.log = setup_logger(__name__, log_level)
+
+    def offset(self, now:float|None=None) -> float:
+        """Server time minus local time at `now` (local, default: now)."""
+        if now is None:
+            now = time.time()
+        return self.base_offset + self.drift * (now - self.base_time)
+
+    def server_time(self) -> float:
+        now = time.time()
+        return now + self.offset(now)
+
+    def handle_reply(self, data):
+        if len(data.data) < time_reply_header.size:
+            return
+        _, seq, t1, t2, t3 = time_reply_header.unpack_from(data.data)
+        t4 = data.timestamp # stamped right after recvfrom, before any queueing in our threads
+        with self.lock:
+            if seq not in self.round:
+                return # A late reply from an earlier round
+            self.round.discard(seq)
+            rtt = (t4 - t1) - (t3 - t2)
+            offset = ((t2 - t1) + (t3 - t4)) / 2
+            self.replies.append((rtt, offset, t4))
+
+    def sync_once(self) -> bool:
+        """One round of samples, False if the server did not answer any of them."""
+        with self.lock:
+            self.round.clear()
+            self.replies.clear()
+        for _ in range(self.samples):
+            if self.stop_event.is_set():
+                return False
+            with self.lock:
+                self.seq = (self.seq + 1) & 0xFFFFFFFF
+                self.round.add(self.seq)
+                # Padded to the reply size, so the server never answers with more than it got
+                packet = time_request_header.pack(time_request_type, self.seq, time.time()).ljust(time_reply_header.size, b"\0")
+            try:
+                self.s.send(packet, self.server)
+            except OSError:
+                return False
+            time.sleep(0.02) # Spread out, so one burst of cross traffic does not hit every sample
+        self.stop_event.wait(REPLY_WAIT)
+        with self.lock:
+            if not self.replies:
+                return False
+            rtt, offset, t4 = min(self.replies)
+            self.history.append((t4, offset))
+            self.rtt = rtt
+            self.fit()
+        self.synced.set()
+        self.log.debug(f"Clock offset {self.offset() * 1000:.2f} ms, RTT {rtt * 1000:.2f} ms, drift {self.drift * 1e6:.1f} ppm")
+        return True
+
+    def fit(self):
+        # Least squares line through the offsets of the last rounds, the slope is the drift
+        if len(self.history) < 3:
+            self.base_time, self.base_offset = self.history[-1]
+            return
+        n = len(self.history)
+        mean_t = sum(t for t, _ in self.history) / n
+        mean_o = sum(o for _, o in self.history) / n
+        var = sum((t - mean_t) ** 2 for t, _ in self.history)
+        self.drift = sum((t - mean_t) * (o - mean_o) for t, o in self.history) / var if var else 0.0
+        self.base_time, self.base_offset = mean_t, mean_o
+
+    def run(self):
+        """Re-sync every `clock_sync_interval` seconds until stopped."""
+        try:
+            while not self.stop_event.is_set():
+                if not self.sync_once() and not self.stop_event.is_set():
+                    self.log.warning("Clock sync got no reply from the server")
+                self.stop_event.wait(self.interval)
+        finally:
+            self.log.debug("Clock sync stopped")
@@ -0,0 +1,223 @@
+import itertools
+import numpy as np
+
+from app.const import codec_offer_header, codec_offer_type, codec_offer_rate
+
+try:
+    import opuslib
+except ImportError:
+    opuslib = None
+
+# Audio codecs. Every codec turns one frame of int16 mono PCM into one payload and back.
+# Each frame is coded on its own, so a lost packet never breaks the frames after it.
+
+class Codec:
+    """Raw 16 bit PCM, what every client can decode."""
+    id = 0
+    name = "pcm"
+    builtin = True # False for codecs that need an optional package
+    bits_per_sample = 16
+
+    def __init__(self, rate:int, frame:int):
+        self.rate = rate
+        self.frame = frame # samples per frame
+
+    @classmethod
+    def available(cls, rate:int, frame:int) -> bool:
+        return True
+
+    def encode(self, pcm:np.ndarray) -> bytes:
+        return pcm.astype("<i2", copy=False).tobytes()
+
+    def decode(self, payload:bytes) -> np.ndarray:
+        return np.frombuffer(payload, dtype="<i2")
+
+    def valid(self, payload:bytes) -> bool:
+        """Whether `payload` has the size this codec makes for one frame, anything else is dropped undecoded."""
+        return len(payload) == self.frame * self.bits_per_sample // 8
+
+def _ulaw_table() -> np.ndarray:
+    x = np.arange(-32768, 32768, dtype=np.int32) >> 2
+    mask = np.where(x >= 0, 0xFF, 0x7F)
+    x = np.minimum(np.abs(x), 8159) + 0x21
+    segment = np.searchsorted(np.array([0x3F, 0x7F, 0xFF, 0x1FF, 0x3FF, 0x7FF, 0xFFF, 0x1FFF]), x)
+    codes = np.where(segment >= 8, 0x7F, (np.minimum(segment, 7) << 4) | ((x >> (np.minimum(segment, 7) + 1)) & 0x0F)) ^ mask
+    return np.roll(codes.astype(np.uint8), -32768) # index with the sample's bits as uint16
+
+def _ulaw_decode_table() -> np.ndarray:
+    u = ~np.arange(256, dtype=np.int32) & 0xFF
+    exponent = (u >> 4) & 0x07
+    magnitude = (((u & 0x0F) << 3) + 0x84 << exponent) - 0x84
+    return np.where(u & 0x80, -magnitude, magnitude).astype(np.int16)
+
+def _alaw_table() -> np.ndarray:
+    x = np.arange(-32768, 32768, dtype=np.int32) >> 3
+    mask = np.where(x >= 0, 0xD5, 0x55)
+    x = np.where(x >= 0, x, -x - 1)
+    segment = np.searchsorted(np.array([0x1F, 0x3F, 0x7F, 0xFF, 0x1FF, 0x3FF, 0x7FF, 0xFFF]), x)
+    shift = np.where(segment < 2, 1, segment)
+    codes = np.where(segment >= 8, 0x7F, (np.minimum(segment, 7) << 4) | ((x >> np.minimum(shift, 7)) & 0x0F)) ^ mask
+    return np.roll(codes.astype(np.uint8), -32768)
+
+def _alaw_decode_table() -> np.ndarray:
+    a = np.arange(256, dtype=np.int32) ^ 0x55
+    segment = (a & 0x70) >> 4
+    t = (a & 0x0F) << 4
+    t = np.where(segment == 0, t + 8, (t + 0x108) << np.maximum(segment - 1, 0))
+    return np.where(a & 0x80, t, -t).astype(np.int16)
+
+class ULaw(Codec):
+    """G.711 μ-law, 8 bits per sample, one table lookup each way."""
+    id = 1
+    name = "ulaw"
+    bits_per_sample = 8
+    ENCODE = _ulaw_table()
+    DECODE = _ulaw_decode_table()
+
+    def encode(self, pcm:np.ndarray) -> bytes:
+        return self.ENCODE[pcm.view(np.uint16)].tobytes()
+
+    def decode(self, payload:bytes) -> np.ndarray:
+        return self.DECODE[np.frombuffer(payload, dtype=np.uint8)]
+
+class ALaw(ULaw):
+    """G.711 A-law."""
+    id = 2
+    name = "alaw"
+    ENCODE = _alaw_table()
+    DECODE = _alaw_decode_table()
+
+IMA_STEPS = [
+    7, 8, 9, 10, 11, 12, 13, 14, 16, 17, 19, 21, 23, 25, 28, 31, 34, 37, 41, 45,
+    50, 55, 60, 66, 73, 80, 88, 97, 107, 118, 130, 143, 157, 173, 190, 209, 230,
+    253, 279, 307, 337, 371, 408, 449, 494, 544, 598, 658, 724, 796, 876, 963,
+    1060, 1166, 1282, 1411, 1552, 1707, 1878, 2066, 2272, 2499, 2749, 3024, 3327,
+    3660, 4026, 4428, 4871, 5358, 5894, 6484, 7132, 7845, 8630, 9493, 10442,
+    11487, 12635, 13899, 15289, 16818, 18500, 20350, 22385, 24623, 27086, 29794, 32767,
+]
+IMA_INDEX = [-1, -1, -1, -1, 2, 4, 6, 8]
+# Precomputed per step index: the reconstructed difference for each code, and the next step index
+IMA_DIFF = [[(step >> 3) + (step if c & 4 else 0) + (step >> 1 if c & 2 else 0) + (step >> 2 if c & 1 else 0) for c in range(8)] for step in IMA_STEPS]
+IMA_NEXT = [[min(max(i + IMA_INDEX[c & 7], 0), 88) for c in range(16)] for i in range(89)]
+IMA_SIGNED_DIFF = np.array([[d if c < 8 else -d for c, d in enumerate(diffs + diffs)] for diffs in IMA_DIFF], dtype=np.int32)
+
+class IMAADPCM(Codec):
+    """IMA-ADPCM, 4 bits per sample.
+
+    Payload: predictor (int16), step index (uint8), then two codes per byte,
+    low nibble first. The step index recurrence is inherently sequential, so
+    encoding is a tight loop over precomputed tables; decoding only walks the
+    step indexes and does the rest (difference lookup, prefix sum) in NumPy.
+    """
+    id = 3
+    name = "adpcm"
+    bits_per_sample = 4
+
+    def __init__(self, rate:int, frame:int):
+        super().__init__(rate, frame)
+        self.predictor = 0
+        self.index = 0
+
+    def encode(self, pcm:np.ndarray) -> bytes:
+        predictor = self.predictor
+        index = self.index
+        header = bytes((predictor & 0xFF, (predictor >> 8) & 0xFF, index))
+        codes = bytearray(len(pcm) + (len(pcm) & 1))
+        step = IMA_STEPS[index]
+        diffs = IMA_DIFF[index]
+        for i, sample in enumerate(pcm.tolist()):
+            difference = sample - predictor
+            if difference >= 0:
+                code = min(7, (difference << 2) // step)
+                predictor = min(predictor + diffs[code], 32767)
+                codes[i] = code
+            else:
+                code = min(7, (-difference << 2) // step)
+                predictor = max(predictor - diffs[code], -32768)
+                codes[i] = code | 8
+            index = IMA_NEXT[index][code]
+            step = IMA_STEPS[index]
+            diffs = IMA_DIFF[index]
+        # The next frame starts where this one ended, but carries that state itself
+        self.predictor = predictor
+        self.index = index
+        packed = np.frombuffer(codes, dtype=np.uint8)
+        return header + (packed[0::2] | (packed[1::2] << 4)).tobytes()
+
+    def decode(self, payload:bytes) -> np.ndarray:
+        if len(payload) < 3:
+            return np.zeros(0, dtype=np.int16)
+        predictor = int.from_bytes(payload[:2], "little", signed=True)
+        packed = np.frombuffer(payload, dtype=np.uint8, offset=3)
+        codes = np.empty(len(packed) * 2, dtype=np.uint8)
+        codes[0::2] = packed & 0x0F
+        codes[1::2] = packed >> 4
+        indexes = np.fromiter(itertools.accumulate(codes.tolist(), lambda i, c: IMA_NEXT[i][c], initial=min(payload[2], 88)), dtype=np.intp, count=len(codes) + 1)
+        samples = predictor + np.cumsum(IMA_SIGNED_DIFF[indexes[:-1], codes])
+        if samples.min(initial=0) < -32768 or samples.max(initial=0) > 32767:
+            samples = self._clamped(predictor, IMA_SIGNED_DIFF[indexes[:-1], codes].tolist())
+        return samples.astype(np.int16)
+
+    def valid(self, payload:bytes) -> bool:
+        return len(payload) == 3 + (self.frame + 1) // 2
+
+    @staticmethod
+    def _clamped(predictor:int, diffs:list[int]) -> np.ndarray:
+        # The encoder clamps after every sample, so a frame that hits full scale has to be replayed step by step
+        samples = []
+        for diff in diffs:
+            predictor = min(max(predictor + diff, -32768), 32767)
+            samples.append(predictor)
+        return np.array(samples, dtype=np.int32)
+
+class Opus(Codec):
+    """Opus through opuslib, when it is installed. Only for Opus sample rates and frame sizes."""
+    id = 4
+    name = "opus"
+    builtin = False
+    bits_per_sample = None # variable bitrate
+    RATES = (8000, 12000, 16000, 24000, 48000)
+
+    def __init__(self, rate:int, frame:int):
+        super().__init__(rate, frame)
+        self.encoder = opuslib.Encoder(rate, 1, opuslib.APPLICATION_VOIP)
+        self.decoder = opuslib.Decoder(rate, 1)
+
+    @classmethod
+    def available(cls, rate:int, frame:int) -> bool:
+        return opuslib is not None and rate in cls.RATES and frame * 1000 / rate in (2.5, 5, 10, 20, 40, 60)
+
+    def encode(self, pcm:np.ndarray) -> bytes:
+        return self.encoder.encode(pcm.astype("<i2", copy=False).tobytes(), len(pcm))
+
+    def decode(self, payload:bytes) -> np.ndarray:
+        try:
+            return np.frombuffer(self.decoder.decode(bytes(payload), self.frame), dtype="<i2")
+        except opuslib.OpusError as e:
+            raise ValueError(f"Undecodable Opus payload: {e}") from e
+
+    def valid(self, payload:bytes) -> bool:
+        return len(payload) > 0 # Variable bitrate, decode() raises ValueError on garbage
+
+CODECS:dict[int, type[Codec]] = {codec.id: codec for codec in (Codec, ULaw, ALaw, IMAADPCM, Opus)}
+CODEC_NAMES:dict[str, type[Codec]] = {codec.name: codec for codec in CODECS.values()}
+DEFAULT_PREFERENCES = ["opus", "adpcm", "ulaw", "alaw", "pcm"]
+
+def preferences(config, rate:int, frame:int) -> list[int]:
+    """Codec IDs we can use, best first, from config["codecs"]. PCM always comes last as the fallback."""
+    ids = []
+    for name in config.get("codecs", DEFAULT_PREFERENCES) + ["pcm"]:
+        codec = CODEC_NAMES.get(name)
+        if codec is not None and codec.id not in ids and codec.available(rate, frame):
+            ids.append(codec.id)
+    return ids
+
+def choose(preferences:list[int], offered) -> int:
+    """Our first preference the peer can decode, PCM if we have not heard its offer."""
+    for codec_id in preferences:
+        if codec_id in offered:
+            return codec_id
+    return Codec.id
+
+def offer(preferences:list[int], rate:int) -> bytes:
+    return codec_offer_header.pack(codec_offer_type, len(preferences)) + bytes(preferences) + codec_offer_rate.pack(rate)
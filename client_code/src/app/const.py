@@ -1,2 +1,67 @@
+import struct
+
 send_data = b"hello"
-confirm_data = b"confirm"
\ No newline at end of file
+confirm_data = b"confirm"
+
+# Join packet: channel_id, username length, username, then our LAN ip and port for peers behind the same NAT
+join_header = struct.Struct(">II")
+lan_candidate = struct.Struct(">4sH")
+
+# Rendezvous control packets, the first byte is the packet type
+keepalive_type = 0x81
+keepalive_header = struct.Struct(">BI") # type, channel_id, followed by the username
+keepalive_interval = 5 # seconds, the server drops members after 15 s of silence
+
+# Membership notifications pushed by the rendezvous server, acked with notify_ack_header
+notify_type = 0x82
+notify_ack_type = 0x83
+notify_header = struct.Struct(">BIBII4sH4sHH") # type, seq, event, channel_id, channel version, ip, port, LAN ip, LAN port (0 if none), username length, followed by the username
+notify_ack_header = struct.Struct(">BI") # type, seq
+notify_events = {1: "join", 2: "leave"}
+
+# Relay fallback for peers we cannot punch through to
+relay_request_type = 0x84
+relay_request_header = struct.Struct(">BIB") # type, channel_id, own username length, followed by the own username and the peer's username
+relay_allocated_type = 0x85
+relay_allocated_header = struct.Struct(">BIH8s") # type, channel_id, relay port, token, followed by the peer's username
+relay_bind_type = 0x86
+relay_bind_header = struct.Struct(">B8s") # type, token, sent to the relay port
+
+# SFU mode for big channels: one upload to the server, which forwards it to everyone else
+sfu_request_type = 0x87
+sfu_request_header = struct.Struct(">BIB") # type, channel_id, username length, followed by the username
+sfu_allocated_type = 0x88
+sfu_allocated_header = struct.Struct(">BIH8s") # type, channel_id, SFU port, token
+sfu_bind_type = 0x89
+sfu_bind_header = struct.Struct(">B8s") # type, token, sent to the SFU port every second
+sfu_media_type = 0x8A
+sfu_media_header = struct.Struct(">BH") # type, sender slot, followed by the sender's packet
+
+# Clock sync on the rendezvous port, NTP-style: the server stamps when it got the request and when it answered
+time_request_type = 0x8B
+time_request_header = struct.Struct(">BId") # type, seq, our send time, padded with zeros to the reply size
+time_reply_type = 0x8C
+time_reply_header = struct.Struct(">BIddd") # type, seq, our send time, server receive time, server send time
+
+# Audio packets, told apart from everything else by the magic byte.
+# magic, version << 4 | packet type, codec ID, sequence, capture timestamp (server time), samples per frame, flags,
+# followed by the codec payload
+audio_magic = 0xA7
+audio_version = 1
+audio_header = struct.Struct(">BBBIdHB")
+audio_type_frame = 1 # one frame of audio
+audio_type_parity = 2 # XOR of a group of frames, see app.fec; sequence is the group's first frame
+audio_type_comfort_noise = 3 # sent instead of frames while the sender is silent, see app.dtx; sequence is the last frame sent
+audio_flag_marker = 0x01 # first frame after a gap in sending, receivers may resync
+audio_rate_shift = 4 # the high 4 bits of the flags index audio_rates, the sample rate of the stream
+audio_rates = (44100, 8000, 12000, 16000, 24000, 32000, 48000)
+
+# Codec negotiation, sent to a peer once punching succeeds: type, count, followed by our codec IDs, best first,
+# then the sample rate we play at (missing from clients before audio profiles, which play 44100 Hz)
+codec_offer_type = 0x8D
+codec_offer_header = struct.Struct(">BB")
+codec_offer_rate = struct.Struct(">I")
+
+# Loss feedback, sent to each peer we hear from every second: type, fraction of its frames we lost (0-255)
+loss_report_type = 0x8E
+loss_report_header = struct.Struct(">BB")
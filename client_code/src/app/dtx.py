@@ -0,0 +1,96 @@
+import math
+import numpy as np
+
+# Discontinuous transmission: a voice activity detector on the capture path, and comfort noise
+# descriptors (a coarse noise spectrum, in the spirit of RFC 3389) sent instead of silent frames.
+
+SPEECH_MARGIN = 9 # dB above the noise floor that counts as speech
+UNVOICED_MARGIN = 4 # dB above the floor that counts as speech when the frame is crossing-rich
+UNVOICED_CROSSINGS = 0.25 # zero crossings per sample of fricatives (s, f, sh)
+NOISE_RISE = 0.05 # dB per frame the noise floor may creep up, drops are followed at once
+HANGOVER = 0.3 # seconds of transmission kept after the last speech frame, so word endings are not clipped
+CN_INTERVAL = 1.0 # seconds between comfort noise descriptors during silence
+CN_BANDS = [0, 250, 500, 1000, 2000, 3000, 4000, 6000] # Hz, lower edges, the last band reaches Nyquist
+BANK_SAMPLES = 16384 # noise made up front per band for comfort noise
+
+class VoiceDetector:
+    """Energy and zero-crossing voice activity detector with hangover, for one capture stream.
+
+    The noise floor follows the quietest recent frames. A frame is speech
+    when its energy is clearly above the floor, or a little above it with
+    the zero-crossing rate of a fricative, which is quiet but not noise.
+    After speech, HANGOVER seconds more are still reported as speech.
+    """
+    def __init__(self, rate:int, frame:int):
+        self.hangover = math.ceil(HANGOVER * rate / frame)
+        self.noise:float|None = None # dB
+        self.remaining = 0 # hangover frames left
+
+    def __call__(self, pcm:np.ndarray) -> bool:
+        x = pcm.astype(np.float32)
+        energy = 10 * math.log10(float(np.dot(x, x)) / len(x) + 1)
+        crossings = np.count_nonzero(np.signbit(x[1:]) != np.signbit(x[:-1])) / len(x)
+        if self.noise is None or energy < self.noise:
+            self.noise = energy
+        else:
+            self.noise += NOISE_RISE
+        speech = energy > self.noise + SPEECH_MARGIN or (energy > self.noise + UNVOICED_MARGIN and crossings > UNVOICED_CROSSINGS)
+        if speech:
+            self.remaining = self.hangover
+            return True
+        if self.remaining:
+            self.remaining -= 1
+            return True
+        return False
+
+def _band_of_bins(rate:int, frame:int) -> np.ndarray:
+    frequencies = np.fft.rfftfreq(frame, 1 / rate)
+    return np.searchsorted(CN_BANDS, frequencies, side="right") - 1
+
+class NoiseDescriber:
+    """Averages the spectrum of silent frames into a comfort noise descriptor: one byte per band, dB per sample."""
+    def __init__(self, rate:int, frame:int):
+        self.frame = frame
+        self.bands = _band_of_bins(rate, frame)
+        self.widths = np.maximum(np.bincount(self.bands, minlength=len(CN_BANDS)), 1)
+        self.power = np.zeros(len(CN_BANDS))
+        self.frames = 0
+
+    def add(self, pcm:np.ndarray):
+        spectrum = np.fft.rfft(pcm.astype(np.float32))
+        self.power += np.bincount(self.bands, spectrum.real ** 2 + spectrum.imag ** 2, len(CN_BANDS)) / self.widths
+        self.frames += 1
+
+    def descriptor(self) -> bytes:
+        """The descriptor of the frames added since the last call."""
+        power = self.power / (max(self.frames, 1) * self.frame)
+        self.power[:] = 0
+        self.frames = 0
+        return np.clip(np.round(10 * np.log10(power + 1)), 0, 255).astype(np.uint8).tobytes()
+
+class ComfortNoise:
+    """Plays comfort noise for any number of silent peers: their band powers add up, and one frame of shaped noise covers them all.
+
+    Each band's unit-power noise is made once, into a bank a few frames
+    long, so a frame is just the band gains times a random window of it.
+    """
+    def __init__(self, rate:int, frame:int):
+        self.frame = frame
+        self.rng = np.random.default_rng()
+        size = max(BANK_SAMPLES, 1 << (4 * frame).bit_length())
+        bands = _band_of_bins(rate, size)
+        spectrum = (self.rng.standard_normal(len(bands)) + 1j * self.rng.standard_normal(len(bands))) * np.sqrt(size / 2)
+        self.bank = np.stack([np.fft.irfft(np.where(bands == band, spectrum, 0), size) for band in range(len(CN_BANDS))]).astype(np.float32)
+
+    @staticmethod
+    def power(descriptor:bytes) -> np.ndarray:
+        levels = np.frombuffer(descriptor, dtype=np.uint8)[:len(CN_BANDS)].astype(np.float64)
+        power = np.zeros(len(CN_BANDS))
+        power[:len(levels)] = 10 ** (levels / 10) - 1
+        return power
+
+    def generate(self, power:np.ndarray) -> np.ndarray:
+        """One frame of noise with `power` (per band, per sample, as from power()) as its spectrum."""
+        start = int(self.rng.integers(self.bank.shape[1] - self.frame))
+        noise = np.sqrt(power).astype(np.float32) @ self.bank[:, start:start + self.frame]
+        return np.clip(noise, -32768, 32767).astype(np.int16)
@@ -0,0 +1,85 @@
+import struct
+import numpy as np
+
+# Forward error correction: XOR parity over aligned groups of N frames of one codec stream.
+# A parity packet is an audio packet of type audio_type_parity whose sequence is the first of
+# the group, with this payload: frame count, the length of each payload, then the XOR of the payloads.
+PARITY_COUNT = struct.Struct(">B")
+PARITY_LENGTH = struct.Struct(">H")
+MAX_PAYLOAD = 65535
+HISTORY = 64 # payloads kept per peer for recovery
+
+# (loss fraction up to, group size), the first that fits wins; 0 turns FEC off
+LEVELS = [(0.01, 0), (0.03, 8), (0.08, 4), (1.0, 2)]
+MAX_DELAY = 0.2 # seconds, receivers buffer a whole group so the parity comes in time
+LOSS_SMOOTHING = 0.25 # weight of each new loss report, one second holds only a few dozen frames
+
+def smooth_loss(previous:float|None, reported:float) -> float:
+    return reported if previous is None else previous + (reported - previous) * LOSS_SMOOTHING
+
+def group_size(loss:float, frame_time:float) -> int:
+    """Parity group size for a peer that reports losing `loss` of our frames."""
+    for limit, size in LEVELS:
+        if loss <= limit:
+            break
+    return size and max(2, min(size, int(MAX_DELAY / frame_time)))
+
+def parity_group(parity:memoryview) -> int:
+    """Frames covered by a parity payload, 0 if it is malformed."""
+    return PARITY_COUNT.unpack_from(parity)[0] if len(parity) >= PARITY_COUNT.size else 0
+
+class ParityEncoder:
+    """Builds one parity payload per `size` frames, groups start at multiples of `size`."""
+    def __init__(self, size:int):
+        self.size = size
+        self.parity = np.zeros(MAX_PAYLOAD, dtype=np.uint8)
+        self.first:int|None = None
+        self.lengths:list[int] = []
+
+    def add(self, seq:int, payload:bytes) -> tuple[int, bytes]|None:
+        """Feed the payload of frame `seq`, returns (first seq, parity payload) when a group is complete."""
+        if seq % self.size == 0:
+            self.first = seq
+            self.lengths.clear()
+            self.parity[:] = 0
+        elif self.first is None or seq != self.first + len(self.lengths):
+            self.first = None # Missed a frame, this group is broken
+            return None
+        data = np.frombuffer(payload, dtype=np.uint8)
+        self.parity[:len(data)] ^= data
+        self.lengths.append(len(data))
+        if len(self.lengths) < self.size:
+            return None
+        first, self.first = self.first, None
+        lengths = b"".join(PARITY_LENGTH.pack(length) for length in self.lengths)
+        return first, PARITY_COUNT.pack(self.size) + lengths + self.parity[:max(self.lengths)].tobytes()
+
+class ParityDecoder:
+    """Recent payloads of one peer, to rebuild a single missing frame of a group from its parity."""
+    def __init__(self):
+        self.payloads:dict[int, memoryview] = {}
+
+    def received(self, seq:int, payload:memoryview):
+        self.payloads[seq] = payload
+        if len(self.payloads) > HISTORY:
+            for old in sorted(self.payloads)[:len(self.payloads) - HISTORY]:
+                del self.payloads[old]
+
+    def recover(self, first:int, parity:memoryview) -> tuple[int, bytes]|None:
+        """(seq, payload) of the one missing frame of the group, None if nothing or too much is missing."""
+        count = parity_group(parity)
+        offset = PARITY_COUNT.size + count * PARITY_LENGTH.size
+        if not count or len(parity) < offset:
+            return None
+        missing = [seq for seq in range(first, first + count) if seq not in self.payloads]
+        if len(missing) != 1:
+            return None
+        data = np.frombuffer(parity, dtype=np.uint8, offset=offset).copy()
+        for seq in range(first, first + count):
+            if seq != missing[0]:
+                payload = np.frombuffer(self.payloads[seq], dtype=np.uint8)
+                data[:len(payload)] ^= payload
+        length, = PARITY_LENGTH.unpack_from(parity, PARITY_COUNT.size + (missing[0] - first) * PARITY_LENGTH.size)
+        payload = data[:length].tobytes()
+        self.received(missing[0], memoryview(payload))
+        return missing[0], payload
@@ -1,6 +1,6 @@
 import requests
-import ipaddress
-import struct
+import socket
+import threading
 
 from app.object.socket_obj import UDPSocket
 from app.logger import setup_logger, INFO, DEBUG
@@ -14,35 +14,43 @@ class Fetch:
         self.debug = config["debug"]
         self.socket = socket
         self.session = requests.Session()
+        self.rendezvous_port = None
+        self.sfu_threshold = None # channels with this many members switch to the SFU, None if the server has none
+        self.cache = {} # {url: (etag, json)} for conditional GETs
 
         log_level = INFO if not config["debug"] else DEBUG
         self.log = setup_logger(__name__, log_level)
 
-    def get_time(self):
+    def conditional_get(self, url:str):
+        """GET with If-None-Match, an unchanged resource (304) comes back from the local cache."""
+        cached = self.cache.get(url)
+        headers = {"If-None-Match": cached[0]} if cached else {}
         try:
-            response = self.session.get(f"http://{self.server_address}/api/time")
+            response = self.session.get(url, headers=headers)
+            if response.status_code == 304 and cached:
+                self.log.debug(f"Not modified: {url}")
+                return cached[1]
             response.raise_for_status()
         except requests.exceptions.RequestException as e:
             self.log.error(f"Error connecting to server: {e}")
             return
-        resp = response.json()["time"]
+        resp = response.json()
+        etag = response.headers.get("ETag")
+        if etag:
+            self.cache[url] = (etag, resp)
         self.log.debug(f"Response: {resp}")
         return resp
 
     def channel(self, channel_id:int):
-        try:
-            response = self.session.get(f"http://{self.server_address}/api/channel/{channel_id}")
-            response.raise_for_status()
-        except requests.exceptions.RequestException as e:
-            self.log.error(f"Error connecting to server: {e}")
-            return
-        resp = response.json()
-        self.log.debug(f"Response: {resp}")
-        return resp
+        return self.conditional_get(f"http://{self.server_address}/api/channel/{channel_id}")
 
     def channel_user_list(self, channel_id:int):
+        return self.conditional_get(f"http://{self.server_address}/api/channel/{channel_id}/members")
+
+    def member_updates(self, channel_id:int, since:int, timeout:float=25):
+        """Long-poll membership deltas after version `since`."""
         try:
-            response = self.session.get(f"http://{self.server_address}/api/channel/{channel_id}/members")
+            response = self.session.get(f"http://{self.server_address}/api/channel/{channel_id}/members", params={"since": since, "timeout": timeout}, timeout=timeout + 5)
             response.raise_for_status()
         except requests.exceptions.RequestException as e:
             self.log.error(f"Error connecting to server: {e}")
@@ -51,25 +59,6 @@ class Fetch:
         self.log.debug(f"Response: {resp}")
         return resp
 
-    def is_same_lan(self, ip1, ip2):
-        try:
-            net1 = ipaddress.IPv4Address(ip1)
-            net2 = ipaddress.IPv4Address(ip2)
-            # 比對前兩段或前三段的 IP（視情況而定）
-            return str(net1).split('.')[:3] == str(net2).split('.')[:3]
-        except:
-            return False
-
-    def lan_ip(self, self_ip:str, channel_id:int):
-        try:
-            resp = self.session.post(f"http://{self.server_address}/api/channel/{channel_id}/lan_ip", json={"name": self.username, "ip": self_ip, "lan_ip": self.socket.LOCAL_IP, "port": self.socket.PORT})
-        except requests.exceptions.RequestException as e:
-            self.log.error(f"Error connecting to server: {e}")
-            return None
-        finally:
-            self.log.debug(f"LAN IP sent: {self_ip}")
-            return resp
-
     def join_channel(self, channel_id:int):
         if self.socket is None:
             self.log.error("Socket is not initialized")
@@ -81,13 +70,15 @@ class Fetch:
             return None
         resp = response.json()
         port = int(resp["port"])
+        self.rendezvous_port = port
+        self.sfu_threshold = resp.get("sfu_threshold")
         self.log.debug(f"Port: {port}")
         try:
             self.socket.set_timeout(2.0)
+            username_bytes = self.username.encode('utf-8')
+            packet = join_header.pack(channel_id, len(username_bytes)) + username_bytes
+            packet += lan_candidate.pack(socket.inet_aton(self.socket.LOCAL_IP), self.socket.PORT)
             while True:
-                username_bytes = self.username.encode('utf-8')
-                username_length = len(username_bytes)
-                packet = struct.pack(">II", channel_id, username_length) + username_bytes
                 self.socket.send(packet, (self.server_address, port))
                 self.log.debug(f"Join channel packet sent to {self.server_address}:{port}")
                 try:
@@ -120,4 +111,30 @@ class Fetch:
 
             return None
         resp = response.json()
-        return resp
\ No newline at end of file
+        return resp
+
+    def keepalive_loop(self, channel_id:int, stop_event:threading.Event):
+        """Tell the rendezvous server we are still here until stop_event is set."""
+        packet = keepalive_header.pack(keepalive_type, channel_id) + self.username.encode('utf-8')
+        while not stop_event.wait(keepalive_interval):
+            try:
+                self.socket.send(packet, (self.server_address, self.rendezvous_port))
+            except OSError:
+                self.log.debug("Failed to send keepalive")
+
+    def request_relay(self, channel_id:int, peer:str):
+        """Ask the rendezvous server for a relay port to `peer`, the answer comes back on our socket."""
+        name = self.username.encode('utf-8')
+        packet = relay_request_header.pack(relay_request_type, channel_id, len(name)) + name + peer.encode('utf-8')
+        try:
+            self.socket.send(packet, (self.server_address, self.rendezvous_port))
+        except OSError:
+            self.log.debug("Failed to send relay request")
+
+    def request_sfu(self, channel_id:int):
+        """Ask the rendezvous server for an SFU subscription, the answer comes back on our socket."""
+        name = self.username.encode('utf-8')
+        try:
+            self.socket.send(sfu_request_header.pack(sfu_request_type, channel_id, len(name)) + name, (self.server_address, self.rendezvous_port))
+        except OSError:
+            self.log.debug("Failed to send SFU request")
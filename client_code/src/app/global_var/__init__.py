@@ -1,7 +1,16 @@
+import queue
+
 class SharedData:
     def __init__(self):
         self.connecting_list = []
         self.local_channel_member_list = []
         self.get_send_data_list:list[tuple] = [] # (ip, port) for getting NAT punch data from other threads
+        self.member_events:queue.Queue[dict] = queue.Queue() # membership notifications from the server, consumed by P2PManager
+        self.relay_allocations:dict[str, tuple] = {} # peer name -> ((relay ip, relay port), token), filled by ReceiveAudio
+        self.sfu:dict|None = None # {"addr": (ip, port), "token": bytes} once the server gave us an SFU subscription
+        self.sfu_active = False # send one stream to the SFU instead of one per peer
+        self.peer_codecs:dict[tuple, bytes] = {} # (ip, port) -> codec IDs the peer can decode, from its codec offer
+        self.peer_rates:dict[tuple, int] = {} # (ip, port) -> sample rate the peer plays at, from its codec offer
+        self.peer_loss:dict[tuple, float] = {} # (ip, port) -> fraction of our frames the peer reports lost, picks our FEC level
 
 datas = SharedData()
\ No newline at end of file
@@ -0,0 +1,191 @@
+import math
+import threading
+import numpy as np
+
+from app.plc import Concealer
+
+MIN_DEPTH = 1 # frames
+MAX_DEPTH = 8
+JITTER_MULTIPLIER = 3 # target depth covers this many times the measured jitter
+SHRINK_AFTER = 50 # ticks above target before one frame is dropped to cut latency
+RESET_GAP = 100 # a sequence jump this big means the sender restarted
+FEC_TIMEOUT = 2 # seconds without parity before the depth no longer has to cover a parity group
+
+class JitterBuffer:
+    """Per-peer playout buffer keyed by sequence number.
+
+    Frames are put in as they arrive, in any order, and pop() hands out
+    exactly one frame per playout tick in sequence order. Duplicates and
+    frames whose turn has passed are dropped. A missing frame is waited for
+    one tick at a time while the buffer is below target. The target depth follows the
+    interarrival jitter (RFC 3550 estimator): the buffer fills up to it
+    before playout starts or after an underrun, and drops a frame when it has
+    been running above it for a while. While the sender protects its stream
+    with parity (app.fec), the depth also covers a whole parity group, so a
+    lost frame is still waiting to be played when its parity arrives.
+    """
+    def __init__(self, frame_time:float, min_depth:int=MIN_DEPTH, max_depth:int=MAX_DEPTH, concealer:Concealer|None=None):
+        self.frame_time = frame_time
+        self.concealer = concealer # fills in lost frames and underruns, silence without one
+        self.min_depth = min_depth
+        self.max_depth = max_depth
+        self.lock = threading.Lock()
+        self.frames:dict[int, np.ndarray] = {}
+        self.next_seq:int|None = None # next sequence to play, None while (re)buffering
+        self.jitter = 0.0 # seconds
+        self.last_transit:float|None = None
+        self.above_target = 0
+        self.last_arrival = 0.0
+        self.fec_group = 0 # frames per parity group the sender uses, 0 without FEC
+        self.last_parity = 0.0
+        # Loss reports (RFC 3550 style), counted before FEC
+        self.base = 0
+        self.highest:int|None = None
+        self.arrived = 0
+        self.reported = (0, 0) # (expected, arrived) at the last report
+        # Stats
+        self.received = 0
+        self.late = 0
+        self.duplicates = 0
+        self.lost = 0 # sequences that never showed up in time
+        self.underruns = 0
+        self.shrunk = 0
+        self.concealed = 0 # frames synthesized by the concealer
+        self.recovered = 0 # frames rebuilt from parity in time to be played
+
+    @property
+    def target(self) -> int:
+        return min(max(math.ceil(JITTER_MULTIPLIER * self.jitter / self.frame_time) + 1, self.min_depth, self.fec_group), self.max_depth)
+
+    @property
+    def depth(self) -> int:
+        return len(self.frames)
+
+    def put(self, seq:int, timestamp:float|None, frame:np.ndarray, arrival:float, recovered:bool=False, marker:bool=False):
+        """`timestamp` is the sender's capture time and `arrival` ours, both in server time.
+
+        Frames rebuilt from parity are put with `recovered` and no timestamp,
+        they say nothing about the network. `marker` starts a talkspurt after
+        the sender paused: an empty buffer builds its cushion up again first.
+        Empty frames are ignored, there is nothing to play or conceal from.
+        """
+        if not len(frame):
+            return
+        with self.lock:
+            self.last_arrival = arrival
+            if marker and not self.frames:
+                self.next_seq = None
+                if self.concealer is not None:
+                    self.concealer.reset()
+            if self.fec_group and arrival - self.last_parity > FEC_TIMEOUT:
+                self.fec_group = 0
+            if not recovered:
+                self.received += 1
+                if self.highest is None or abs(seq - self.highest) > RESET_GAP:
+                    self.base = self.highest = seq
+                    self.arrived = 0
+                    self.reported = (0, 0)
+                elif seq > self.highest:
+                    self.highest = seq
+                self.arrived += 1
+            if timestamp is not None:
+                transit = arrival - timestamp
+                if self.last_transit is not None:
+                    self.jitter += (abs(transit - self.last_transit) - self.jitter) / 16
+                self.last_transit = transit
+
+            if self.next_seq is not None and abs(seq - self.next_seq) > RESET_GAP:
+                self.frames.clear()
+                self.next_seq = None
+            if self.next_seq is not None and seq < self.next_seq:
+                self.late += not recovered
+                return
+            if seq in self.frames:
+                self.duplicates += 1
+                return
+            self.frames[seq] = frame
+            if recovered:
+                self.recovered += 1
+            if len(self.frames) > self.max_depth * 2:
+                oldest = min(self.frames)
+                del self.frames[oldest]
+                if self.next_seq is not None:
+                    self.next_seq = oldest + 1
+                self.shrunk += 1
+
+    def protect(self, group:int, arrival:float):
+        """The sender sent parity over groups of `group` frames."""
+        with self.lock:
+            if group > self.fec_group and len(self.frames) < min(group, self.max_depth):
+                self.next_seq = None # Build up the deeper cushion now, not at the next underrun
+            self.fec_group = group
+            self.last_parity = arrival
+
+    def loss_fraction(self) -> float|None:
+        """Fraction of frames lost on the way since the last call (before FEC), None if nothing was expected."""
+        with self.lock:
+            if self.highest is None:
+                return None
+            expected = self.highest - self.base + 1
+            expected_interval = expected - self.reported[0]
+            arrived_interval = self.arrived - self.reported[1]
+            self.reported = (expected, self.arrived)
+            if expected_interval <= 0:
+                return None
+            return min(max(1 - arrived_interval / expected_interval, 0.0), 1.0)
+
+    def pop(self) -> np.ndarray|None:
+        """The frame for this playout tick, None for silence (buffering, or nothing left to conceal with)."""
+        with self.lock:
+            if self.next_seq is None:
+                if len(self.frames) < self.target:
+                    return self._conceal() # Fades out whatever played before the underrun
+                self.next_seq = min(self.frames)
+            if not self.frames:
+                self.underruns += 1
+                self.next_seq = None # Build the cushion up again
+                return self._conceal()
+            frame = self.frames.pop(self.next_seq, None)
+            if frame is None and len(self.frames) < self.target:
+                # Below target: wait a tick for it (late, or rebuilt from parity), which also grows the cushion back
+                return self._conceal()
+            if frame is None:
+                self.lost += 1
+                frame = self._conceal()
+            elif self.concealer is not None:
+                frame = self.concealer.received(frame)
+            self.next_seq += 1
+
+            if len(self.frames) > self.target:
+                self.above_target += 1
+                if self.above_target >= SHRINK_AFTER:
+                    self.frames.pop(self.next_seq, None)
+                    self.next_seq += 1
+                    self.above_target = 0
+                    self.shrunk += 1
+            else:
+                self.above_target = 0
+            return frame
+
+    def _conceal(self) -> np.ndarray|None:
+        if self.concealer is None:
+            return None
+        frame = self.concealer.conceal()
+        if frame is not None:
+            self.concealed += 1
+        return frame
+
+    def stats(self) -> dict:
+        return {
+            "depth": self.depth,
+            "target": self.target,
+            "jitter_ms": self.jitter * 1000,
+            "received": self.received,
+            "late": self.late,
+            "duplicates": self.duplicates,
+            "lost": self.lost,
+            "underruns": self.underruns,
+            "shrunk": self.shrunk,
+            "concealed": self.concealed,
+            "recovered": self.recovered,
+        }
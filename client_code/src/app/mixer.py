@@ -0,0 +1,74 @@
+import numpy as np
+
+LIMIT_KNEE = 24576 # samples above this are compressed smoothly instead of clipped (-2.5 dBFS)
+LIMIT_RANGE = 32767 - LIMIT_KNEE
+
+class Mixer:
+    """Mixes one frame per peer into int16 without allocating in the steady state.
+
+    Frames are copied into the rows of a preallocated (peers, samples)
+    float32 buffer. One matrix-vector product applies the per-peer gains
+    and sums the rows into a preallocated frame, and a soft limiter bends
+    peaks above LIMIT_KNEE towards full scale (tanh) instead of clipping
+    them flat. The buffers only grow when more peers talk at once than
+    ever before.
+    """
+    def __init__(self, frame:int, peers:int=8):
+        self.frame = frame
+        self.rows = np.zeros((peers, frame), dtype=np.float32)
+        self.gains = np.zeros(peers, dtype=np.float32)
+        self.count = 0 # rows filled this tick
+        self.sum = np.zeros(frame, dtype=np.float32)
+        self.magnitude = np.zeros(frame, dtype=np.float32)
+        self.excess = np.zeros(frame, dtype=np.float32)
+        self.out = np.zeros(frame, dtype=np.int16)
+        output = self.out.view()
+        output.flags.writeable = False
+        self.output = memoryview(output).cast("B") # what mix() hands out, bytes-like for the audio device
+
+    def add(self, frame:np.ndarray, gain:float=1.0):
+        """Queue one peer's frame for this tick. Shorter frames are padded with silence, longer ones cut."""
+        if self.count == len(self.rows):
+            self._grow()
+        if len(frame) == self.frame:
+            self.rows[self.count] = frame
+        else:
+            row = self.rows[self.count]
+            n = min(len(frame), self.frame)
+            row[:n] = frame[:n]
+            row[n:] = 0
+        self.gains[self.count] = gain
+        self.count += 1
+
+    def mix(self) -> memoryview|None:
+        """The mix of the frames added since the last call, None if there were none.
+
+        The result is a view of the mixer's own buffer, valid until the next call.
+        """
+        count, self.count = self.count, 0
+        if not count:
+            return None
+        np.dot(self.gains[:count], self.rows[:count], out=self.sum)
+        if self.sum.max() > LIMIT_KNEE or self.sum.min() < -LIMIT_KNEE:
+            self._limit()
+        np.copyto(self.out, self.sum, casting="unsafe")
+        return self.output
+
+    def _limit(self):
+        # |x| above the knee becomes knee + range * tanh(excess / range): smooth, and never past full scale
+        np.abs(self.sum, out=self.magnitude)
+        np.subtract(self.magnitude, LIMIT_KNEE, out=self.excess)
+        np.maximum(self.excess, 0, out=self.excess)
+        np.multiply(self.excess, 1 / LIMIT_RANGE, out=self.excess)
+        np.tanh(self.excess, out=self.excess)
+        np.minimum(self.magnitude, LIMIT_KNEE, out=self.magnitude)
+        np.multiply(self.excess, LIMIT_RANGE, out=self.excess)
+        np.add(self.magnitude, self.excess, out=self.magnitude)
+        np.copysign(self.magnitude, self.sum, out=self.sum)
+
+    def _grow(self):
+        rows = np.zeros((len(self.rows) * 2, self.frame), dtype=np.float32)
+        rows[:len(self.rows)] = self.rows
+        gains = np.zeros(len(rows), dtype=np.float32)
+        gains[:len(self.gains)] = self.gains
+        self.rows, self.gains = rows, gains
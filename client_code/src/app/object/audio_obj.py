@@ -1,25 +1,67 @@
 # Audio init
+import math
 import pyaudio
+import numpy as np
+
+from app.ring_buffer import RingBuffer
+from app.resample import Resampler
+
+# PortAudio runs in callback mode and moves audio in blocks this small, so the device adds little latency;
+# the ring buffers collect blocks into frames for the network threads and the other way round.
+BLOCK = 512 # samples per device callback, at most; half a frame for short frames
+INPUT_FRAMES = 4 # frames of capture the ring holds if the sender falls behind
+OUTPUT_SLACK = 2 # blocks of room above one frame in the playback ring, all of the output buffering
+
+def device_rate(audio:pyaudio.PyAudio, rate:int, input:bool) -> int:
+    """`rate` if the default device takes it, else the device's own rate, which we resample from or to."""
+    info = audio.get_default_input_device_info() if input else audio.get_default_output_device_info()
+    try:
+        if input:
+            audio.is_format_supported(rate, input_device=info["index"], input_channels=1, input_format=pyaudio.paInt16)
+        else:
+            audio.is_format_supported(rate, output_device=info["index"], output_channels=1, output_format=pyaudio.paInt16)
+        return rate
+    except ValueError:
+        return int(info["defaultSampleRate"])
 
 class AudioIn:
-    def __init__(self, chunk=2048):
+    def __init__(self, chunk=2048, rate=44100):
         self.chunk = chunk
+        self.rate = rate # what get() returns
         self.__sample_format = pyaudio.paInt16
         self.channels = 1
-        self.fs = 44100
         self.__pyaudio = pyaudio.PyAudio()
+        self.fs = device_rate(self.__pyaudio, rate, input=True) # what the device captures at
+        self.resampler = Resampler(self.fs, rate) if self.fs != rate else None
+        device_chunk = math.ceil(chunk * self.fs / rate) # the resampler may need a sample more or less now and then
+        self.block_size = min(BLOCK, device_chunk // 2)
+        self.ring = RingBuffer((device_chunk + 1) * INPUT_FRAMES)
+        self.frame = np.zeros(chunk, dtype=np.int16)
+        self.captured = np.zeros(device_chunk * 2, dtype=np.int16) # device samples for one frame, before resampling
+        self.overflows = 0 # blocks (partly) dropped because the ring was full
 
     def __enter__(self):
-        self.__audio = self.__pyaudio.open(format=self.__sample_format, channels=self.channels, rate=self.fs, frames_per_buffer=self.chunk, input=True)
+        self.__audio = self.__pyaudio.open(format=self.__sample_format, channels=self.channels, rate=self.fs, frames_per_buffer=self.block_size, input=True, stream_callback=self.__callback)
         return self
 
-    def get(self) -> bytes | None:
-        try:
-            sound = self.__audio.read(self.chunk)
-            return sound
-        except IOError:
-            sound = b''
-            return sound
+    def __callback(self, in_data, frame_count, time_info, status):
+        samples = np.frombuffer(in_data, dtype=np.int16)
+        if self.ring.write(samples) < len(samples):
+            self.overflows += 1
+        return (None, pyaudio.paContinue)
+
+    def get(self, timeout=0.5) -> np.ndarray | None:
+        """The next frame, None if none was captured within `timeout`. The array may be reused by the next call."""
+        if self.resampler is not None:
+            needed = self.resampler.needed(self.chunk)
+            if not self.ring.wait_readable(needed, timeout):
+                return None
+            n = self.ring.read_into(self.captured[:needed])
+            return self.resampler.process(self.captured[:n], self.chunk)
+        if not self.ring.wait_readable(self.chunk, timeout):
+            return None
+        self.ring.read_into(self.frame)
+        return self.frame
 
     def __exit__(self, type, value, traceback):
         if not self.__audio.is_stopped():
@@ -28,19 +70,45 @@ class AudioIn:
             self.__pyaudio.terminate()
 
 class AudioOut:
-    def __init__(self, chunk=2048):
+    def __init__(self, chunk=2048, rate=44100):
         self.chunk = chunk
+        self.rate = rate # what play() takes
         self.__sample_format = pyaudio.paInt16
         self.channels = 1
-        self.fs = 44100
         self.__pyaudio = pyaudio.PyAudio()
+        self.fs = device_rate(self.__pyaudio, rate, input=False) # what the device plays at
+        self.resampler = Resampler(rate, self.fs) if self.fs != rate else None
+        device_chunk = math.ceil(chunk * self.fs / rate)
+        self.block = np.zeros(min(BLOCK, device_chunk // 2), dtype=np.int16)
+        self.ring = RingBuffer(device_chunk + 1 + OUTPUT_SLACK * len(self.block))
+        block = self.block.view()
+        block.flags.writeable = False
+        self.__block_bytes = memoryview(block).cast("B")
+        self.underruns = 0 # callbacks that found less than a block and played silence for the rest
 
     def __enter__(self):
-        self.__audio = self.__pyaudio.open(format=self.__sample_format, channels=self.channels, rate=self.fs, frames_per_buffer=self.chunk, output=True)
+        self.__audio = self.__pyaudio.open(format=self.__sample_format, channels=self.channels, rate=self.fs, frames_per_buffer=len(self.block), output=True, stream_callback=self.__callback)
         return self
 
-    def play(self, sound):
-        self.__audio.write(sound)
+    def __callback(self, in_data, frame_count, time_info, status):
+        if frame_count > len(self.block):
+            out = np.zeros(frame_count, dtype=np.int16) # Only if the host ignores frames_per_buffer
+            self.ring.read_into(out)
+            return (out.tobytes(), pyaudio.paContinue)
+        out = self.block[:frame_count]
+        n = self.ring.read_into(out)
+        if n < frame_count:
+            out[n:] = 0
+            self.underruns += 1
+        return (self.__block_bytes[:frame_count * 2], pyaudio.paContinue)
+
+    def play(self, sound, timeout=1.0):
+        """Queues a frame, blocking until the ring has room for it, which paces the caller to the device."""
+        samples = np.frombuffer(sound, dtype=np.int16)
+        if self.resampler is not None:
+            samples = self.resampler.process(samples)
+        if self.ring.wait_writable(len(samples), timeout):
+            self.ring.write(samples)
 
     def __exit__(self, type, value, traceback):
         if not self.__audio.is_stopped():
@@ -1,10 +1,13 @@
 import time
+import queue
 import threading
 
 from app.fetch import Fetch
 from app.logger import setup_logger, INFO, DEBUG
 from app.object.socket_obj import UDPSocket
-from app.const import send_data, confirm_data
+from app.const import send_data, confirm_data, relay_bind_header, relay_bind_type, sfu_bind_header, sfu_bind_type
+from app.codec import preferences, offer
+from app.profile import profile
 
 from app.global_var import datas
 
@@ -16,123 +19,138 @@ class P2PManager:
         self.debug = config["debug"]
         self.p2p_retry_time = config["p2p_retry_time"]
         self.auto_lan = config["auto_lan"]
+        self.relay_after = config.get("relay_after", 5) # seconds of failed punching before asking for a relay, 0 disables it
+        self.member_resync = config.get("member_resync", 30) # seconds between HTTP checks for notifications that never came, 0 disables it
         self.socket = socket
         self.stop_event = stop_event
         self.server = Fetch(config, self.socket)
         self.run = True
+        self.channel_id = None
+        rate, frame = profile(config)
+        self.codec_offer = offer(preferences(config, rate, frame), rate)
 
         log_level = INFO if not config["debug"] else DEBUG
         self.log = setup_logger(__name__, log_level)
 
     def update_member(self, channel_id:int):
+        self.channel_id = channel_id
         for member in self.server.channel_user_list(channel_id):
             if member["name"] == self.username:
                 self_ip = member["ip"]
                 self.log.debug(f"Self IP: {self_ip}")
                 break
 
-        while not self.stop_event.is_set():
-            data = self.server.channel_user_list(channel_id)
+        # Take one snapshot over HTTP, after that the server pushes every change over UDP
+        data = None
+        while data is None and not self.stop_event.is_set():
+            data = self.server.member_updates(channel_id, 0, timeout=0)
             if data is None:
                 self.log.error("Failed to fetch channel user list")
                 time.sleep(2)
-                continue
+        if data is None:
+            return
+        since = self.apply_updates(data, self_ip)
+        next_resync = time.monotonic() + self.member_resync
 
-            members = data.copy()
-            if members == datas.local_channel_member_list:
-                time.sleep(2)
+        while not self.stop_event.is_set():
+            self.update_sfu()
+            if self.member_resync and time.monotonic() >= next_resync:
+                # A gap is only noticed when a later notification comes, so the last ones
+                # of a quiet channel could go missing for good; ask the server now and then
+                next_resync = time.monotonic() + self.member_resync
+                data = self.server.member_updates(channel_id, since, timeout=0)
+                if data is not None and data["version"] > since:
+                    self.log.debug(f"Missed notifications up to {data['version']}, resynced")
+                    since = self.apply_updates(data, self_ip)
+            try:
+                event = datas.member_events.get(timeout=1)
+            except queue.Empty:
+                continue
+            if event["version"] <= since:
+                continue # Retransmitted or already in the snapshot
+            if event["version"] > since + 1:
+                # A notification went missing, catch up over HTTP
+                self.log.debug(f"Membership gap {since} -> {event['version']}, resyncing")
+                data = self.server.member_updates(channel_id, since, timeout=0)
+                if data is not None:
+                    since = self.apply_updates(data, self_ip)
                 continue
-            else:
-                # 成員增加
-                if len(members) > len(datas.local_channel_member_list):
-                    for member in members:
-                        if member not in datas.local_channel_member_list:
-
-                            self.log.info(f"New member: {member['name']}")
-
-                            # Check if the member is in the same LAN
-                            found = False
-                            if self.server.is_same_lan(member["ip"], self_ip) and (member["name"] != self.username) and self.auto_lan: # Disable Lan Feature
-                                self.log.info(f"Same LAN: {member['name']} ({member['ip']}:{member['port']})")
-                                resp = self.server.lan_ip(self_ip, channel_id)
-                                if resp.status_code != 200:
-                                    if resp.status_code == 500:
-                                        self.log.error("Server error")
-                                        time.sleep(2)
-                                        continue
-                                    self.log.error(f"Error sending LAN IP: {resp.status_code} {resp.json()}")
-                                    continue
-
-                                # Check if the member in the same LAN already POST their IP
-                                for lan_member in resp.json():
-                                    if lan_member["name"] == member["name"]:
-                                        self.log.info(f"New member: {lan_member['name']} ({lan_member['lan_ip']}:{lan_member['port']})")
-                                        member_info = {
-                                            "name": lan_member["name"],
-                                            "ip": lan_member["lan_ip"],
-                                            "port": lan_member["port"]
-                                        }
-                                        datas.local_channel_member_list.append(member_info)
-                                        self.socket.send(send_data, (lan_member["lan_ip"], lan_member["port"]))
-                                        new_p2p_thread = threading.Thread(target=self.start_p2p, args=(member_info,))
-                                        new_p2p_thread.start()
-                                        found = True
-
-                                # Wait for the member to POST their IP
-                                count = 0
-                                while not found:
-                                    count += 1
-                                    resp2 = self.server.lan_ip(self_ip, channel_id)
-                                    if resp2.json() == resp.json():
-                                        self.log.info("Waiting for LAN IP...")
-                                        pass
-                                    else:
-                                        self.log.info("LAN IP found")
-                                        for lan_member in resp2.json():
-                                            if lan_member["name"] == member["name"]:
-                                                self.log.info(f"New member: {lan_member['name']} ({lan_member['lan_ip']}:{lan_member['port']})")
-                                                member_info = {
-                                                    "name": lan_member["name"],
-                                                    "ip": lan_member["lan_ip"],
-                                                    "port": lan_member["port"]
-                                                }
-                                                datas.local_channel_member_list.append(member_info)
-                                                self.socket.send(send_data, (lan_member["lan_ip"], lan_member["port"]))
-                                                new_p2p_thread = threading.Thread(target=self.start_p2p, args=(member_info,))
-                                                new_p2p_thread.start()
-                                                found = True
-                                    if found:
-                                        break
-                                    if count > 10:
-                                        self.log.error("LAN IP not found")
-                                        break
-                                    time.sleep(1)
-                            if not found:
-                                datas.local_channel_member_list.append(member)
-                                if member["name"] == self.username:
-                                    continue
-
-                                self.socket.send(send_data, (member["ip"], member["port"]))
-                                new_p2p_thread = threading.Thread(target=self.start_p2p, args=(member,))
-                                new_p2p_thread.start()
-                    self.log.debug(f"Updated member list: {datas.local_channel_member_list}")
-                # 成員減少
-                elif len(members) < len(datas.local_channel_member_list):
-                    for member in datas.local_channel_member_list.copy():
-                        if member not in members:
-                            if member["name"] == self.username:
-                                self.stop_event.set()
-                                continue
-                            datas.local_channel_member_list.remove(member)
-                            for conn in datas.connecting_list:
-                                if conn["ip"] == member["ip"] and conn["port"] == member["port"]:
-                                    datas.connecting_list.remove(conn)
-                                    self.log.info(f"Removed connection to {member['name']}")
-                    self.log.debug(f"Updated member list: {datas.local_channel_member_list}")
-                # 成員不變
-                else:
-                    pass # 之後再說 幹
+            self.apply_event(event, self_ip)
+            since = event["version"]
+            self.log.debug(f"Updated member list: {datas.local_channel_member_list}")
+
+    def update_sfu(self):
+        """Switch between full mesh and the server's SFU as the channel crosses sfu_threshold members."""
+        threshold = self.server.sfu_threshold
+        if not threshold:
+            return
+        if len(datas.local_channel_member_list) < threshold:
+            if datas.sfu_active:
+                self.log.info("Channel is small again, sending to every peer directly")
+                datas.sfu_active = False
+            return
+        if datas.sfu is None:
+            self.server.request_sfu(self.channel_id)
+            return
+        # Also keeps our NAT mapping to the SFU open
+        self.socket.send(sfu_bind_header.pack(sfu_bind_type, datas.sfu["token"]), datas.sfu["addr"])
+        if not datas.sfu_active:
+            self.log.info(f"{len(datas.local_channel_member_list)} members, sending through the SFU")
+            datas.sfu_active = True
+
+    def apply_updates(self, data:dict, self_ip:str) -> int:
+        if data["reset"]:
+            self.sync_members(data["members"], self_ip)
+        else:
+            for event in data["events"]:
+                self.apply_event(event, self_ip)
+        self.log.debug(f"Updated member list: {datas.local_channel_member_list}")
+        return data["version"]
+
+    def apply_event(self, event:dict, self_ip:str):
+        if event["type"] == "join":
+            self.add_member(event["member"], self_ip)
+        elif event["type"] == "leave":
+            self.remove_member(event["member"])
+
+    def sync_members(self, members:list[dict], self_ip:str):
+        names = {member["name"] for member in members}
+        for member in datas.local_channel_member_list.copy():
+            if member["name"] not in names:
+                self.remove_member(member)
+        local_names = {member["name"] for member in datas.local_channel_member_list}
+        for member in members:
+            if member["name"] not in local_names:
+                self.add_member(member, self_ip)
+
+    def add_member(self, member:dict, self_ip:str):
+        self.log.info(f"New member: {member['name']}")
+        if member["name"] == self.username:
+            datas.local_channel_member_list.append(member)
+            return
 
+        # Same public IP means the same NAT, connect straight to the LAN candidate sent with their join
+        if self.auto_lan and member["ip"] == self_ip and member.get("lan_ip"):
+            self.log.info(f"Same LAN: {member['name']} ({member['lan_ip']}:{member['lan_port']})")
+            member = {"name": member["name"], "ip": member["lan_ip"], "port": member["lan_port"]}
+
+        datas.local_channel_member_list.append(member)
+        self.socket.send(send_data, (member["ip"], member["port"]))
+        new_p2p_thread = threading.Thread(target=self.start_p2p, args=(member,))
+        new_p2p_thread.start()
+
+    def remove_member(self, member:dict):
+        if member["name"] == self.username:
+            self.stop_event.set()
+            return
+        for local_member in datas.local_channel_member_list.copy():
+            if local_member["name"] != member["name"]:
+                continue
+            datas.local_channel_member_list.remove(local_member)
+            for conn in datas.connecting_list.copy():
+                if conn["ip"] == local_member["ip"] and conn["port"] == local_member["port"]:
+                    datas.connecting_list.remove(conn)
+                    self.log.info(f"Removed connection to {member['name']}")
 
     def start_p2p(self, member:dict):
         self.log.debug(f"Starting P2P connection to {member['name']} ({member['ip']}:{member['port']})")
@@ -143,12 +161,32 @@ class P2PManager:
             self.log.debug(f"Skipping P2P connection to self")
             return
 
+        relay_deadline = time.monotonic() + self.relay_after if self.relay_after else None
+        relay_bind = None
+        next_relay_request = 0
         while not self.stop_event.is_set():
             if member not in datas.local_channel_member_list:
                 self.log.info(f"Member {member['name']} left the channel")
                 self.log.debug(f"Stopping P2P connection to {member['name']} ({member['ip']}:{member['port']})")
                 break
 
+            # Punching did not get through in time, go through the server's relay instead
+            if relay_bind is None and relay_deadline is not None and time.monotonic() >= relay_deadline:
+                allocation = datas.relay_allocations.pop(member["name"], None)
+                if allocation is not None:
+                    location, token = allocation
+                    self.log.info(f"Could not reach {member['name']} directly, relaying through {location[0]}:{location[1]}")
+                    relayed = {"name": member["name"], "ip": location[0], "port": location[1]}
+                    if member in datas.local_channel_member_list:
+                        datas.local_channel_member_list[datas.local_channel_member_list.index(member)] = relayed
+                    member = relayed
+                    relay_bind = relay_bind_header.pack(relay_bind_type, token)
+                elif time.monotonic() >= next_relay_request:
+                    self.server.request_relay(self.channel_id, member["name"])
+                    next_relay_request = time.monotonic() + 1
+            if relay_bind is not None:
+                self.socket.send(relay_bind, location)
+
             # Check if NAT punch was detected by receive_audio thread
             if location in datas.get_send_data_list:
                 self.log.debug(f"{location} NAT punch successful (detected by receive_audio)")
@@ -162,6 +200,8 @@ class P2PManager:
                 datas.get_send_data_list.remove(location)
                 for i in range(10):
                     self.socket.send(confirm_data, location)
+                    if i % 3 == 0:
+                        self.socket.send(self.codec_offer, location)
                 return
 
             self.socket.send(send_data, location)
@@ -179,6 +219,8 @@ class P2PManager:
                         self.log.debug(f"Current connecting list: {datas.connecting_list}")
                     for i in range(10):
                         self.socket.send(confirm_data, location)
+                        if i % 3 == 0:
+                            self.socket.send(self.codec_offer, location)
                     return
             except OSError:
                 self.log.debug("Received wrong packet while P2P")
@@ -0,0 +1,94 @@
+import numpy as np
+
+MIN_PITCH = 60 # Hz
+MAX_PITCH = 400
+VOICED = 0.3 # normalized autocorrelation above this counts as voiced
+FADE_TIME = 0.1 # seconds of concealment before it has faded to silence
+CROSSFADE_TIME = 0.004 # seconds blended when real audio comes back
+
+class Concealer:
+    """Packet loss concealment for one peer: pitch-based waveform extension with a fade.
+
+    Every played frame goes through received(), which keeps the last
+    samples in a preallocated history. For a lost frame, conceal() finds the
+    pitch period of the history once per loss burst (autocorrelation through
+    one FFT) and keeps repeating the last period, fading to silence over
+    FADE_TIME. Unvoiced history is repeated whole instead, so noise does not
+    turn into a buzz. The first real frame after a burst is crossfaded with
+    the continued concealment, so there is no click either way.
+    """
+    def __init__(self, rate:int, frame:int):
+        self.rate = rate
+        self.frame = frame
+        self.min_lag = rate // MAX_PITCH
+        self.max_lag = rate // MIN_PITCH
+        self.history = np.zeros(max(frame, 2 * self.max_lag), dtype=np.float32)
+        self.fft_size = 1 << (2 * len(self.history) - 1).bit_length()
+        self.fade_samples = int(rate * FADE_TIME)
+        self.crossfade = min(int(rate * CROSSFADE_TIME), frame)
+        self.fade_in = np.linspace(0, 1, self.crossfade, endpoint=False, dtype=np.float32)
+        self.concealed = 0 # samples concealed in the current burst
+        self.period = 0
+        self.position = 0 # where in the repeated period the next sample comes from
+        self.primed = False # nothing to conceal with before the first real frame
+
+    def received(self, frame:np.ndarray) -> np.ndarray:
+        """Record a real frame, returns it (crossfaded if it ends a loss burst)."""
+        if not len(frame):
+            return frame
+        if self.concealed and len(frame) >= self.crossfade:
+            # Zero once the concealment has faded out, then this is a fade in from silence
+            tail = self._extend(self.crossfade, advance=False) * self._gain(self.crossfade)
+            frame = frame.astype(np.float32)
+            frame[:self.crossfade] = tail + (frame[:self.crossfade] - tail) * self.fade_in
+            frame = np.clip(frame, -32768, 32767).astype(np.int16)
+        self.concealed = 0
+        self.primed = True
+        self._remember(frame)
+        return frame
+
+    def reset(self):
+        """The stream paused (DTX), the old history must not be continued into the next talkspurt."""
+        self.concealed = 0
+        self.primed = False
+
+    def conceal(self) -> np.ndarray|None:
+        """A frame to play in place of a lost one, None once it has faded out."""
+        if not self.primed or self.concealed >= self.fade_samples:
+            return None
+        if not self.concealed:
+            self.period = self._pitch_period()
+            self.position = 0
+        samples = self._extend(self.frame) * self._gain(self.frame)
+        self.concealed += self.frame
+        return samples.astype(np.int16)
+
+    def _remember(self, frame:np.ndarray):
+        n = min(len(frame), len(self.history))
+        if not n:
+            return
+        self.history[:-n] = self.history[n:]
+        self.history[-n:] = frame[-n:]
+
+    def _pitch_period(self) -> int:
+        x = self.history
+        spectrum = np.fft.rfft(x, self.fft_size)
+        correlation = np.fft.irfft(spectrum.real ** 2 + spectrum.imag ** 2, self.fft_size)
+        if correlation[0] <= 0:
+            return len(x)
+        lags = correlation[self.min_lag:self.max_lag + 1] / np.arange(len(x) - self.min_lag, len(x) - self.max_lag - 1, -1)
+        best = int(np.argmax(lags))
+        if lags[best] / (correlation[0] / len(x)) < VOICED:
+            return len(x) # Unvoiced, repeat all of it
+        return best + self.min_lag
+
+    def _extend(self, count:int, advance:bool=True) -> np.ndarray:
+        # Continues the last period of the history from where the previous call stopped
+        indexes = (self.position + np.arange(count)) % self.period + (len(self.history) - self.period)
+        if advance:
+            self.position = (self.position + count) % self.period
+        return self.history[indexes]
+
+    def _gain(self, count:int) -> np.ndarray:
+        start = self.concealed
+        return np.clip(1 - (start + np.arange(count, dtype=np.float32)) / self.fade_samples, 0, 1)
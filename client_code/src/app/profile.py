@@ -0,0 +1,36 @@
+from app.logger import setup_logger
+from app.const import audio_rates
+
+log = setup_logger(__name__)
+
+# Audio profiles for config["audio_profile"]: name -> (sample rate, frame duration in ms).
+# Shorter frames cut the delay before a frame can be sent and played, but the headers cost more per second;
+# lower rates cut the bandwidth of the uncompressed codecs with the audio bandwidth. See bench.profile_bench.
+PROFILES = {
+    "low_latency": (16000, 10),
+    "balanced": (24000, 20),
+    "high_quality": (48000, 20),
+}
+LEGACY_RATE = 44100 # without a profile, as before: 44.1 kHz and config["audio_chunk"] samples per frame
+
+def profile(config) -> tuple[int, int]:
+    """(sample rate, samples per frame) we capture, send and play at."""
+    name = config.get("audio_profile")
+    if name is None:
+        return LEGACY_RATE, config["audio_chunk"]
+    if name not in PROFILES:
+        log.warning(f"Unknown audio profile {name}, pick one of {', '.join(PROFILES)}; using 44100 Hz and audio_chunk")
+        return LEGACY_RATE, config["audio_chunk"]
+    rate, frame_ms = PROFILES[name]
+    return rate, rate * frame_ms // 1000
+
+def stream_rate(rate:int, frame:int, peer_rate:int|None) -> int:
+    """The rate we send a peer at: the lower of ours and the one it plays at, as it offered.
+
+    Either way the frame keeps its duration, so the other rate has to fit a
+    whole number of samples in it, or we stay at our own.
+    """
+    if peer_rate is None or peer_rate not in audio_rates:
+        return rate
+    target = min(rate, peer_rate)
+    return target if frame * target % rate == 0 else rate
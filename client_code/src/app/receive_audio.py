@@ -1,6 +1,5 @@
 import time
-from collections import defaultdict, deque
-import struct
+import socket
 import sys
 import numpy as np
 import threading
@@ -8,66 +7,60 @@ import threading
 from app.logger import setup_logger, INFO, DEBUG
 from app.object.audio_obj import AudioOut
 from app.object.socket_obj import UDPSocket
-from app.fetch import Fetch
+from app.clock_sync import ClockSync
+from app.codec import CODECS, preferences, offer
+from app.jitter_buffer import JitterBuffer
+from app.fec import ParityDecoder, parity_group, smooth_loss
+from app.plc import Concealer
+from app.dtx import ComfortNoise
+from app.mixer import Mixer
+from app.profile import profile, LEGACY_RATE
+from app.resample import Reframer
 from app.const import *
 
 from app.global_var import datas
+
+PEER_TIMEOUT = 10 # seconds without audio before a peer's jitter buffer is dropped
+STATS_INTERVAL = 10 # seconds between jitter buffer stats in the debug log
+REPORT_INTERVAL = 1 # seconds between loss reports to each peer
+
 class ReceiveAudio:
-    def __init__(self, config, socket:UDPSocket, stop_event:threading.Event):
+    def __init__(self, config, socket:UDPSocket, stop_event:threading.Event, clock:ClockSync):
         self.config = config
         self.s = socket
-        self.chunk = config["audio_chunk"]
-        self.play_queue = deque(maxlen=10)
+        self.rate, self.chunk = profile(config)
+        self.frame_time = self.chunk / self.rate
+        self.silence = bytes(self.chunk * 2)
+        self.jitter_buffers:dict[tuple, JitterBuffer] = {} # peer -> buffer, filled here and drained by the playback loop
+        self.streams:dict[tuple, tuple[int, int]] = {} # peer -> (sample rate, samples per frame) it sends us
+        self.reframers:dict[tuple, Reframer] = {} # peer -> Reframer, for streams whose rate or frame size differ from ours
         self.peer_pings = {}
-        self.buffer_started = False
 
         self.stop_event = stop_event
 
         log_level = INFO if not config["debug"] else DEBUG
         self.log = setup_logger(__name__, log_level)
-        
-        t0 = time.time()
-        server_time = Fetch(config).get_time()
-        t1 = time.time()
-        rtt = t1 - t0
-        t_server = float(server_time)
-        self.time_offset = t_server + (rtt / 2) - t1
-
-    def mix_audio(self, audio_chunks: list[bytes]) -> bytes:
-        if not audio_chunks:
-            return b''
-
-        arrays = []
-        for chunk in audio_chunks:
-            # 確保 chunk 不是空的，而且大小是2的倍數
-            if not chunk or len(chunk) % 2 != 0:
-                continue
-            try:
-                arr = np.frombuffer(chunk, dtype=np.int16).astype(np.float32)
-                arrays.append(arr)
-            except ValueError:
-                self.log.exception(f"Error converting chunk to numpy array")
-                continue
-            
-        if not arrays:
-            return b''
-
-        # 保護：強制對齊成相同最小長度，防止 np.sum 出錯
-        min_len = min(len(arr) for arr in arrays)
-        arrays = [arr[:min_len] for arr in arrays]
-
-        mixed = np.sum(arrays, axis=0)
-        mixed = np.clip(mixed, -32768, 32767)  # 防止爆音
-
-        return mixed.astype(np.int16).tobytes()
 
-    def start(self):
-        buffer_window = 0.02  # seconds (adjust for latency/quality tradeoff)
-        peer_buffers = defaultdict(list)
+        self.clock = clock
+        self.preferences = preferences(config, self.rate, self.chunk)
+        self.decoders = {} # (peer, codec ID, rate, frame size) -> decoder, stateful codecs need one per stream
+        self.parity_decoders:dict[tuple, ParityDecoder] = {} # peer -> recent payloads to recover lost frames from
+        self.comfort_noise = ComfortNoise(self.rate, self.chunk)
+        self.mixer = Mixer(self.chunk)
+        self.volumes:dict[str, float] = config.get("volumes", {}) # username -> playback gain
+        self.gains:dict[tuple, float] = {} # peer -> playback gain, looked up when its first frame arrives
+        self.silent_peers:dict[tuple, tuple[float, np.ndarray]] = {} # peer -> (arrival, noise power) while it sends no audio (DTX)
+
+    def peer_gain(self, peer:tuple) -> float:
+        """Playback volume for a peer, from config["volumes"] by username. SFU streams have no name here."""
+        for member in datas.connecting_list:
+            if (member["ip"], member["port"]) == peer:
+                return float(self.volumes.get(member["name"], 1.0))
+        return 1.0
 
+    def start(self):
         try:
             self.log.debug("Start receiving data")
-            last_playback = time.time()
             last_ping_display = time.time()
             playback_thread = threading.Thread(target=self.audio_playback_loop, daemon=True)
             playback_thread.start()
@@ -75,7 +68,39 @@ class ReceiveAudio:
                 now = time.time()
 
                 data = self.s.get()
-                
+
+                # Audio first, it is nearly all of the traffic
+                if data.data and (data.data[0] == audio_magic or data.data[0] == sfu_media_type):
+                    self.handle_audio(data)
+                    if now - last_ping_display >= 0.5:
+                        self.display_ping()
+                        last_ping_display = now
+                    continue
+
+                if data.data and data.data[0] == notify_type:
+                    self.handle_notify(data)
+                    continue
+
+                if data.data and data.data[0] == time_reply_type:
+                    self.clock.handle_reply(data)
+                    continue
+
+                if data.data and data.data[0] == codec_offer_type:
+                    self.handle_codec_offer(data)
+                    continue
+
+                if data.data and data.data[0] == loss_report_type:
+                    self.handle_loss_report(data)
+                    continue
+
+                if data.data and data.data[0] == relay_allocated_type:
+                    self.handle_relay_allocated(data)
+                    continue
+
+                if data.data and data.data[0] == sfu_allocated_type:
+                    self.handle_sfu_allocated(data)
+                    continue
+
                 # Check if the data is valid
                 if data.data == send_data:
                     self.log.debug(f"Received NAT punch response from {data.addr}")
@@ -90,81 +115,234 @@ class ReceiveAudio:
                         datas.get_send_data_list.append(data.addr)
                     continue
                 
-                if data.data == b'':
-                    continue
+                if data.data:
+                    self.log.debug(f"Received unknown packet from {data.addr}")
 
-                if len(data.data) < 8:
-                    self.log.warning("Received data is too short")
-                    continue
-                
-                # Check if the sender is in connecting_list by ip and port
-                is_connected = any(c["ip"] == data.ip and c["port"] == data.port for c in datas.connecting_list)
-                if not is_connected:
-                    self.log.debug(f"Received data from unknown peer: {data.addr}")
-                    continue
+        except KeyboardInterrupt:
+            self.log.info("\nCtrl + C detected")
+        # except OSError:
+        #     pass
+        finally:
+            self.log.info("Audio receive stopped")
+            playback_thread.join()
 
-                # Get timestamp
-                timestamp_byte = data.data[:8]
-                timestamp = struct.unpack(">d", timestamp_byte)[0]
-                audio_data = data.data[8:]
+    def handle_audio(self, data):
+        packet = memoryview(data.data) # Slices share the datagram, the payload is never copied
+        peer = data.addr
+        if packet[0] == sfu_media_type:
+            if datas.sfu is None or data.addr != datas.sfu["addr"] or len(packet) < sfu_media_header.size:
+                return
+            # Forwarded by the SFU, the slot tells the speakers apart
+            _, slot = sfu_media_header.unpack_from(packet)
+            packet = packet[sfu_media_header.size:]
+            peer = (data.addr, slot)
+        elif not any(c["ip"] == data.ip and c["port"] == data.port for c in datas.connecting_list):
+            # Check if the sender is in connecting_list by ip and port
+            self.log.debug(f"Received data from unknown peer: {data.addr}")
+            return
 
-                # Save by peer address
-                peer_buffers[data.addr].append(audio_data)
+        if len(packet) < audio_header.size:
+            self.log.warning("Received data is too short")
+            return
+        magic, version_type, codec_id, seq, timestamp, frame_size, flags = audio_header.unpack_from(packet)
+        if magic != audio_magic or version_type >> 4 != audio_version:
+            self.log.debug(f"Dropped audio packet with unknown magic or version {version_type >> 4} from {peer}")
+            return
+        packet_type = version_type & 0x0F
+        arrival = data.timestamp + self.clock.offset(data.timestamp) # when it came off the socket, in server time
+        if packet_type == audio_type_comfort_noise:
+            # Silent, nothing to decode or mix until its next talkspurt
+            self.silent_peers[peer] = (arrival, ComfortNoise.power(packet[audio_header.size:]))
+            return
+        if packet_type != audio_type_frame and packet_type != audio_type_parity:
+            return
+        if flags >> audio_rate_shift >= len(audio_rates) or not frame_size:
+            return
+        rate = audio_rates[flags >> audio_rate_shift]
 
-                # 計算,顯示Ping
-                t_delta = (time.time() + self.time_offset) - timestamp
-                # self.peer_pings[data.addr] = t_delta
+        # The peer moved to another rate or frame size (its first frames go out before it has our offer)
+        if peer in self.streams and self.streams[peer] != (rate, frame_size):
+            self.log.debug(f"Stream from {peer} changed from {self.streams[peer]} to {(rate, frame_size)}")
+            self.drop_peer(peer)
 
-                sys.stdout.write("\r")
-                sys.stdout.write(f"Ping: {t_delta*1000:.2f} ms  ")
-                sys.stdout.flush()
+        decoder = self.decoders.get((peer, codec_id, rate, frame_size))
+        if decoder is None:
+            codec = CODECS.get(codec_id)
+            if codec is None or not codec.available(rate, frame_size):
+                self.log.debug(f"Received audio with unknown codec {codec_id} from {peer}")
+                return
+            decoder = self.decoders[(peer, codec_id, rate, frame_size)] = codec(rate, frame_size)
 
-                # if now - last_ping_display >= 0.5:
-                #     self.display_ping()
-                #     last_ping_display = now
+        # Save by peer address, the playback loop takes our frame's worth per peer per tick
+        buffer = self.jitter_buffers.get(peer)
+        if buffer is None:
+            buffer = self.jitter_buffers[peer] = JitterBuffer(frame_size / rate, concealer=Concealer(rate, frame_size))
+            self.streams[peer] = (rate, frame_size)
+            if (rate, frame_size) != (self.rate, self.chunk):
+                self.reframers[peer] = Reframer(rate, self.rate, frame_size, self.chunk)
+            self.gains[peer] = self.peer_gain(peer)
+        parity_decoder = self.parity_decoders.get(peer)
+        if parity_decoder is None:
+            parity_decoder = self.parity_decoders[peer] = ParityDecoder()
 
-                # Every 50ms (or so), mix and play
-                if now - last_playback >= buffer_window:
-                    chunks = [chunk for chunks in peer_buffers.values() for chunk in chunks]
-                    mixed = self.mix_audio(chunks)
+        payload = packet[audio_header.size:]
+        if packet_type == audio_type_parity:
+            # Rebuild the group's lost frame, if exactly one is missing
+            buffer.protect(parity_group(payload), arrival)
+            recovered = parity_decoder.recover(seq, payload)
+            if recovered is None:
+                return
+            seq, payload = recovered
+            pcm = self.decode(decoder, payload, peer)
+            if pcm is not None:
+                buffer.put(seq, None, pcm[:frame_size], arrival, recovered=True)
+            return
+        pcm = self.decode(decoder, payload, peer)
+        if pcm is None:
+            return
+        parity_decoder.received(seq, payload)
+        self.silent_peers.pop(peer, None)
+        buffer.put(seq, timestamp, pcm[:frame_size], arrival, marker=bool(flags & audio_flag_marker))
 
-                    if mixed:
-                        self.play_queue.append(mixed)
+        # 計算,顯示Ping (both ends stamp in server time, so this is the one-way latency)
+        self.peer_pings[peer] = arrival - timestamp
 
-                    peer_buffers.clear()
-                    last_playback = now
-                
-                if not self.buffer_started and len(self.play_queue) >= 3:
-                    self.buffer_started = True
+    def decode(self, decoder, payload, peer:tuple) -> np.ndarray|None:
+        """The frame in `payload`, None if it is not one (wrong size for the codec, or undecodable) and has to be dropped."""
+        if not decoder.valid(payload):
+            self.log.debug(f"Dropped malformed audio payload of {len(payload)} bytes from {peer}")
+            return None
+        try:
+            pcm = decoder.decode(payload)
+        except ValueError as e:
+            self.log.debug(f"Dropped audio payload from {peer}: {e}")
+            return None
+        return pcm if len(pcm) else None
 
-        except KeyboardInterrupt:
-            self.log.info("\nCtrl + C detected")
-        # except OSError:
-        #     pass
-        finally:
-            self.log.info("Audio receive stopped")
-            playback_thread.join()
+    def handle_notify(self, data):
+        if len(data.data) < notify_header.size:
+            return
+        _, seq, event, channel_id, version, ip, port, lan_ip, lan_port, name_length = notify_header.unpack_from(data.data)
+        self.s.send(notify_ack_header.pack(notify_ack_type, seq), data.addr)
+        if event not in notify_events:
+            return
+        name = data.data[notify_header.size:notify_header.size + name_length].decode('utf-8', errors='replace')
+        datas.member_events.put({
+            "type": notify_events[event],
+            "version": version,
+            "member": {"name": name, "ip": socket.inet_ntoa(ip), "port": port, "lan_ip": socket.inet_ntoa(lan_ip) if lan_port else None, "lan_port": lan_port or None}
+        })
+
+    def handle_codec_offer(self, data):
+        if len(data.data) < codec_offer_header.size:
+            return
+        _, count = codec_offer_header.unpack_from(data.data)
+        end = codec_offer_header.size + count
+        known = data.addr in datas.peer_codecs
+        datas.peer_codecs[data.addr] = data.data[codec_offer_header.size:end]
+        if len(data.data) >= end + codec_offer_rate.size:
+            datas.peer_rates[data.addr] = codec_offer_rate.unpack_from(data.data, end)[0]
+        else:
+            datas.peer_rates[data.addr] = LEGACY_RATE # From before audio profiles
+        if not known:
+            # Make sure they know what we can decode too
+            self.s.send(offer(self.preferences, self.rate), data.addr)
+
+    def handle_loss_report(self, data):
+        if len(data.data) < loss_report_header.size:
+            return
+        _, loss = loss_report_header.unpack_from(data.data)
+        datas.peer_loss[data.addr] = smooth_loss(datas.peer_loss.get(data.addr), loss / 255)
+
+    def send_loss_reports(self):
+        for peer, buffer in list(self.jitter_buffers.items()):
+            if isinstance(peer[0], tuple):
+                continue # Came through the SFU, there is no direct path back to the speaker
+            loss = buffer.loss_fraction()
+            if loss is not None:
+                self.s.send(loss_report_header.pack(loss_report_type, round(loss * 255)), peer)
+
+    def handle_relay_allocated(self, data):
+        if len(data.data) <= relay_allocated_header.size:
+            return
+        _, channel_id, port, token = relay_allocated_header.unpack_from(data.data)
+        peer = data.data[relay_allocated_header.size:].decode('utf-8', errors='replace')
+        datas.relay_allocations[peer] = ((data.ip, port), token)
+
+    def handle_sfu_allocated(self, data):
+        if len(data.data) < sfu_allocated_header.size:
+            return
+        _, channel_id, port, token = sfu_allocated_header.unpack_from(data.data)
+        datas.sfu = {"addr": (data.ip, port), "token": token}
 
     def display_ping(self):
+        if not self.peer_pings:
+            return
+        ping = max(self.peer_pings.values())
+        buffers = list(self.jitter_buffers.values())
+        depth = sum(buffer.depth for buffer in buffers) / len(buffers) if buffers else 0
+        late = sum(buffer.late for buffer in buffers)
+        underruns = sum(buffer.underruns for buffer in buffers)
         sys.stdout.write("\r")
-        for addr, ping in self.peer_pings.items():
-            sys.stdout.write(f"Ping {addr}: {ping*1000:.2f} ms  ")
+        sys.stdout.write(f"Ping: {ping*1000:.2f} ms  Buffer: {depth:.1f} frames  Late: {late}  Underruns: {underruns}  ")
         sys.stdout.flush()
         self.peer_pings.clear()
 
+    def log_buffer_stats(self):
+        for peer, buffer in list(self.jitter_buffers.items()):
+            stats = buffer.stats()
+            self.log.debug(f"Jitter buffer {peer}: depth {stats['depth']}/{stats['target']}, jitter {stats['jitter_ms']:.1f} ms, "
+                           f"late {stats['late']}, lost {stats['lost']}, recovered {stats['recovered']}, concealed {stats['concealed']}, underruns {stats['underruns']}, duplicates {stats['duplicates']}")
+
+    def drop_peer(self, peer:tuple):
+        self.jitter_buffers.pop(peer, None)
+        self.streams.pop(peer, None)
+        self.reframers.pop(peer, None)
+        self.silent_peers.pop(peer, None)
+        self.gains.pop(peer, None)
+        self.parity_decoders.pop(peer, None)
+        for key in [key for key in self.decoders if key[0] == peer]:
+            self.decoders.pop(key, None)
+
     def audio_playback_loop(self):
         try:
-            with AudioOut(self.chunk) as audio_out:
+            with AudioOut(self.chunk, self.rate) as audio_out:
                 self.log.debug("Audio playback started")
+                next_stats = time.monotonic() + STATS_INTERVAL
+                next_report = time.monotonic() + REPORT_INTERVAL
                 while not self.stop_event.is_set():
-                    if not self.play_queue:
-                        continue
+                    now = self.clock.server_time()
+                    for peer, buffer in list(self.jitter_buffers.items()):
+                        if peer in self.silent_peers and not buffer.depth:
+                            continue # DTX, covered by the comfort noise below
+                        reframer = self.reframers.get(peer)
+                        frame = buffer.pop() if reframer is None else reframer.next(buffer.pop)
+                        if frame is not None:
+                            self.mixer.add(frame, self.gains.get(peer, 1.0))
+                        elif now - buffer.last_arrival > PEER_TIMEOUT:
+                            # Gone quiet for good (left, or moved to another address)
+                            self.drop_peer(peer)
+
+                    # One frame of comfort noise for all silent peers together
+                    noise = None
+                    for peer, (arrival, power) in list(self.silent_peers.items()):
+                        if now - arrival > PEER_TIMEOUT:
+                            self.drop_peer(peer) # No descriptors either, it is gone
+                        else:
+                            noise = power if noise is None else noise + power
+                    if noise is not None:
+                        self.mixer.add(self.comfort_noise.generate(noise))
 
-                    sound = self.play_queue.popleft()
-                    audio_out.play(sound)
+                    # play() waits for room in the output ring, which paces the loop to one tick per frame played
+                    mixed = self.mixer.mix()
+                    audio_out.play(self.silence if mixed is None else mixed)
 
-                    # Optional: Add a small delay to prevent CPU overload
-                    time.sleep(0.001)
+                    if time.monotonic() >= next_report:
+                        self.send_loss_reports()
+                        next_report += REPORT_INTERVAL
+                    if time.monotonic() >= next_stats:
+                        self.log_buffer_stats()
+                        next_stats += STATS_INTERVAL
         except KeyboardInterrupt:
             self.log.info("\nCtrl + C detected")
         finally:
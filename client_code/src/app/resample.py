@@ -0,0 +1,78 @@
+import math
+import numpy as np
+
+from app.ring_buffer import RingBuffer
+
+HALF_TAPS = 16 # filter half-width in samples of the lower rate
+KAISER_BETA = 8.0 # about 80 dB of stopband
+CUTOFF = 0.9 # of the lower Nyquist frequency, so the transition band ends about where aliases would start
+
+class Resampler:
+    """Streaming polyphase windowed-sinc resampler between two fixed rates, for one stream.
+
+    The rates are reduced to a ratio up/down, and a Kaiser-windowed sinc
+    low-pass (cut off just below the lower Nyquist frequency) is tabulated once for
+    each of the `up` phases. A call gathers the input window of every output
+    sample in one fancy-indexing step and applies its phase's taps, so there
+    is no per-sample Python loop. The end of each call's input is kept for
+    the next, so frames join without clicks; the delay is half the filter.
+    """
+    def __init__(self, source:int, target:int):
+        self.source = source
+        self.target = target
+        g = math.gcd(source, target)
+        self.up = target // g
+        self.down = source // g
+        ratio = min(1.0, target / source)
+        cutoff = CUTOFF * ratio # of the source Nyquist frequency
+        self.half = math.ceil(HALF_TAPS / ratio)
+        offsets = (self.half - 1 - np.arange(2 * self.half))[None, :] + np.arange(self.up)[:, None] / self.up
+        window = np.i0(KAISER_BETA * np.sqrt(np.clip(1 - (offsets / self.half) ** 2, 0, None))) / np.i0(KAISER_BETA)
+        taps = cutoff * np.sinc(cutoff * offsets) * window
+        self.taps = (taps / taps.sum(axis=1, keepdims=True)).astype(np.float32)
+        self.kernel = np.arange(2 * self.half)
+        self.history = np.zeros(2 * self.half - 1, dtype=np.float32)
+        self.position = (self.half - 1) * self.up # next output's time in the history, in 1/up input samples
+
+    def needed(self, count:int) -> int:
+        """Input samples the next call needs to produce `count` outputs."""
+        last = (self.position + (count - 1) * self.down) // self.up
+        return max(last + self.half + 1 - len(self.history), 0)
+
+    def process(self, samples:np.ndarray, count:int|None=None) -> np.ndarray:
+        """Resamples the next piece of the stream, at most `count` outputs."""
+        buffer = np.concatenate((self.history, samples.astype(np.float32, copy=False)))
+        available = (((len(buffer) - self.half) * self.up - self.position) - 1) // self.down + 1
+        outputs = max(0, available if count is None else min(count, available))
+        positions = self.position + np.arange(outputs) * self.down
+        starts = positions // self.up - self.half + 1
+        out = np.einsum("nk,nk->n", buffer[starts[:, None] + self.kernel], self.taps[positions % self.up])
+        # Keep from the first sample the next output needs
+        position = self.position + outputs * self.down
+        keep = min(position // self.up - self.half + 1, len(buffer))
+        self.history = buffer[keep:]
+        self.position = position - keep * self.up
+        return np.clip(np.rint(out), -32768, 32767).astype(np.int16)
+
+class Reframer:
+    """Plays one peer's stream, at its own rate and frame size, as frames of ours.
+
+    The peer's frames are resampled in order and queued in a small ring, and
+    every call takes as many of them from the jitter buffer as it needs to
+    fill one of our frames; a peer with longer frames is asked every other
+    call or so, one with shorter frames several times per call.
+    """
+    def __init__(self, source:int, target:int, source_frame:int, frame:int):
+        self.resampler = Resampler(source, target) if source != target else None
+        self.ring = RingBuffer(frame + math.ceil(source_frame * target / source) + 1)
+        self.out = np.zeros(frame, dtype=np.int16)
+
+    def next(self, pop) -> np.ndarray|None:
+        """Our next frame, pulling the peer's frames from pop() as needed. Short if pop() runs dry, None if nothing was left."""
+        while self.ring.available < len(self.out):
+            frame = pop()
+            if frame is None:
+                break
+            self.ring.write(frame if self.resampler is None else self.resampler.process(frame))
+        n = self.ring.read_into(self.out)
+        return self.out[:n] if n else None
@@ -0,0 +1,65 @@
+import threading
+import numpy as np
+
+class RingBuffer:
+    """Fixed-size ring of int16 samples between one producer and one consumer thread.
+
+    The samples live in one preallocated array. Each side only moves its own
+    counter (total samples written / read), so the data path needs no lock;
+    the events only wake a side that waits for samples or for room.
+    """
+    def __init__(self, capacity:int):
+        self.capacity = capacity
+        self.data = np.zeros(capacity, dtype=np.int16)
+        self.written = 0 # moved by the producer only
+        self.read = 0 # moved by the consumer only
+        self.readable = threading.Event()
+        self.writable = threading.Event()
+
+    @property
+    def available(self) -> int:
+        return self.written - self.read
+
+    @property
+    def space(self) -> int:
+        return self.capacity - (self.written - self.read)
+
+    def write(self, samples:np.ndarray) -> int:
+        """Copies in as many samples as fit, returns how many."""
+        n = min(len(samples), self.space)
+        start = self.written % self.capacity
+        first = min(n, self.capacity - start)
+        self.data[start:start + first] = samples[:first]
+        self.data[:n - first] = samples[first:n]
+        self.written += n
+        self.readable.set()
+        return n
+
+    def read_into(self, out:np.ndarray) -> int:
+        """Copies up to len(out) samples into `out`, returns how many."""
+        n = min(len(out), self.available)
+        start = self.read % self.capacity
+        first = min(n, self.capacity - start)
+        out[:first] = self.data[start:start + first]
+        out[first:n] = self.data[:n - first]
+        self.read += n
+        self.writable.set()
+        return n
+
+    def wait_readable(self, count:int, timeout:float) -> bool:
+        """Blocks until `count` samples can be read, False on timeout."""
+        return self._wait(self.readable, lambda: self.available >= count, timeout)
+
+    def wait_writable(self, count:int, timeout:float) -> bool:
+        """Blocks until there is room for `count` samples, False on timeout."""
+        return self._wait(self.writable, lambda: self.space >= count, timeout)
+
+    @staticmethod
+    def _wait(event:threading.Event, ready, timeout:float) -> bool:
+        while not ready():
+            event.clear()
+            if ready(): # The other side may have moved between the check and the clear
+                break
+            if not event.wait(timeout):
+                return ready()
+        return True
@@ -1,12 +1,15 @@
-import time
-import struct
 import numpy as np
 import threading
-from collections import deque
 
-from app.logger import setup_logger, INFO, DEBUG
+from app.logger import setup_logger
 from app.object.audio_obj import AudioIn
 from app.object.socket_obj import UDPSocket
+from app.clock_sync import ClockSync
+from app.codec import CODECS, preferences, choose
+from app.fec import ParityEncoder, group_size
+from app.dtx import VoiceDetector, NoiseDescriber, CN_INTERVAL
+from app.profile import profile, stream_rate
+from app.resample import Resampler
 from app.const import *
 
 from app.global_var import datas
@@ -14,51 +17,127 @@ from app.global_var import datas
 log = setup_logger(__name__)
 
 class SendAudio:
-    def __init__(self, config, socket:UDPSocket, stop_event:threading.Event):
+    def __init__(self, config, socket:UDPSocket, stop_event:threading.Event, clock:ClockSync):
         self.config = config
         self.username = config["username"]
         self.s = socket
-        self.chunk = config["audio_chunk"]
+        self.rate, self.chunk = profile(config)
+        self.frame_time = self.chunk / self.rate
         self.stop_event = stop_event
-        self.audio_queue = deque(maxlen=50)
+        self.clock = clock
+        self.preferences = preferences(config, self.rate, self.chunk)
+        # The SFU sends our stream to everyone, so it gets the best codec every client has
+        self.sfu_codec = next(codec_id for codec_id in self.preferences if CODECS[codec_id].builtin)
+        self.streams = {} # stream rate -> (samples per frame, codec preferences, Resampler from our rate or None)
+        self.encoders = {} # (codec ID, stream rate) -> encoder
+        self.parity_encoders = {} # (codec ID, stream rate, group size) -> ParityEncoder, one per FEC level in use
+        self.seq = 0 # one per frame sent, receivers order and dedup by it
+        # DTX: silent frames are not sent, only a comfort noise descriptor now and then
+        self.vad = VoiceDetector(self.rate, self.chunk) if config.get("dtx", True) else None
+        self.noise = NoiseDescriber(self.rate, self.chunk)
+        self.next_noise = 0.0 # when the next descriptor is due, 0 sends one on the first silent frame
+        self.talking = False
+
+    def stream(self, rate:int) -> tuple[int, list[int], Resampler|None]:
+        """How we send at `rate`: the frame keeps its duration, the codecs are the ones that work at that rate and size."""
+        stream = self.streams.get(rate)
+        if stream is None:
+            frame = self.chunk * rate // self.rate
+            stream = self.streams[rate] = (frame, preferences(self.config, rate, frame), Resampler(self.rate, rate) if rate != self.rate else None)
+        return stream
+
+    def packet(self, codec_id:int, rate:int, timestamp:float, pcm:np.ndarray, packets:dict, flags:int=0) -> bytes:
+        key = (codec_id, rate)
+        packet = packets.get(key)
+        if packet is None:
+            encoder = self.encoders.get(key)
+            if encoder is None:
+                encoder = self.encoders[key] = CODECS[codec_id](rate, len(pcm))
+            flags |= audio_rates.index(rate) << audio_rate_shift
+            header = audio_header.pack(audio_magic, audio_version << 4 | audio_type_frame, codec_id, self.seq, timestamp, len(pcm), flags)
+            packet = packets[key] = header + encoder.encode(pcm)
+        return packet
+
+    def parity_packet(self, codec_id:int, rate:int, size:int, timestamp:float, packet:bytes, parities:dict) -> bytes|None:
+        """Feeds this frame to the parity group of `size` frames, returns the parity packet when the group is complete."""
+        key = (codec_id, rate, size)
+        if key not in parities:
+            encoder = self.parity_encoders.get(key)
+            if encoder is None:
+                encoder = self.parity_encoders[key] = ParityEncoder(size)
+            group = encoder.add(self.seq, memoryview(packet)[audio_header.size:])
+            parities[key] = None
+            if group is not None:
+                first, parity = group
+                header = audio_header.pack(audio_magic, audio_version << 4 | audio_type_parity, codec_id, first, timestamp, self.stream(rate)[0],
+                                           audio_rates.index(rate) << audio_rate_shift)
+                parities[key] = header + parity
+        return parities[key]
+
+    def send_comfort_noise(self, timestamp:float, samples:int):
+        flags = audio_rates.index(self.rate) << audio_rate_shift
+        packet = audio_header.pack(audio_magic, audio_version << 4 | audio_type_comfort_noise, 0, self.seq, timestamp, samples, flags) + self.noise.descriptor()
+        self.next_noise = timestamp + CN_INTERVAL
+        if datas.sfu_active:
+            self.s.send(packet, datas.sfu["addr"])
+            return
+        for member in datas.connecting_list:
+            if member["name"] != self.username:
+                self.s.send(packet, (member["ip"], member["port"]))
 
-    def audio_get_loop(self):
-        try:
-            log.debug("Start audio input loop")
-            with AudioIn(self.chunk) as input_audio:
-                while not self.stop_event.is_set():
-                    audio = input_audio.get()
-                    if audio:
-                        self.audio_queue.append(audio)
-                    else:
-                        log.debug("No audio data received")
-        except KeyboardInterrupt:
-            log.info("\nCtrl + C detected")
-        finally:
-            log.info("Stopped audio input loop")
-    
     def start(self):
         try:
             log.debug("Start sending data")
-            audioin_thread = threading.Thread(target=self.audio_get_loop, daemon=True)
-            audioin_thread.start()
-            while not self.stop_event.is_set():
-                try:
-                    audio = self.audio_queue.popleft()
-                except IndexError:
-                    continue
-                # Add timestamop
-                timestamp = time.time()
-                timestamp_bytes = struct.pack(">d", timestamp)
-                data = timestamp_bytes + audio
-                for member in datas.connecting_list:
-                    if member["name"] == self.username:
+            with AudioIn(self.chunk, self.rate) as input_audio:
+                while not self.stop_event.is_set():
+                    # Blocks until the capture callback has filled a frame
+                    pcm = input_audio.get()
+                    if pcm is None:
+                        log.debug("No audio data received")
                         continue
-                    audio_out_target_location = (member["ip"], member["port"])
-                    self.s.send(data, audio_out_target_location)
-
+                    self.send_frame(pcm)
         except KeyboardInterrupt:
             log.info("\nCtrl + C detected")
         finally:
             log.info("Stopped sending audio")
-            audioin_thread.join()
\ No newline at end of file
+
+    def send_frame(self, pcm:np.ndarray):
+        # Add timestamp, in server time so receivers can measure the one-way latency
+        timestamp = self.clock.server_time()
+        if self.vad is not None and not self.vad(pcm):
+            self.noise.add(pcm)
+            if timestamp >= self.next_noise:
+                self.send_comfort_noise(timestamp, len(pcm))
+            self.talking = False
+            return
+        # The first frame of a talkspurt is marked, receivers rebuild their cushion on it
+        flags = 0 if self.talking else audio_flag_marker
+        self.talking = True
+        self.next_noise = 0.0
+        self.seq = (self.seq + 1) & 0xFFFFFFFF
+        packets = {} # (codec ID, stream rate) -> packet, so each codec in use encodes the frame only once
+        parities = {} # (codec ID, stream rate, group size) -> parity packet or None, likewise
+        if datas.sfu_active:
+            # One upload, the SFU fans it out
+            self.s.send(self.packet(self.sfu_codec, self.rate, timestamp, pcm, packets, flags), datas.sfu["addr"])
+            return
+        resampled = {self.rate: pcm} # stream rate -> this frame at that rate
+        for member in datas.connecting_list:
+            if member["name"] == self.username:
+                continue
+            audio_out_target_location = (member["ip"], member["port"])
+            # No higher rate than the peer plays at
+            rate = stream_rate(self.rate, self.chunk, datas.peer_rates.get(audio_out_target_location))
+            frame, stream_preferences, resampler = self.stream(rate)
+            stream_pcm = resampled.get(rate)
+            if stream_pcm is None:
+                stream_pcm = resampled[rate] = resampler.process(pcm, frame)
+            codec_id = choose(stream_preferences, datas.peer_codecs.get(audio_out_target_location, b""))
+            packet = self.packet(codec_id, rate, timestamp, stream_pcm, packets, flags)
+            self.s.send(packet, audio_out_target_location)
+            # Parity as strong as the loss the peer reports
+            size = group_size(datas.peer_loss.get(audio_out_target_location, 0.0), self.frame_time)
+            if size:
+                parity = self.parity_packet(codec_id, rate, size, timestamp, packet, parities)
+                if parity is not None:
+                    self.s.send(parity, audio_out_target_location)
@@ -0,0 +1,60 @@
+"""Codec encode/decode throughput, bandwidth per peer and quality, on synthetic speech-like audio.
+
+Bandwidth counts the audio header and the IPv4 + UDP headers, per peer and direction;
+in a full mesh every client sends that to each of the other members.
+
+Run from client_code/src: python -m bench.codec_bench --rate 44100 --frame 2048 --frames 200
+"""
+import time
+import argparse
+import numpy as np
+
+from app.codec import CODECS
+from app.const import audio_header
+
+IP_UDP_HEADERS = 28
+
+def speech_like(rate:int, samples:int, seed:int=1) -> np.ndarray:
+    """Harmonics of a wandering pitch under a syllable-rate envelope, plus a little noise."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(samples) / rate
+    pitch = 140 + 30 * np.sin(2 * np.pi * 0.7 * t)
+    phase = 2 * np.pi * np.cumsum(pitch) / rate
+    voice = sum(np.sin(k * phase) / k for k in range(1, 12))
+    envelope = np.clip(np.sin(2 * np.pi * 3 * t), 0, None) ** 2
+    signal = 9000 * envelope * voice / 2 + rng.normal(0, 150, samples)
+    return np.clip(signal, -32768, 32767).astype(np.int16)
+
+def run(rate:int, frame:int, frames:int):
+    audio = speech_like(rate, frame * frames).reshape(frames, frame)
+    frame_time = frame / rate
+    print(f"{rate} Hz, {frame} samples per frame ({frame_time * 1000:.1f} ms), {frames} frames")
+    print(f"{'codec':<6} {'encode us':>10} {'decode us':>10} {'x realtime':>11} {'payload B':>10} {'kbit/s/peer':>12} {'SNR dB':>7}")
+    for codec in CODECS.values():
+        if not codec.available(rate, frame):
+            print(f"{codec.name:<6} not available at this rate / frame size" + ("" if codec.builtin else " or not installed"))
+            continue
+        encoder, decoder = codec(rate, frame), codec(rate, frame)
+        start = time.perf_counter()
+        payloads = [encoder.encode(pcm) for pcm in audio]
+        encode_time = (time.perf_counter() - start) / frames
+        start = time.perf_counter()
+        decoded = [decoder.decode(payload) for payload in payloads]
+        decode_time = (time.perf_counter() - start) / frames
+
+        size = sum(len(payload) for payload in payloads) / frames
+        kbits = (size + audio_header.size + IP_UDP_HEADERS) * 8 / frame_time / 1000
+        reference = audio.astype(np.float64)
+        error = reference - np.array(decoded, dtype=np.float64)
+        snr = 10 * np.log10(np.sum(reference ** 2) / np.sum(error ** 2)) if error.any() else float("inf")
+        realtime = frame_time / (encode_time + decode_time)
+        print(f"{codec.name:<6} {encode_time * 1e6:>10.1f} {decode_time * 1e6:>10.1f} {realtime:>11.0f} {size:>10.0f} {kbits:>12.1f} {snr:>7.1f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rate", type=int, default=44100)
+    parser.add_argument("--frame", type=int, default=2048, help="samples per frame")
+    parser.add_argument("--frames", type=int, default=200)
+    args = parser.parse_args()
+
+    run(args.rate, args.frame, args.frames)
@@ -0,0 +1,135 @@
+"""Voice activity detection and DTX: packets per second and receive CPU, with and without DTX.
+
+Every peer of a synthetic meeting alternates talkspurts (speech-like audio)
+and pauses (background noise), talking for --activity of the time. Each
+peer's stream goes through the real VoiceDetector; the send side prints the
+packets and bandwidth left, and how much real speech was cut (clipping).
+The receive side then runs every peer's packets through decoding and the
+JitterBuffer and mixes one frame per tick, the way ReceiveAudio does: all
+frames without DTX, only talkspurts plus one shared comfort noise frame with it.
+
+Run from client_code/src: python -m bench.dtx_bench --peers 10 --activity 0.15 --seconds 60
+"""
+import time
+import argparse
+import numpy as np
+
+from app.codec import ULaw
+from app.const import audio_header
+from app.dtx import VoiceDetector, NoiseDescriber, ComfortNoise, CN_INTERVAL, CN_BANDS
+from app.jitter_buffer import JitterBuffer
+from app.mixer import Mixer
+from app.plc import Concealer
+from bench.codec_bench import speech_like, IP_UDP_HEADERS
+
+NOISE = 100 # background noise, RMS
+
+def meeting(rate:int, frame:int, frames:int, activity:float, seed:int) -> tuple[np.ndarray, np.ndarray]:
+    """Frames of one peer and whether each one really holds speech."""
+    rng = np.random.default_rng(seed)
+    talking = np.zeros(frames, dtype=bool)
+    i, talk = 0, rng.random() < activity
+    mean_talk = 1.5 * rate / frame # frames, about a sentence
+    mean_pause = mean_talk * (1 - activity) / activity
+    while i < frames:
+        length = max(1, int(rng.exponential(mean_talk if talk else mean_pause)))
+        talking[i:i + length] = talk
+        i += length
+        talk = not talk
+    audio = rng.normal(0, NOISE, (frames, frame))
+    audio[talking] += speech_like(rate, frame * int(talking.sum()), seed=seed).reshape(-1, frame)
+    return np.clip(audio, -32768, 32767).astype(np.int16), talking
+
+def send(frames:np.ndarray, rate:int, frame:int) -> tuple[list, float]:
+    """The packets one peer sends with DTX: ("frame", pcm, marker) or ("noise", descriptor), and the VAD time per frame."""
+    vad, noise = VoiceDetector(rate, frame), NoiseDescriber(rate, frame)
+    packets, talking, next_noise = [], False, 0.0
+    start = time.perf_counter()
+    for i, pcm in enumerate(frames):
+        if vad(pcm):
+            packets.append(("frame", i, not talking))
+            talking, next_noise = True, 0.0
+            continue
+        noise.add(pcm)
+        if i * frame / rate >= next_noise:
+            packets.append(("noise", i, noise.descriptor()))
+            next_noise = i * frame / rate + CN_INTERVAL
+        talking = False
+    return packets, (time.perf_counter() - start) / len(frames)
+
+def receive(streams:list, payloads:list, rate:int, frame:int, frames:int) -> float:
+    """Seconds of CPU for the receive path over the whole meeting."""
+    decoders = [ULaw(rate, frame) for _ in streams]
+    buffers = [JitterBuffer(frame / rate, concealer=Concealer(rate, frame)) for _ in streams]
+    comfort = ComfortNoise(rate, frame)
+    mixer = Mixer(frame)
+    silent = {}
+    by_tick = [[] for _ in range(frames)]
+    for peer, packets in enumerate(streams):
+        for packet in packets:
+            by_tick[packet[1]].append((peer, packet))
+    start = time.perf_counter()
+    for tick in range(frames):
+        now = tick * frame / rate
+        for peer, packet in by_tick[tick]:
+            if packet[0] == "noise":
+                silent[peer] = ComfortNoise.power(packet[2])
+                continue
+            silent.pop(peer, None)
+            pcm = decoders[peer].decode(payloads[peer][tick])
+            buffers[peer].put(tick, now, pcm, now, marker=packet[2])
+        for peer, buffer in enumerate(buffers):
+            if peer in silent and not buffer.depth:
+                continue
+            played = buffer.pop()
+            if played is not None:
+                mixer.add(played)
+        if silent:
+            mixer.add(comfort.generate(sum(silent.values())))
+        mixer.mix()
+    return time.perf_counter() - start
+
+def run(rate:int, frame:int, peers:int, activity:float, seconds:float):
+    frames = int(seconds * rate / frame)
+    frame_time = frame / rate
+    codec = ULaw(rate, frame)
+    audios, truths = zip(*(meeting(rate, frame, frames, activity, seed) for seed in range(peers)))
+    payloads = [[codec.encode(pcm) for pcm in audio] for audio in audios]
+
+    sent = [send(audio, rate, frame) for audio in audios]
+    dtx_streams = [packets for packets, _ in sent]
+    full_streams = [[("frame", i, i == 0) for i in range(frames)] for _ in range(peers)]
+    vad_time = np.mean([cost for _, cost in sent])
+
+    frame_packets = sum(sum(kind == "frame" for kind, *_ in packets) for packets in dtx_streams)
+    noise_packets = sum(len(packets) for packets in dtx_streams) - frame_packets
+    speech = sum(truth.sum() for truth in truths)
+    sent_frames = [np.zeros(frames, dtype=bool) for _ in range(peers)]
+    for flags, packets in zip(sent_frames, dtx_streams):
+        flags[[i for kind, i, _ in packets if kind == "frame"]] = True
+    clipped = sum(np.count_nonzero(truth & ~flags) for truth, flags in zip(truths, sent_frames))
+    payload = len(payloads[0][0]) + audio_header.size + IP_UDP_HEADERS
+    noise_size = len(CN_BANDS) + audio_header.size + IP_UDP_HEADERS
+
+    per_peer = lambda packets: packets / peers / seconds
+    print(f"{peers} peers, {activity:.0%} talk time each, {seconds:.0f} s, {frame_time * 1000:.1f} ms frames, VAD {vad_time * 1e6:.1f} us/frame")
+    print(f"without DTX: {per_peer(peers * frames):.1f} packets/s per peer, {per_peer(peers * frames) * payload * 8 / 1000:.1f} kbit/s")
+    print(f"with DTX:    {per_peer(frame_packets + noise_packets):.1f} packets/s per peer ({per_peer(noise_packets):.1f} comfort noise), "
+          f"{(per_peer(frame_packets) * payload + per_peer(noise_packets) * noise_size) * 8 / 1000:.1f} kbit/s")
+    print(f"speech frames sent: {1 - clipped / max(speech, 1):.1%}, frames sent that were not speech (hangover, noise): "
+          f"{(frame_packets - (speech - clipped)) / max(frame_packets, 1):.1%}")
+
+    full = receive(full_streams, payloads, rate, frame, frames)
+    dtx = receive(dtx_streams, payloads, rate, frame, frames)
+    print(f"receive CPU: {full / seconds * 1000:.1f} ms per second of audio without DTX, {dtx / seconds * 1000:.1f} ms with it ({1 - dtx / full:.0%} less)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rate", type=int, default=44100)
+    parser.add_argument("--frame", type=int, default=2048, help="samples per frame")
+    parser.add_argument("--peers", type=int, default=10)
+    parser.add_argument("--activity", type=float, default=0.15, help="fraction of the time each peer talks")
+    parser.add_argument("--seconds", type=float, default=60)
+    args = parser.parse_args()
+
+    run(args.rate, args.frame, args.peers, args.activity, args.seconds)
@@ -0,0 +1,70 @@
+"""Mixer: microseconds and memory allocated per mixed frame, for 2 to 64 talking peers.
+
+Compares the Mixer with the list-based mix it replaced in ReceiveAudio (a
+float32 copy per peer, np.sum, hard clip, tobytes). Memory is what
+tracemalloc sees allocated during one mix: the new array data, plus the
+small view objects that NumPy indexing creates. The arrays a Mixer needs are
+allocated up front, so they do not count.
+
+Run from client_code/src: python -m bench.mixer_bench --peers 2 4 8 16 32 64 --frame 2048
+"""
+import time
+import argparse
+import tracemalloc
+import numpy as np
+
+from app.mixer import Mixer
+from bench.codec_bench import speech_like
+
+def list_mix(audio_chunks:list[np.ndarray]) -> bytes:
+    arrays = [chunk.astype(np.float32) for chunk in audio_chunks if len(chunk)]
+    min_len = min(len(arr) for arr in arrays)
+    arrays = [arr[:min_len] for arr in arrays]
+    mixed = np.clip(np.sum(arrays, axis=0), -32768, 32767)
+    return mixed.astype(np.int16).tobytes()
+
+def mixer_mix(mixer:Mixer, frames:list[np.ndarray]) -> memoryview:
+    for frame in frames:
+        mixer.add(frame, 0.8)
+    return mixer.mix()
+
+def measure(mix, frames:list[np.ndarray], rounds:int) -> tuple[float, int]:
+    """(us per frame, bytes allocated at peak during one mix)."""
+    mix(frames) # warm up, lets the mixer size its buffers
+    start = time.perf_counter()
+    for _ in range(rounds):
+        mix(frames)
+    elapsed = (time.perf_counter() - start) / rounds
+    tracemalloc.start()
+    peak = 0
+    for _ in range(20):
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        result = mix(frames)
+        peak = max(peak, tracemalloc.get_traced_memory()[1] - before)
+        del result
+    tracemalloc.stop()
+    return elapsed * 1e6, peak
+
+def run(peer_counts:list[int], rate:int, frame:int, rounds:int):
+    audio = speech_like(rate, frame * max(peer_counts), seed=4).reshape(-1, frame)
+    print(f"{frame} samples per frame ({frame / rate * 1000:.1f} ms)")
+    print(f"{'peers':>5} {'list us':>9} {'list bytes':>11} {'mixer us':>9} {'mixer bytes':>12} {'limited':>8}")
+    for peers in peer_counts:
+        frames = [audio[i] for i in range(peers)]
+        list_us, list_bytes = measure(list_mix, frames, rounds)
+        mixer = Mixer(frame)
+        mixer_us, mixer_bytes = measure(lambda frames: mixer_mix(mixer, frames), frames, rounds)
+        # How often the limiter had to step in, with every peer at full level
+        limited = np.mean(np.abs(np.sum(np.array(frames, dtype=np.float32) * 0.8, axis=0)) > 24576)
+        print(f"{peers:>5} {list_us:>9.1f} {list_bytes:>11} {mixer_us:>9.1f} {mixer_bytes:>12} {limited:>8.1%}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--peers", type=int, nargs="+", default=[2, 4, 8, 16, 32, 64])
+    parser.add_argument("--rate", type=int, default=44100)
+    parser.add_argument("--frame", type=int, default=2048, help="samples per frame")
+    parser.add_argument("--rounds", type=int, default=2000)
+    args = parser.parse_args()
+
+    run(args.peers, args.rate, args.frame, args.rounds)
@@ -0,0 +1,111 @@
+"""Packet loss concealment: CPU cost per concealed frame and quality under injected loss.
+
+Frames of synthetic speech go through the real JitterBuffer with packets dropped
+by a Gilbert-Elliott model (bursty, like Wi-Fi) at the given loss rates, once
+with silence for lost frames and once with the Concealer. Quality is the
+log-spectral distance of the lost frames to the original (lower is better),
+and the mean jump at the edges of lost frames (clicks).
+
+Run from client_code/src: python -m bench.plc_bench --loss 0.02 0.05 0.1 --peers 20
+"""
+import time
+import random
+import argparse
+import numpy as np
+
+from app.plc import Concealer
+from app.jitter_buffer import JitterBuffer
+from bench.codec_bench import speech_like
+
+def cost(rate:int, frame:int, peers:int, rounds:int):
+    audio = speech_like(rate, frame * 8)
+    concealers = []
+    for i in range(peers):
+        concealer = Concealer(rate, frame)
+        for k in range(4):
+            concealer.received(audio[k * frame:(k + 1) * frame])
+        concealers.append(concealer)
+    first = continued = 0.0
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for concealer in concealers:
+            concealer.conceal() # first frame of a burst, includes the pitch search
+        first += time.perf_counter() - start
+        start = time.perf_counter()
+        for concealer in concealers:
+            concealer.conceal()
+        continued += time.perf_counter() - start
+        for concealer in concealers:
+            concealer.received(audio[:frame])
+    per_frame = lambda total: total / rounds / peers * 1e6
+    frame_time = frame / rate
+    print(f"CPU per concealed frame: {per_frame(first):.1f} us first of a burst, {per_frame(continued):.1f} us after that")
+    print(f"{peers} peers losing a frame in the same tick: {first / rounds * 1e3:.2f} ms of a {frame_time * 1e3:.1f} ms tick")
+
+def gilbert_losses(frames:int, loss:float, burst:float, seed:int) -> list[bool]:
+    """Lost flags with mean burst length `burst` frames and overall loss rate `loss`."""
+    rng = random.Random(seed)
+    p_recover = 1 / burst
+    p_lose = loss * p_recover / (1 - loss)
+    lost, state = [], False
+    for _ in range(frames):
+        state = rng.random() < (1 - p_recover if state else p_lose)
+        lost.append(state)
+    return lost
+
+def play(audio:np.ndarray, lost:list[bool], rate:int, frame:int, conceal:bool) -> tuple[np.ndarray, int]:
+    buffer = JitterBuffer(frame / rate, concealer=Concealer(rate, frame) if conceal else None)
+    out = []
+    for seq, pcm in enumerate(audio.reshape(-1, frame)):
+        if not lost[seq]:
+            buffer.put(seq, seq * frame / rate, pcm, seq * frame / rate)
+        played = buffer.pop()
+        out.append(np.zeros(frame, dtype=np.int16) if played is None else played)
+    return np.concatenate(out), buffer.concealed
+
+def spectral_distance(reference:np.ndarray, played:np.ndarray) -> float:
+    """Mean log-spectral distance in dB between frames, waveform matching would punish any phase drift."""
+    if not len(reference):
+        return float("nan")
+    floor = 1e-7 * frame_power(reference).max() # about the noise floor of the test signal
+    difference = 10 * np.log10((frame_power(reference) + floor) / (frame_power(played) + floor))
+    return float(np.mean(np.sqrt(np.mean(difference ** 2, axis=1))))
+
+def frame_power(frames:np.ndarray) -> np.ndarray:
+    return np.abs(np.fft.rfft(frames.astype(np.float64) * np.hanning(frames.shape[1]), axis=1)) ** 2
+
+def quality(rate:int, frame:int, frames:int, losses:list[float], burst:float):
+    audio = speech_like(rate, frame * frames, seed=2)
+    frame_starts = np.arange(1, frames) * frame
+    print(f"{'loss':>5} {'lost':>5} {'concealed':>9} {'LSD silence':>16} {'LSD PLC':>12} {'edge jump silence':>18} {'edge jump PLC':>14}")
+    for loss in losses:
+        lost = gilbert_losses(frames, loss, burst, seed=3)
+        lost[0] = False
+        mask = np.repeat(lost, frame)
+        results = []
+        for conceal in (False, True):
+            out, concealed = play(audio, lost, rate, frame, conceal)
+            m = mask[:len(out)]
+            distance = spectral_distance(audio.reshape(-1, frame)[lost], out.reshape(-1, frame)[lost])
+            # Jumps at the edges of lost frames, compared with the signal's own sample-to-sample change
+            edges = frame_starts[frame_starts < len(out)]
+            edges = edges[m[edges] | m[edges - 1]]
+            jump = np.mean(np.abs(out[edges].astype(np.float64) - out[edges - 1])) if len(edges) else float("nan")
+            results.append((distance, jump, concealed))
+        print(f"{loss:>5.2f} {sum(lost):>5} {results[1][2]:>9} {results[0][0]:>14.1f}dB {results[1][0]:>10.1f}dB {results[0][1]:>18.0f} {results[1][1]:>14.0f}")
+    natural = np.mean(np.abs(np.diff(audio.astype(np.float64))))
+    print(f"(mean sample-to-sample change of the signal itself: {natural:.0f})")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rate", type=int, default=44100)
+    parser.add_argument("--frame", type=int, default=2048, help="samples per frame")
+    parser.add_argument("--frames", type=int, default=2000)
+    parser.add_argument("--loss", type=float, nargs="+", default=[0.02, 0.05, 0.1])
+    parser.add_argument("--burst", type=float, default=1.5, help="mean loss burst length in frames")
+    parser.add_argument("--peers", type=int, default=20)
+    parser.add_argument("--rounds", type=int, default=100)
+    args = parser.parse_args()
+
+    cost(args.rate, args.frame, args.peers, args.rounds)
+    quality(args.rate, args.frame, args.frames, args.loss, args.burst)
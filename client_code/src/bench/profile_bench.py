@@ -0,0 +1,90 @@
+"""Audio profiles: buffering latency against bandwidth, and the resampler's cost and alias rejection.
+
+The latency is the floor our own buffers add from mouth to ear, before the
+network and its jitter: a frame to capture, the capture callback's block,
+the jitter buffer's minimum depth, and the playback ring (a frame plus its
+slack blocks). Bandwidth is per peer and direction, with the audio header and
+IPv4 + UDP headers, for speech-like audio through each codec.
+
+The resampler runs when the sound card does not take the profile's rate,
+and when a peer sends at another rate than ours; its cost is per frame and
+as a share of one core, its alias rejection the level of a tone 10% above
+the lower Nyquist frequency after resampling.
+
+Run from client_code/src: python -m bench.profile_bench --frames 200
+"""
+import time
+import argparse
+import numpy as np
+
+from app.codec import CODECS
+from app.const import audio_header
+from app.jitter_buffer import MIN_DEPTH
+from app.profile import PROFILES, LEGACY_RATE
+from app.resample import Resampler
+from bench.codec_bench import speech_like, IP_UDP_HEADERS
+from bench.ring_bench import BLOCK, OUTPUT_SLACK
+
+DEVICE_RATES = (48000, 44100)
+
+def profiles(legacy_chunk:int) -> list[tuple[str, int, int]]:
+    rows = [(f"legacy ({legacy_chunk})", LEGACY_RATE, legacy_chunk)]
+    return rows + [(name, rate, rate * frame_ms // 1000) for name, (rate, frame_ms) in PROFILES.items()]
+
+def latency(rate:int, frame:int) -> float:
+    """Seconds of buffering from capture to playback, without the network."""
+    block = min(BLOCK, frame // 2) # as AudioIn and AudioOut pick it, for a device that takes the rate
+    return (frame + block + MIN_DEPTH * frame + frame + OUTPUT_SLACK * block) / rate
+
+def bandwidth(rate:int, frame:int, frames:int) -> dict[str, float]:
+    """kbit/s per peer for each codec available at this rate and frame size."""
+    audio = speech_like(rate, frame * frames).reshape(frames, frame)
+    kbits = {}
+    for codec in CODECS.values():
+        if not codec.available(rate, frame):
+            continue
+        encoder = codec(rate, frame)
+        size = sum(len(encoder.encode(pcm)) for pcm in audio) / frames
+        kbits[codec.name] = (size + audio_header.size + IP_UDP_HEADERS) * 8 * rate / frame / 1000
+    return kbits
+
+def resample_cost(source:int, target:int, frame:int, frames:int) -> float:
+    """Seconds per frame of `frame` samples at `source`."""
+    resampler = Resampler(source, target)
+    audio = speech_like(source, frame * frames).reshape(frames, frame)
+    start = time.perf_counter()
+    for pcm in audio:
+        resampler.process(pcm)
+    return (time.perf_counter() - start) / frames
+
+def alias_level(source:int, target:int) -> float|None:
+    """dB left of a full-scale tone 10% above the lower Nyquist frequency, which should come out as nothing."""
+    tone = min(source, target) / 2 * 1.1
+    if tone >= source / 2:
+        return None # No such tone at the source rate, nothing to fold back
+    t = np.arange(source) / source
+    out = Resampler(source, target).process((32000 * np.sin(2 * np.pi * tone * t)).astype(np.int16))
+    out = out[len(out) // 10:].astype(np.float64) # Past the filter's start-up
+    return 20 * np.log10(max(np.sqrt(np.mean(out ** 2)), 1e-9) / (32000 / np.sqrt(2)))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--frames", type=int, default=200)
+    parser.add_argument("--legacy-chunk", type=int, default=2048, help="audio_chunk of the legacy profile")
+    args = parser.parse_args()
+
+    print(f"{'profile':<16} {'rate':>6} {'frame ms':>9} {'pkt/s':>6} {'buffering ms':>13}  kbit/s per peer")
+    for name, rate, frame in profiles(args.legacy_chunk):
+        kbits = "  ".join(f"{codec} {value:.0f}" for codec, value in bandwidth(rate, frame, args.frames).items())
+        print(f"{name:<16} {rate:>6} {frame / rate * 1000:>9.1f} {rate / frame:>6.0f} {latency(rate, frame) * 1000:>13.1f}  {kbits}")
+
+    print()
+    print(f"{'resampling':<16} {'frame ms':>9} {'us/frame':>9} {'core %':>7} {'alias dB':>9}")
+    for name, rate, frame in profiles(args.legacy_chunk):
+        for device in DEVICE_RATES:
+            if device == rate:
+                continue
+            for source, target, samples in ((device, rate, frame * device // rate), (rate, device, frame)):
+                cost = resample_cost(source, target, samples, args.frames)
+                alias = alias_level(source, target)
+                print(f"{source:>6} -> {target:<6} {frame / rate * 1000:>9.1f} {cost * 1e6:>9.0f} {cost / (frame / rate) * 100:>7.2f} {'-' if alias is None else f'{alias:.1f}':>9}")
@@ -0,0 +1,123 @@
+"""Audio handoff: CPU of a waiting thread, playback buffering, and the ring buffer's cost per device callback.
+
+A thread stands in for PortAudio, calling back every BLOCK samples in real
+time. On the capture side it compares the old handoff (a deque the sender
+polled in a loop) with the RingBuffer and its event, by the CPU time of the
+consuming thread. On the playback side a thread plays one frame per tick
+through AudioOut's ring sizes, and the audio queued ahead of the device is
+sampled at every callback; before, the blocking write sat on a PortAudio
+buffer of one whole frame on top of the host buffers.
+
+Run from client_code/src: python -m bench.ring_bench --seconds 3 --frame 2048
+"""
+import time
+import argparse
+import threading
+from collections import deque
+import numpy as np
+
+from app.ring_buffer import RingBuffer
+
+BLOCK = 512 # as in app.object.audio_obj, which needs PyAudio to import
+OUTPUT_SLACK = 2
+
+def device(rate:int, seconds:float, callback):
+    """Calls callback() every BLOCK samples of real time, like a sound card."""
+    period = BLOCK / rate
+    start = time.perf_counter()
+    for i in range(int(seconds / period)):
+        delay = start + (i + 1) * period - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        callback()
+
+def capture_deque(rate:int, frame:int, seconds:float) -> float:
+    """CPU seconds per second of the sender thread polling a deque, as SendAudio did."""
+    queue, block, pending = deque(maxlen=50), np.zeros(BLOCK, dtype=np.int16).tobytes(), []
+    done = threading.Event()
+    def callback():
+        pending.append(block)
+        if len(pending) * BLOCK >= frame:
+            queue.append(b"".join(pending))
+            pending.clear()
+    cpu = []
+    def consumer():
+        start = time.thread_time()
+        while not done.is_set():
+            try:
+                queue.popleft()
+            except IndexError:
+                continue
+        cpu.append(time.thread_time() - start)
+    thread = threading.Thread(target=consumer)
+    thread.start()
+    device(rate, seconds, callback)
+    done.set()
+    thread.join()
+    return cpu[0] / seconds
+
+def capture_ring(rate:int, frame:int, seconds:float) -> float:
+    ring, block = RingBuffer(frame * 4), np.zeros(BLOCK, dtype=np.int16)
+    out = np.zeros(frame, dtype=np.int16)
+    done = threading.Event()
+    cpu = []
+    def consumer():
+        start = time.thread_time()
+        while not done.is_set():
+            if ring.wait_readable(frame, 0.5):
+                ring.read_into(out)
+        cpu.append(time.thread_time() - start)
+    thread = threading.Thread(target=consumer)
+    thread.start()
+    device(rate, seconds, lambda: ring.write(block))
+    done.set()
+    thread.join()
+    return cpu[0] / seconds
+
+def playback(rate:int, frame:int, seconds:float) -> tuple[float, float, int]:
+    """(mean ms queued ahead of the device, max ms, underruns) with AudioOut's ring."""
+    ring = RingBuffer(frame + OUTPUT_SLACK * BLOCK)
+    block, silence = np.zeros(BLOCK, dtype=np.int16), np.zeros(frame, dtype=np.int16)
+    done = threading.Event()
+    queued, underruns = [], 0
+    def callback():
+        nonlocal underruns
+        queued.append(ring.available)
+        if ring.read_into(block) < BLOCK:
+            underruns += 1
+    def player():
+        while not done.is_set():
+            if ring.wait_writable(frame, 0.5):
+                ring.write(silence)
+    thread = threading.Thread(target=player)
+    thread.start()
+    time.sleep(0.1) # Let it queue its first frame, like the stream starting
+    device(rate, seconds, callback)
+    done.set()
+    thread.join()
+    return np.mean(queued) / rate * 1000, np.max(queued) / rate * 1000, underruns
+
+def ring_cost(rounds:int) -> float:
+    ring, block = RingBuffer(BLOCK * 7), np.zeros(BLOCK, dtype=np.int16)
+    start = time.perf_counter()
+    for _ in range(rounds):
+        ring.write(block)
+        ring.read_into(block)
+    return (time.perf_counter() - start) / rounds / 2
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rate", type=int, default=44100)
+    parser.add_argument("--frame", type=int, default=2048, help="samples per frame")
+    parser.add_argument("--seconds", type=float, default=3)
+    parser.add_argument("--rounds", type=int, default=100000)
+    args = parser.parse_args()
+
+    frame_ms = args.frame / args.rate * 1000
+    print(f"{args.frame} samples per frame ({frame_ms:.1f} ms), device callback every {BLOCK} samples ({BLOCK / args.rate * 1000:.1f} ms)")
+    print(f"capture, CPU of the sending thread: deque polling {capture_deque(args.rate, args.frame, args.seconds):.0%} of a core, "
+          f"ring + event {capture_ring(args.rate, args.frame, args.seconds):.1%}")
+    mean, peak, underruns = playback(args.rate, args.frame, args.seconds)
+    print(f"playback, audio queued ahead of the device: {mean:.1f} ms mean, {peak:.1f} ms max, {underruns} underruns "
+          f"(blocking write: at least one {frame_ms:.1f} ms PortAudio buffer plus the host's)")
+    print(f"ring buffer: {ring_cost(args.rounds) * 1e6:.2f} us per block written or read")
@@ -25,6 +25,7 @@ except FileNotFoundError:
             "username": username,
             "p2p_retry_time": p2p_retry_time,
             "audio_chunk": 2048,
+            "audio_profile": "balanced",
             "server_address": "vc.itzowo.net",
             "server_port": 80,
             "auto_lan": True,
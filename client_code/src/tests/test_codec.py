@@ -0,0 +1,82 @@
+import warnings
+
+import numpy as np
+import pytest
+
+from app.codec import Codec, ULaw, ALaw, IMAADPCM, IMA_STEPS, IMA_INDEX
+
+with warnings.catch_warnings():
+    warnings.simplefilter("ignore", DeprecationWarning)
+    audioop = pytest.importorskip("audioop") # The G.711 reference, gone from Python 3.13
+
+EVERY_SAMPLE = np.arange(-32768, 32768, dtype=np.int16)
+EVERY_CODE = bytes(range(256))
+
+def test_pcm_round_trip():
+    codec = Codec(16000, 160)
+    payload = codec.encode(EVERY_SAMPLE[::400])
+    assert codec.valid(payload[:320]) and not codec.valid(payload[:319])
+    assert np.array_equal(codec.decode(payload), EVERY_SAMPLE[::400])
+
+@pytest.mark.parametrize("codec, lin2law, law2lin", [(ULaw, audioop.lin2ulaw, audioop.ulaw2lin), (ALaw, audioop.lin2alaw, audioop.alaw2lin)])
+def test_g711_matches_audioop(codec, lin2law, law2lin):
+    encoder = codec(8000, len(EVERY_SAMPLE))
+    assert encoder.encode(EVERY_SAMPLE) == lin2law(EVERY_SAMPLE.astype("<i2").tobytes(), 2)
+    assert encoder.decode(EVERY_CODE).astype("<i2").tobytes() == law2lin(EVERY_CODE, 2)
+
+def reference_decode(payload:bytes, samples:int) -> list[int]:
+    """IMA-ADPCM decoded one sample at a time, straight from the algorithm."""
+    predictor = int.from_bytes(payload[:2], "little", signed=True)
+    index = payload[2]
+    out = []
+    for i in range(samples):
+        code = payload[3 + i // 2] >> (4 * (i & 1)) & 0x0F
+        step = IMA_STEPS[index]
+        diff = step >> 3
+        if code & 4:
+            diff += step
+        if code & 2:
+            diff += step >> 1
+        if code & 1:
+            diff += step >> 2
+        predictor = min(max(predictor - diff if code & 8 else predictor + diff, -32768), 32767)
+        index = min(max(index + IMA_INDEX[code & 7], 0), 88)
+        out.append(predictor)
+    return out
+
+def tone(frame:int, frames:int, amplitude:float, rate:int=16000) -> np.ndarray:
+    t = np.arange(frame * frames) / rate
+    return np.clip(np.rint(amplitude * np.sin(2 * np.pi * 440 * t)), -32768, 32767).astype(np.int16).reshape(frames, frame)
+
+@pytest.mark.parametrize("frame", [160, 161, 1])
+@pytest.mark.parametrize("amplitude", [8000, 32767, 40000]) # 40000 clips, a full-scale square-ish wave
+def test_adpcm_round_trip(frame, amplitude):
+    encoder, decoder = IMAADPCM(16000, frame), IMAADPCM(16000, frame)
+    for pcm in tone(frame, 20, amplitude):
+        payload = encoder.encode(pcm)
+        assert decoder.valid(payload)
+        decoded = decoder.decode(payload)
+        assert len(decoded) == frame + (frame & 1) # An odd frame carries one padding code
+        assert decoded[:frame].tolist() == reference_decode(payload, frame)
+        assert decoded[frame - 1] == encoder.predictor # The next frame starts from what the decoder has
+
+def test_adpcm_tracks_the_signal():
+    encoder = IMAADPCM(16000, 160)
+    frames = tone(160, 50, 8000)
+    decoded = np.concatenate([encoder.decode(encoder.encode(pcm)) for pcm in frames])
+    error = decoded[800:].astype(np.float64) - frames.reshape(-1)[800:] # Past the step size's start-up
+    snr = 10 * np.log10(np.mean(frames.reshape(-1)[800:].astype(np.float64) ** 2) / np.mean(error ** 2))
+    assert snr > 20
+
+def test_adpcm_full_scale_does_not_wrap():
+    encoder = IMAADPCM(16000, 64)
+    square = np.array(([32767] * 16 + [-32768] * 16) * 2, dtype=np.int16)
+    for _ in range(10):
+        payload = encoder.encode(square)
+        decoded = encoder.decode(payload)
+        assert decoded.tolist() == reference_decode(payload, 64)
+    assert decoded[15] > 30000 and decoded[31] < -30000
+
+def test_adpcm_short_payload_decodes_to_nothing():
+    assert len(IMAADPCM(16000, 160).decode(b"\x00\x00")) == 0
+    assert not IMAADPCM(16000, 160).valid(b"\x00" * 82)
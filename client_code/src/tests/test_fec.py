@@ -0,0 +1,78 @@
+import random
+
+import pytest
+
+from app.fec import ParityEncoder, ParityDecoder, group_size, LEVELS
+
+def payloads(first:int, lengths:list[int], seed:int=0) -> dict[int, bytes]:
+    rng = random.Random(seed)
+    return {first + i: bytes(rng.randrange(256) for _ in range(length)) for i, length in enumerate(lengths)}
+
+def encode(size:int, frames:dict[int, bytes]) -> tuple[int, bytes]:
+    encoder = ParityEncoder(size)
+    results = [encoder.add(seq, payload) for seq, payload in sorted(frames.items())]
+    assert results[:-1] == [None] * (size - 1)
+    assert results[-1] is not None
+    return results[-1]
+
+@pytest.mark.parametrize("lengths", [[160] * 4, [160, 7, 300, 1], [0, 5, 5, 2]])
+@pytest.mark.parametrize("lost", range(4))
+def test_rebuilds_one_missing_frame_byte_exactly(lengths, lost):
+    frames = payloads(8, lengths)
+    first, parity = encode(4, frames)
+    assert first == 8
+    decoder = ParityDecoder()
+    for seq, payload in frames.items():
+        if seq != 8 + lost:
+            decoder.received(seq, memoryview(payload))
+    assert decoder.recover(first, memoryview(parity)) == (8 + lost, frames[8 + lost])
+
+def test_nothing_to_rebuild_without_a_loss():
+    frames = payloads(0, [10, 20])
+    first, parity = encode(2, frames)
+    decoder = ParityDecoder()
+    for seq, payload in frames.items():
+        decoder.received(seq, memoryview(payload))
+    assert decoder.recover(first, memoryview(parity)) is None
+
+def test_two_missing_frames_cannot_be_rebuilt():
+    frames = payloads(0, [10, 20, 30, 40])
+    first, parity = encode(4, frames)
+    decoder = ParityDecoder()
+    for seq in (0, 3):
+        decoder.received(seq, memoryview(frames[seq]))
+    assert decoder.recover(first, memoryview(parity)) is None
+
+def test_malformed_parity_is_ignored():
+    frames = payloads(0, [10, 20])
+    first, parity = encode(2, frames)
+    decoder = ParityDecoder()
+    decoder.received(0, memoryview(frames[0]))
+    assert decoder.recover(first, memoryview(parity[:3])) is None # Cut inside the lengths
+    assert decoder.recover(first, memoryview(b"")) is None
+
+def test_encoder_drops_a_broken_group():
+    frames = payloads(0, [10] * 8)
+    encoder = ParityEncoder(4)
+    assert [encoder.add(seq, frames[seq]) for seq in (0, 1, 3)] == [None, None, None] # 2 never came
+    assert encoder.add(4, frames[4]) is None # The next group starts cleanly
+    assert [encoder.add(seq, frames[seq]) for seq in (5, 6)] == [None, None]
+    first, parity = encoder.add(7, frames[7])
+    assert first == 4
+    decoder = ParityDecoder()
+    for seq in (4, 5, 7):
+        decoder.received(seq, memoryview(frames[seq]))
+    assert decoder.recover(first, memoryview(parity)) == (6, frames[6])
+
+def test_encoder_waits_for_a_group_boundary():
+    frames = payloads(0, [10] * 4)
+    encoder = ParityEncoder(2)
+    assert encoder.add(1, frames[1]) is None # Joined mid-group
+    assert encoder.add(2, frames[2]) is None
+    assert encoder.add(3, frames[3])[0] == 2
+
+def test_group_size_follows_loss():
+    assert group_size(0.0, 0.02) == 0
+    assert group_size(0.02, 0.02) == 8
+    assert group_size(0.5, 0.02) == 2
+    assert group_size(LEVELS[1][0], 0.05) == 4 # Capped so a group lasts at most MAX_DELAY
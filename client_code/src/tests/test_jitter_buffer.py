@@ -0,0 +1,129 @@
+import numpy as np
+
+from app.jitter_buffer import JitterBuffer, RESET_GAP, SHRINK_AFTER, FEC_TIMEOUT
+
+FRAME_TIME = 0.02
+
+def frame(seq:int) -> np.ndarray:
+    return np.full(4, seq, dtype=np.int16)
+
+def put(buffer:JitterBuffer, *seqs:int, arrival:float=0.0):
+    for seq in seqs:
+        buffer.put(seq, None, frame(seq), arrival)
+
+def played(buffer:JitterBuffer, ticks:int) -> list[int|None]:
+    return [None if (f := buffer.pop()) is None else int(f[0]) for _ in range(ticks)]
+
+def test_plays_in_sequence_order():
+    buffer = JitterBuffer(FRAME_TIME)
+    put(buffer, 2, 0, 3, 1)
+    assert played(buffer, 4) == [0, 1, 2, 3]
+    assert buffer.stats()["received"] == 4
+
+def test_drops_duplicates():
+    buffer = JitterBuffer(FRAME_TIME)
+    put(buffer, 0, 1, 1, 0)
+    assert played(buffer, 2) == [0, 1]
+    assert buffer.stats()["duplicates"] == 2
+
+def test_drops_late_frames():
+    buffer = JitterBuffer(FRAME_TIME)
+    put(buffer, 0, 1, 2)
+    assert played(buffer, 2) == [0, 1]
+    put(buffer, 0, 1)
+    assert played(buffer, 1) == [2]
+    stats = buffer.stats()
+    assert stats["late"] == 2
+    assert stats["duplicates"] == 0
+
+def test_skips_a_lost_frame_when_at_target():
+    buffer = JitterBuffer(FRAME_TIME)
+    put(buffer, 0, 2, 3)
+    assert played(buffer, 4) == [0, None, 2, 3]
+    assert buffer.stats()["lost"] == 1
+
+def test_waits_for_a_missing_frame_below_target():
+    buffer = JitterBuffer(FRAME_TIME, min_depth=2)
+    put(buffer, 0, 2)
+    assert played(buffer, 2) == [0, None]
+    put(buffer, 1)
+    assert played(buffer, 2) == [1, 2]
+    assert buffer.stats()["lost"] == 0
+
+def test_underrun_rebuffers():
+    buffer = JitterBuffer(FRAME_TIME, min_depth=2)
+    put(buffer, 0)
+    assert played(buffer, 1) == [None] # Buffering up to the target first
+    put(buffer, 1)
+    assert played(buffer, 3) == [0, 1, None]
+    assert buffer.stats()["underruns"] == 1
+    put(buffer, 2)
+    assert played(buffer, 1) == [None]
+    put(buffer, 3)
+    assert played(buffer, 2) == [2, 3]
+
+def test_sequence_jump_resets():
+    buffer = JitterBuffer(FRAME_TIME)
+    put(buffer, 0, 1)
+    assert played(buffer, 1) == [0]
+    restart = 1 + RESET_GAP + 50
+    put(buffer, restart)
+    assert played(buffer, 2) == [restart, None]
+    stats = buffer.stats()
+    assert stats["late"] == 0
+    assert stats["lost"] == 0
+
+def test_shrinks_after_running_above_target():
+    buffer = JitterBuffer(FRAME_TIME, max_depth=100)
+    count = SHRINK_AFTER + 10
+    put(buffer, *range(count))
+    out = played(buffer, SHRINK_AFTER + 1)
+    assert out[:SHRINK_AFTER] == list(range(SHRINK_AFTER))
+    assert out[SHRINK_AFTER] == SHRINK_AFTER + 1 # One frame dropped to cut latency
+    assert buffer.stats()["shrunk"] == 1
+
+def test_overflow_drops_the_oldest_frame():
+    buffer = JitterBuffer(FRAME_TIME, max_depth=4)
+    put(buffer, *range(9))
+    assert buffer.depth == 8
+    assert played(buffer, 1) == [1]
+    assert buffer.stats()["shrunk"] == 1
+
+def test_fec_depth_covers_a_parity_group():
+    buffer = JitterBuffer(FRAME_TIME)
+    buffer.protect(4, 0.0)
+    assert buffer.target == 4
+    put(buffer, 0, 1, 2)
+    assert played(buffer, 1) == [None]
+    put(buffer, 3)
+    assert played(buffer, 1) == [0]
+
+def test_fec_depth_expires_without_parity():
+    buffer = JitterBuffer(FRAME_TIME)
+    buffer.protect(4, 0.0)
+    put(buffer, 0, arrival=FEC_TIMEOUT + 1)
+    assert buffer.target == 1
+    assert played(buffer, 1) == [0]
+
+def test_recovered_frames_count_separately():
+    buffer = JitterBuffer(FRAME_TIME)
+    put(buffer, 0, 2)
+    buffer.put(1, None, frame(1), 0.0, recovered=True)
+    assert played(buffer, 3) == [0, 1, 2]
+    stats = buffer.stats()
+    assert stats["received"] == 2
+    assert stats["recovered"] == 1
+
+def test_ignores_empty_frames():
+    buffer = JitterBuffer(FRAME_TIME)
+    buffer.put(0, None, np.zeros(0, dtype=np.int16), 0.0)
+    assert buffer.depth == 0
+    assert buffer.stats()["received"] == 0
+
+def test_loss_fraction():
+    buffer = JitterBuffer(FRAME_TIME)
+    assert buffer.loss_fraction() is None
+    put(buffer, 0, 1, 3)
+    assert buffer.loss_fraction() == 0.25
+    put(buffer, 4, 5)
+    assert buffer.loss_fraction() == 0.0
@@ -1,4 +1,6 @@
-from flask import Flask
+import time
+
+from flask import Flask, g, request
 from werkzeug.middleware.proxy_fix import ProxyFix
 
 from .view.main import main_route
@@ -7,13 +9,28 @@ from .view.api.channels import channels_api
 from .view.api.utils import utils_api
 
 from .utils.logger import setup_logger, INFO
+from .utils.metrics import Counter, Histogram
 
 
 log = setup_logger(__name__, INFO)
 
+HTTP_REQUESTS = Counter("p2pvc_http_requests_total", "HTTP requests by route", ("route", "method", "status"))
+HTTP_LATENCY = Histogram("p2pvc_http_request_duration_seconds", "Time to build the HTTP response, by route", ("route",))
+
+def start_timer():
+    g.started = time.perf_counter()
+
+def record_request(response):
+    route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+    HTTP_LATENCY.observe(time.perf_counter() - g.started, route)
+    HTTP_REQUESTS.inc(route, request.method, response.status_code)
+    return response
+
 def init_app():
     app = Flask(__name__)
     app.wsgi_app = ProxyFix(app.wsgi_app, x_for=1)
+    app.before_request(start_timer)
+    app.after_request(record_request)
 
     app.register_blueprint(main_route)
     app.register_blueprint(channel_api)
@@ -1,60 +1,71 @@
-import struct
-import socket
+import os
 import threading
 
-from app.utils.channel import Channel, LAN_Member
+from app.core.registry import ChannelRegistry
+from app.core.sqlite_registry import SQLiteRegistry
+from app.core.persistence import ChannelStore
+from app.core.rendezvous import RendezvousEngine
+from app.core.relay import RelayEngine
+from app.core.sfu import SFUEngine
 from app.utils.logger import setup_logger
+from app.utils.metrics import Gauge
 
 
 log = setup_logger(__name__)
 
+RENDEZVOUS_PORT = int(os.environ.get("RENDEZVOUS_PORT", 0))
+RENDEZVOUS_SHARDS = int(os.environ.get("RENDEZVOUS_SHARDS", 1))
+DATA_DIR = os.environ.get("DATA_DIR", "data")
+STATE_BACKEND = os.environ.get("STATE_BACKEND", "memory") # memory | sqlite
+SQLITE_PATH = os.environ.get("SQLITE_PATH", os.path.join(DATA_DIR, "state.db"))
+RELAY = os.environ.get("RELAY", "0") == "1"
+RELAY_PORT_MIN = int(os.environ.get("RELAY_PORT_MIN", 0)) # 0: any free port
+RELAY_PORT_MAX = int(os.environ.get("RELAY_PORT_MAX", 0))
+SFU_THRESHOLD = int(os.environ.get("SFU_THRESHOLD", 0)) # channels with at least this many members switch to the SFU, 0: never
+SFU_PORT = int(os.environ.get("SFU_PORT", 0))
+HELD_REQUESTS = int(os.environ.get("HELD_REQUESTS", 4)) # long-polls and SSE streams a process holds a thread for at once, the rest get 503
+
+def create_backend(kind:str) -> ChannelRegistry|SQLiteRegistry:
+    if kind == "memory":
+        return ChannelRegistry()
+    if kind == "sqlite":
+        return SQLiteRegistry(SQLITE_PATH)
+    raise ValueError(f"Unknown state backend: {kind}")
+
 class Server:
+    """Shared server state.
+
+    Only the process that calls run() owns the rendezvous listener. Other
+    processes (HTTP workers on the sqlite backend) just use `channels` and read
+    the rendezvous port from the backend.
+    """
     def __init__(self):
-        self.udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.udp_socket.bind(("0.0.0.0", 0))
-        self.udp_socket.settimeout(2)  # Set a timeout for the socket to avoid blocking
-        self.udp_socket_port = self.udp_socket.getsockname()[1]
-        log.info(f"Join channel UDP listener started on port {self.udp_socket_port}")
+        self.channels = create_backend(STATE_BACKEND)
+        self.rendezvous:RendezvousEngine|None = None
+        self.relay:RelayEngine|None = None
+        self.sfu:SFUEngine|None = None
 
-        self.channels:list[dict[int, Channel]] = []
-        self.channels_lan:list[dict[int, list[LAN_Member]]] = [] # [{channel_id: [{name :str, ip: str, lan_ip :str, port: int}]}]
-        
         self.running = None
         self.nat_thread = threading.Thread(target=self.nat_listener, daemon=True)
 
+    @property
+    def udp_socket_port(self) -> int|None:
+        if self.rendezvous is not None:
+            return self.rendezvous.port
+        port = self.channels.get_meta("rendezvous_port")
+        return int(port) if port is not None else None
+
     def nat_listener(self):
         try:
-            while not self.running.is_set():
-                try:
-                    data, addr = self.udp_socket.recvfrom(1024)
-                except socket.timeout:
-                    continue
-                except OSError:
-                    log.error("Socket error, exiting NAT listener")
-                    break
-                log.info(f"Received Join request from {addr} with data: {data}")
-                header = data[:8]
-                channel_id, username_length = struct.unpack(">II", header)
-                name = data[8:8+username_length].decode('utf-8')
-                ip, port = addr
-                log.info(f"Received Join request from {name} for channel {channel_id} with IP {ip} and port {port}")
-                for channel in self.channels:
-                    if int(channel_id) in channel:
-                        status = channel[int(channel_id)].add_member(name, ip, port)
-                        if status is None:
-                            self.udp_socket.sendto(b"hello", addr)
-                            break
-                        else:
-                            log.error(f"Failed to add member {name} to channel {channel_id}: {status}")
-                            self.udp_socket.sendto(b"Failed to add member", addr)
-                            break
-                self.udp_socket.sendto(b"Channel not found", addr)
+            self.rendezvous.serve(self.running)
         except KeyboardInterrupt:
             print("\nCtrl + C detected")
         except:
             log.exception("Error in NAT listener")
         finally:
-            self.udp_socket.close()
+            for sock in self.rendezvous.sockets:
+                sock.close()
+            self.channels.close()
             log.info("NAT listener stopped")
 
     def set_event(self, event:threading.Event):
@@ -63,6 +74,32 @@ class Server:
     def run(self):
         if self.running is None:
             log.critical("Running event has not set")
+        if isinstance(self.channels, ChannelRegistry):
+            self.channels.attach_store(ChannelStore(DATA_DIR))
+        self.channels.reset_members()
+
+        if RELAY:
+            self.relay = RelayEngine(port_min=RELAY_PORT_MIN, port_max=RELAY_PORT_MAX)
+            threading.Thread(target=self.relay.serve, args=(self.running,), daemon=True).start()
+        if SFU_THRESHOLD:
+            self.sfu = SFUEngine(port=SFU_PORT)
+            threading.Thread(target=self.sfu.serve, args=(self.running,), daemon=True).start()
+        self.rendezvous = RendezvousEngine(self.channels, port=RENDEZVOUS_PORT, shards=RENDEZVOUS_SHARDS, relay=self.relay, sfu=self.sfu)
+        self.channels.set_meta("rendezvous_port", str(self.rendezvous.port))
+        log.info(f"Join channel UDP listener bound on port {self.rendezvous.port}")
         self.nat_thread.start()
 
-server = Server()
\ No newline at end of file
+server = Server()
+
+# Read at scrape time. With HTTP in separate workers the rendezvous, relay and SFU gauges are absent.
+Gauge("p2pvc_channels", "Channels", lambda: len(server.channels))
+Gauge("p2pvc_members", "Members in all channels", lambda: server.channels.member_count())
+Gauge("p2pvc_rendezvous_receive_queue_bytes", "Bytes waiting in the rendezvous socket receive queue",
+      lambda: {(shard,): size for shard, size in (server.rendezvous.receive_queues() or {}).items()} if server.rendezvous is not None else None, ("shard",))
+Gauge("p2pvc_rendezvous_notifications_pending", "Membership notifications not acked yet",
+      lambda: len(server.rendezvous.notifier.pending) if server.rendezvous is not None else None)
+Gauge("p2pvc_relay_allocations", "Relay ports in use", lambda: len(server.relay) if server.relay is not None else None)
+Gauge("p2pvc_relay_forwarded_packets_total", "Datagrams forwarded by the relay",
+      lambda: server.relay.forwarded if server.relay is not None else None, kind="counter")
+Gauge("p2pvc_sfu_forwarded_packets_total", "Datagrams sent out by the SFU",
+      lambda: server.sfu.forwarded if server.sfu is not None else None, kind="counter")
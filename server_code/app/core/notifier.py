@@ -0,0 +1,102 @@
+import time
+import socket
+import struct
+import asyncio
+import threading
+
+from app.utils.channel import Channel
+from app.utils.logger import setup_logger
+
+
+log = setup_logger(__name__)
+
+NOTIFY = 0x82
+NOTIFY_ACK = 0x83
+# type, seq, event, channel_id, channel version, ip, port, LAN ip, LAN port, username length, followed by the username.
+# A member without a LAN candidate has LAN ip 0.0.0.0 and port 0.
+NOTIFY_HEADER = struct.Struct(">BIBII4sH4sHH")
+NO_LAN_IP = bytes(4)
+NOTIFY_ACK_HEADER = struct.Struct(">BI") # type, seq
+EVENT_CODES = {"join": 1, "leave": 2}
+
+RETRANSMIT_INTERVAL = 0.2 # seconds
+MAX_TRANSMISSIONS = 10
+
+class MemberNotifier:
+    """Pushes join/leave events to every member over the rendezvous socket.
+
+    Each recipient address gets its own sequence numbers. A notification is
+    resent every RETRANSMIT_INTERVAL until the client acks it, or dropped after
+    MAX_TRANSMISSIONS (the member is then probably gone and will time out).
+    Sending only happens on the loop passed to attach(); acks may come in on
+    any shard.
+    """
+    def __init__(self):
+        self.loop:asyncio.AbstractEventLoop|None = None
+        self.transport:asyncio.DatagramTransport|None = None
+        self.seq:dict[tuple, int] = {} # addr -> last seq sent
+        self.pending:dict[tuple, list] = {} # (addr, seq) -> [packet, next send time, transmissions]
+        self.lock = threading.Lock()
+
+    def attach(self, loop:asyncio.AbstractEventLoop, transport:asyncio.DatagramTransport):
+        self.loop = loop
+        self.transport = transport
+
+    def on_change(self, channel:Channel, event:dict):
+        """Channel listener, called with the channel lock held."""
+        if self.loop is None:
+            return
+        member = event["member"]
+        recipients = [(m.ip, m.port) for m in channel.members.values() if m.name != member["name"]]
+        self.loop.call_soon_threadsafe(self.broadcast, channel.id, event, recipients)
+
+    def broadcast(self, channel_id:int, event:dict, recipients:list[tuple]):
+        member = event["member"]
+        name = member["name"].encode('utf-8')
+        try:
+            ip = socket.inet_aton(member["ip"])
+            lan_ip = socket.inet_aton(member["lan_ip"]) if member.get("lan_ip") else NO_LAN_IP
+        except OSError:
+            log.error(f"Cannot notify members about non IPv4 address {member['ip']}")
+            return
+        lan_port = member.get("lan_port") or 0
+        now = time.monotonic()
+        with self.lock:
+            if event["type"] == "leave":
+                self.forget((member["ip"], member["port"]))
+            for addr in recipients:
+                seq = self.seq.get(addr, 0) + 1
+                self.seq[addr] = seq
+                packet = NOTIFY_HEADER.pack(NOTIFY, seq, EVENT_CODES[event["type"]], channel_id, event["version"], ip, member["port"], lan_ip, lan_port, len(name)) + name
+                self.pending[(addr, seq)] = [packet, now + RETRANSMIT_INTERVAL, 1]
+                self.transport.sendto(packet, addr)
+
+    def forget(self, addr:tuple):
+        # Caller holds self.lock
+        self.seq.pop(addr, None)
+        for key in [key for key in self.pending if key[0] == addr]:
+            del self.pending[key]
+
+    def handle_ack(self, data:bytes, addr:tuple):
+        if len(data) < NOTIFY_ACK_HEADER.size:
+            return
+        _, seq = NOTIFY_ACK_HEADER.unpack_from(data)
+        with self.lock:
+            self.pending.pop((addr, seq), None)
+
+    def retransmit(self):
+        if not self.pending:
+            return
+        now = time.monotonic()
+        with self.lock:
+            for key, entry in list(self.pending.items()):
+                packet, deadline, transmissions = entry
+                if deadline > now:
+                    continue
+                if transmissions >= MAX_TRANSMISSIONS:
+                    log.debug(f"Giving up notification {key[1]} to {key[0]}")
+                    del self.pending[key]
+                    continue
+                entry[1] = now + RETRANSMIT_INTERVAL
+                entry[2] = transmissions + 1
+                self.transport.sendto(packet, key[0])
@@ -0,0 +1,95 @@
+import os
+import json
+import threading
+
+from app.utils.logger import setup_logger
+
+
+log = setup_logger(__name__)
+
+SNAPSHOT_FILE = "channels.snapshot"
+WAL_FILE = "channels.wal"
+COMPACT_AFTER = 10000 # WAL records before the next snapshot
+
+class ChannelStore:
+    """Append-only WAL of channel create/delete plus periodic snapshots.
+
+    Channels are stored as rows in Channel.to_record() field order. The snapshot
+    is a single JSON array with one row per line, so it loads in one json.load
+    call; it is swapped in with os.replace, after which the WAL starts over.
+    The WAL is JSON lines. Members are never written, they rejoin after a restart.
+    """
+    def __init__(self, path:str):
+        self.path = path
+        self.snapshot_path = os.path.join(path, SNAPSHOT_FILE)
+        self.wal_path = os.path.join(path, WAL_FILE)
+        self.wal = None
+        self.wal_records = 0
+        self.lock = threading.Lock()
+
+    def load(self) -> dict[int, list]:
+        """Latest snapshot with the WAL tail replayed on top, as {channel_id: channel record}."""
+        os.makedirs(self.path, exist_ok=True)
+        channels = {}
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, "r", encoding="utf-8") as f:
+                channels = {record[0]: record for record in json.load(f)}
+        if os.path.exists(self.wal_path):
+            good = 0 # byte offset after the last complete record
+            with open(self.wal_path, "rb") as f:
+                for line in f:
+                    try:
+                        if not line.endswith(b"\n"):
+                            raise ValueError("no newline")
+                        record = json.loads(line)
+                    except ValueError:
+                        # Torn write at the tail from a crash
+                        log.warning("Ignoring incomplete WAL record")
+                        break
+                    good += len(line)
+                    self.wal_records += 1
+                    if record["op"] == "create":
+                        channels[record["id"]] = record["channel"]
+                    else:
+                        channels.pop(record["id"], None)
+            if good < os.path.getsize(self.wal_path):
+                # Cut the torn tail off, or the next record would be appended onto it and lost with it
+                with open(self.wal_path, "r+b") as f:
+                    f.truncate(good)
+        self.wal = open(self.wal_path, "a", encoding="utf-8")
+        log.info(f"Loaded {len(channels)} channels ({self.wal_records} WAL records)")
+        return channels
+
+    def append(self, op:str, channel_id:int, record:list|None=None):
+        entry = {"op": op, "id": channel_id}
+        if record is not None:
+            entry["channel"] = record
+        with self.lock:
+            self.wal.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self.wal.flush()
+            self.wal_records += 1
+
+    def needs_compaction(self) -> bool:
+        return self.wal_records >= COMPACT_AFTER
+
+    def snapshot(self, records:list[list]):
+        """Write `records` as the new snapshot and truncate the WAL."""
+        tmp_path = self.snapshot_path + ".tmp"
+        with self.lock:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write("[\n")
+                f.write(",\n".join(json.dumps(record, ensure_ascii=False) for record in records))
+                f.write("\n]\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.snapshot_path)
+            self.wal.close()
+            self.wal = open(self.wal_path, "w", encoding="utf-8")
+            self.wal_records = 0
+        log.info(f"Snapshot written with {len(records)} channels")
+
+    def close(self):
+        with self.lock:
+            if self.wal is not None:
+                self.wal.close()
+                self.wal = None
@@ -0,0 +1,255 @@
+import gc
+import os
+import random
+import threading
+from bisect import bisect_left, bisect_right, insort
+
+from app.core.persistence import ChannelStore
+from app.utils.channel import Channel, Member
+from app.utils.logger import setup_logger
+
+
+log = setup_logger(__name__)
+
+CHANNEL_ID_MIN = 10000
+CHANNEL_ID_MAX = 99999
+
+class SortedIndex:
+    """(key, channel_id) pairs kept sorted, so prefix searches and cursors are a bisect, not a scan."""
+    def __init__(self, key):
+        self.key = key
+        self.items:list[tuple[str, int]] = []
+
+    def add(self, channel:Channel):
+        insort(self.items, (self.key(channel), channel.id))
+
+    def remove(self, channel:Channel):
+        item = (self.key(channel), channel.id)
+        i = bisect_left(self.items, item)
+        if i < len(self.items) and self.items[i] == item:
+            del self.items[i]
+
+    def rebuild(self, channels):
+        self.items = sorted((self.key(channel), channel.id) for channel in channels)
+
+    def range(self, prefix:str, after:tuple|None=None):
+        """Items whose key starts with `prefix`, in order, starting after the cursor `after`."""
+        start = bisect_left(self.items, (prefix,))
+        if after is not None:
+            start = max(start, bisect_right(self.items, after))
+        for i in range(start, len(self.items)):
+            item = self.items[i]
+            if not item[0].startswith(prefix):
+                return
+            yield item
+
+class ChannelRegistry:
+    """In-process state backend: channels keyed by ID, so every lookup is a dict hit.
+
+    Reads go straight to the dicts; anything that creates or deletes a channel
+    takes the registry lock. Member changes are guarded by each Channel's own lock.
+    SQLiteRegistry implements the same methods for multi-process deployments.
+    """
+    def __init__(self):
+        self.channels:dict[int, Channel] = {}
+        self.lock = threading.Lock()
+        self.listeners = []
+        self.store:ChannelStore|None = None
+        self.meta:dict[str, str] = {}
+        self.epoch = os.urandom(4).hex() # Versions restart with the process, so ETags must not survive it
+        self.generation = 0 # Bumped whenever the channel list changes
+        # Channel list order: by ID, or by name / author for prefix searches
+        self.indexes = {
+            "id": SortedIndex(lambda channel: ""),
+            "name": SortedIndex(lambda channel: channel.name.casefold()),
+            "author": SortedIndex(lambda channel: channel.author.casefold()),
+        }
+
+    def attach_store(self, store:ChannelStore):
+        """Restore channels from `store` and log every create/delete to it from now on."""
+        # Restoring allocates hundreds of thousands of objects that all survive,
+        # cyclic GC passes over them would only double the startup time
+        gc.disable()
+        try:
+            with self.lock:
+                for record in store.load().values():
+                    channel = Channel(*record)
+                    channel.listener = self._notify
+                    self.channels[channel.id] = channel
+                self.store = store
+                self.generation += 1
+                for index in self.indexes.values():
+                    index.rebuild(self.channels.values())
+        finally:
+            gc.enable()
+
+    def save(self):
+        if self.store is None:
+            return
+        with self.lock:
+            self.store.snapshot([channel.to_record() for channel in self.channels.values()])
+
+    def close(self):
+        if self.store is None:
+            return
+        self.save()
+        self.store.close()
+
+    def _log(self, op:str, channel_id:int, record:list|None=None):
+        # Caller holds self.lock
+        if self.store is None:
+            return
+        self.store.append(op, channel_id, record)
+        if self.store.needs_compaction():
+            self.store.snapshot([channel.to_record() for channel in self.channels.values()])
+
+    def add_listener(self, listener):
+        """Call listener(channel, event) on every membership change, with the channel lock held."""
+        self.listeners.append(listener)
+
+    def _notify(self, channel:Channel, event:dict):
+        for listener in self.listeners:
+            listener(channel, event)
+
+    def poll(self):
+        # Listeners are called synchronously on every change, nothing to catch up on
+        pass
+
+    def reset_members(self):
+        # Members only ever live in this process
+        pass
+
+    def set_meta(self, key:str, value:str):
+        self.meta[key] = value
+
+    def get_meta(self, key:str) -> str|None:
+        return self.meta.get(key)
+
+    def __contains__(self, channel_id:int) -> bool:
+        return channel_id in self.channels
+
+    def __len__(self) -> int:
+        return len(self.channels)
+
+    def etag(self, channel_id:int) -> str|None:
+        """Changes whenever the channel or its members change, None if there is no such channel."""
+        channel = self.channels.get(channel_id)
+        if channel is None:
+            return None
+        return f"{self.epoch}-{channel.timestamp}-{channel.version}"
+
+    def list_etag(self) -> str:
+        return f"{self.epoch}-{self.generation}"
+
+    def member_count(self) -> int:
+        return sum(len(channel.members) for channel in list(self.channels.values()))
+
+    def get(self, channel_id:int) -> Channel|None:
+        return self.channels.get(channel_id)
+
+    def all(self) -> list[Channel]:
+        return list(self.channels.values())
+
+    def page(self, limit:int, cursor:tuple|None=None, name:str="", author:str="") -> tuple[list[Channel], tuple|None]:
+        """Up to `limit` channels whose name / author start with the given prefixes (case-insensitive).
+
+        Ordered by ID, or by name (author) when searching by name (author).
+        Returns the channels and the cursor for the next page, None on the last page.
+        """
+        name, author = name.casefold(), author.casefold()
+        index, prefix = (self.indexes["name"], name) if name else (self.indexes["author"], author) if author else (self.indexes["id"], "")
+        channels = []
+        next_cursor = None
+        last = None # index item of the last channel taken
+        with self.lock:
+            for item in index.range(prefix, cursor):
+                channel = self.channels[item[1]]
+                if name and author and not channel.author.casefold().startswith(author):
+                    continue
+                if len(channels) == limit:
+                    if last is not None:
+                        next_cursor = last
+                    break
+                channels.append(channel)
+                last = item
+        return channels, next_cursor
+
+    def members(self, channel_id:int) -> list[Member]|None:
+        channel = self.channels.get(channel_id)
+        if channel is None:
+            return None
+        return channel.member_list()
+
+    def get_member(self, channel_id:int, name:str) -> Member|None:
+        channel = self.channels.get(channel_id)
+        if channel is None:
+            return None
+        return channel.members.get(name)
+
+    def changes_since(self, channel_id:int, since:int) -> dict|None:
+        channel = self.channels.get(channel_id)
+        if channel is None or channel.closed:
+            return None
+        return channel.changes_since(since)
+
+    def wait_for_change(self, channel_id:int, since:int, timeout:float) -> bool:
+        """Block until the channel's membership version moves past `since` or the channel is gone."""
+        channel = self.channels.get(channel_id)
+        if channel is None:
+            return True
+        return channel.wait_for_change(since, timeout)
+
+    def create(self, name:str, description:str, author:str, channel_id:int|None=None) -> Channel:
+        with self.lock:
+            if channel_id is None or channel_id in self.channels or not CHANNEL_ID_MIN <= channel_id <= CHANNEL_ID_MAX:
+                channel_id = self._random_id()
+            channel = Channel(channel_id, name, description, author)
+            channel.listener = self._notify
+            self.channels[channel_id] = channel
+            self.generation += 1
+            for index in self.indexes.values():
+                index.add(channel)
+            self._log("create", channel_id, channel.to_record())
+        log.info(f"Channel {channel_id} created by {author}")
+        return channel
+
+    def _random_id(self) -> int:
+        if len(self.channels) > CHANNEL_ID_MAX - CHANNEL_ID_MIN:
+            raise RuntimeError("No channel ID available")
+        while True:
+            channel_id = random.randint(CHANNEL_ID_MIN, CHANNEL_ID_MAX)
+            if channel_id not in self.channels:
+                return channel_id
+
+    def delete(self, channel_id:int) -> bool:
+        with self.lock:
+            channel = self.channels.pop(channel_id, None)
+            if channel is not None:
+                self.generation += 1
+                for index in self.indexes.values():
+                    index.remove(channel)
+                self._log("delete", channel_id)
+        if channel is None:
+            return False
+        channel.close()
+        log.info(f"Channel {channel_id} deleted")
+        return True
+
+    def join(self, channel_id:int, name:str, ip:str, port:int, lan_ip:str|None=None, lan_port:int|None=None) -> None|str:
+        channel = self.channels.get(channel_id)
+        if channel is None:
+            return "Channel not found"
+        return channel.add_member(name, ip, port, lan_ip, lan_port)
+
+    def leave(self, channel_id:int, name:str) -> None|str:
+        channel = self.channels.get(channel_id)
+        if channel is None:
+            return "Channel not found"
+        return channel.remove_member(name)
+
+    def same_nat(self, channel_id:int, ip:str) -> list[Member]|None:
+        """Members of the channel behind the public address `ip`."""
+        channel = self.channels.get(channel_id)
+        if channel is None:
+            return None
+        return channel.same_nat(ip)
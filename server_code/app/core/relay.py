@@ -0,0 +1,224 @@
+import os
+import time
+import socket
+import struct
+import random
+import threading
+import selectors
+from collections import deque
+
+from app.utils.channel import Channel
+from app.utils.logger import setup_logger
+
+
+log = setup_logger(__name__)
+
+# Sent to the rendezvous socket by a member that could not punch through to a peer.
+# type, channel_id, own username length, followed by the own username and the peer's username
+RELAY_REQUEST = 0x84
+RELAY_REQUEST_HEADER = struct.Struct(">BIB")
+# Reply: type, channel_id, relay port, token, followed by the peer's username
+RELAY_ALLOCATED = 0x85
+RELAY_ALLOCATED_HEADER = struct.Struct(">BIH8s")
+# Sent to the relay port until the peer answers, tells the relay our address as the relay sees it
+RELAY_BIND = 0x86
+RELAY_BIND_HEADER = struct.Struct(">B8s") # type, token
+
+BUFFER_SIZE = 65535
+BATCH = 64 # datagrams drained from one allocation before looking at the others
+IDLE_TIMEOUT = 30 # seconds without traffic before an allocation is freed
+SELECT_TIMEOUT = 0.5
+
+class Allocation:
+    """One relay port shared by two members, everything from one side is sent to the other."""
+    __slots__ = ("key", "sock", "port", "tokens", "addrs", "peers", "active")
+
+    def __init__(self, key:tuple, sock:socket.socket):
+        self.key = key # (channel_id, name, name), names sorted
+        self.sock = sock
+        self.port = sock.getsockname()[1]
+        self.tokens:dict[bytes, str] = {os.urandom(8): name for name in key[1:]}
+        self.addrs:dict[str, tuple] = {} # name -> address seen by the relay
+        self.peers:dict[tuple, tuple] = {} # forwarding table, address -> other side's address
+        self.active = True
+
+    def token(self, name:str) -> bytes:
+        return next(token for token, member in self.tokens.items() if member == name)
+
+    def bind(self, token:bytes, addr:tuple):
+        name = self.tokens.get(token)
+        if name is None or self.addrs.get(name) == addr:
+            return
+        self.addrs[name] = addr
+        if len(self.addrs) == 2:
+            a, b = self.addrs.values()
+            self.peers = {a: b, b: a}
+
+class RelayEngine:
+    """TURN-style fallback for members that cannot hole-punch each other.
+
+    Allocations are made through the rendezvous socket (RELAY_REQUEST), so
+    only joined members get one. Each pair of members gets its own UDP port;
+    once both sides have sent a RELAY_BIND with their token the relay forwards
+    datagrams between them unchanged, so clients simply use the relay address
+    as the peer's address.
+
+    Forwarding runs on one thread: a selector over every allocation socket,
+    draining each ready socket with recvfrom_into a single preallocated
+    buffer and sending straight out of it. Nothing is logged per packet.
+    """
+    def __init__(self, host:str="0.0.0.0", port_min:int=0, port_max:int=0):
+        self.host = host
+        self.port_min = port_min
+        self.port_max = port_max
+        self.allocations:dict[tuple, Allocation] = {}
+        self.lock = threading.Lock()
+        self.selector = selectors.DefaultSelector()
+        self.buffer = bytearray(BUFFER_SIZE)
+        self.view = memoryview(self.buffer)
+        self.added:deque[Allocation] = deque() # handed over to the relay thread
+        self.removed:deque[Allocation] = deque()
+        self.wakeup_r, self.wakeup_w = socket.socketpair()
+        self.wakeup_r.setblocking(False)
+        self.wakeup_w.setblocking(False)
+        self.selector.register(self.wakeup_r, selectors.EVENT_READ, None)
+        self.forwarded = 0
+        self.dropped = 0
+
+    def _bind(self) -> socket.socket:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            if not self.port_min:
+                sock.bind((self.host, 0))
+            else:
+                ports = list(range(self.port_min, self.port_max + 1))
+                random.shuffle(ports)
+                for port in ports:
+                    try:
+                        sock.bind((self.host, port))
+                        break
+                    except OSError:
+                        continue
+                else:
+                    raise OSError("No relay port available")
+        except OSError:
+            sock.close()
+            raise
+        sock.setblocking(False)
+        return sock
+
+    def _wakeup(self):
+        try:
+            self.wakeup_w.send(b"\0")
+        except BlockingIOError:
+            pass # Already pending
+
+    def allocate(self, channel_id:int, name:str, peer:str) -> tuple[int, bytes]|None:
+        """Relay port and bind token for `name` talking to `peer`, the same allocation for both sides."""
+        key = (channel_id, *sorted((name, peer)))
+        with self.lock:
+            allocation = self.allocations.get(key)
+            if allocation is None:
+                try:
+                    allocation = Allocation(key, self._bind())
+                except OSError as e:
+                    log.error(f"Failed to allocate relay for {name} and {peer} in channel {channel_id}: {e}")
+                    return None
+                self.allocations[key] = allocation
+                self.added.append(allocation)
+                log.info(f"Relay port {allocation.port} allocated for {key[1]} and {key[2]} in channel {channel_id}")
+        self._wakeup()
+        return allocation.port, allocation.token(name)
+
+    def release(self, channel_id:int, name:str):
+        """Free every allocation of a member that left."""
+        with self.lock:
+            keys = [key for key in self.allocations if key[0] == channel_id and name in key[1:]]
+            for key in keys:
+                self.removed.append(self.allocations.pop(key))
+        if keys:
+            self._wakeup()
+
+    def on_change(self, channel:Channel, event:dict):
+        """Channel listener, called with the channel lock held."""
+        if event["type"] == "leave":
+            self.release(channel.id, event["member"]["name"])
+
+    def __len__(self) -> int:
+        return len(self.allocations)
+
+    def _drain(self, allocation:Allocation):
+        sock = allocation.sock
+        buffer = self.buffer
+        view = self.view
+        forwarded = dropped = 0
+        for _ in range(BATCH):
+            try:
+                size, addr = sock.recvfrom_into(buffer)
+            except (BlockingIOError, InterruptedError):
+                break
+            except OSError:
+                break # ICMP errors from a previous send show up here
+            if size == RELAY_BIND_HEADER.size and buffer[0] == RELAY_BIND:
+                allocation.bind(bytes(view[1:size]), addr) # Also picks up a NAT rebinding
+                continue
+            target = allocation.peers.get(addr)
+            if target is None:
+                dropped += 1
+                continue
+            try:
+                sock.sendto(view[:size], target)
+                forwarded += 1
+            except OSError:
+                dropped += 1 # Send buffer full, drop it like the network would
+        allocation.active = True
+        self.forwarded += forwarded
+        self.dropped += dropped
+
+    def _apply_changes(self):
+        while self.added:
+            allocation = self.added.popleft()
+            self.selector.register(allocation.sock, selectors.EVENT_READ, allocation)
+        while self.removed:
+            allocation = self.removed.popleft()
+            try:
+                self.selector.unregister(allocation.sock)
+            except KeyError:
+                pass
+            allocation.sock.close()
+            log.info(f"Relay port {allocation.port} released")
+
+    def _expire(self):
+        with self.lock:
+            for key in [key for key, allocation in self.allocations.items() if not allocation.active]:
+                self.removed.append(self.allocations.pop(key))
+            for allocation in self.allocations.values():
+                allocation.active = False
+
+    def serve(self, stop_event:threading.Event):
+        """Forward until `stop_event` is set. Blocks the calling thread."""
+        log.info("Relay started")
+        next_expire = time.monotonic() + IDLE_TIMEOUT
+        try:
+            while not stop_event.is_set():
+                for key, _ in self.selector.select(SELECT_TIMEOUT):
+                    if key.data is None:
+                        try:
+                            self.wakeup_r.recv(4096)
+                        except BlockingIOError:
+                            pass
+                    else:
+                        self._drain(key.data)
+                if time.monotonic() >= next_expire:
+                    self._expire()
+                    next_expire += IDLE_TIMEOUT
+                self._apply_changes()
+        finally:
+            with self.lock:
+                self.removed.extend(self.allocations.values())
+                self.allocations.clear()
+            self._apply_changes()
+            self.selector.close()
+            self.wakeup_r.close()
+            self.wakeup_w.close()
+            log.info("Relay stopped")
@@ -0,0 +1,254 @@
+import os
+import time
+import socket
+import struct
+import asyncio
+import threading
+
+from app.core.registry import ChannelRegistry
+from app.core.sqlite_registry import SQLiteRegistry
+from app.core.notifier import MemberNotifier, NOTIFY_ACK, RETRANSMIT_INTERVAL
+from app.core.relay import RelayEngine, RELAY_REQUEST, RELAY_REQUEST_HEADER, RELAY_ALLOCATED, RELAY_ALLOCATED_HEADER
+from app.core.sfu import SFUEngine, SFU_REQUEST, SFU_REQUEST_HEADER, SFU_ALLOCATED, SFU_ALLOCATED_HEADER
+from app.utils.logger import setup_logger
+from app.utils.metrics import Counter
+from app.utils.timing_wheel import TimingWheel
+
+
+log = setup_logger(__name__)
+
+JOIN_HEADER = struct.Struct(">II") # channel_id, username length, followed by the username
+LAN_CANDIDATE = struct.Struct(">4sH") # optional after the username: the client's LAN ip and port
+JOIN_OK = b"hello"
+JOIN_FAILED = b"Failed to add member"
+CHANNEL_NOT_FOUND = b"Channel not found"
+
+# Join packets start with a channel ID below 2**24, so their first byte is always 0.
+# Any other first byte is a control packet type.
+KEEPALIVE = 0x81
+KEEPALIVE_HEADER = struct.Struct(">BI") # type, channel_id, followed by the username
+# Clock sync, NTP-style. Requests are padded to the reply size, so answering never amplifies.
+TIME_REQUEST = 0x8B
+TIME_REQUEST_HEADER = struct.Struct(">BId") # type, seq, client send time
+TIME_REPLY = 0x8C
+TIME_REPLY_HEADER = struct.Struct(">BIddd") # type, seq, client send time, server receive time, server send time
+
+JOIN_PACKETS = Counter("p2pvc_rendezvous_join_packets_total", "UDP join packets received")
+JOIN_RESULTS = Counter("p2pvc_rendezvous_joins_total", "UDP joins by result", ("result",))
+JOIN_FAILURE_REASONS = {"Channel not found": "channel_not_found", "Member already exists": "member_exists"}
+
+MEMBER_TTL = 15 # seconds without a keepalive before a member is dropped
+PRESENCE_TICK = 1 # seconds
+
+class RendezvousProtocol(asyncio.DatagramProtocol):
+    def __init__(self, engine:"RendezvousEngine", shard:int):
+        self.engine = engine
+        self.shard = shard
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data:bytes, addr:tuple):
+        self.engine.handle(data, addr, self.transport)
+
+    def error_received(self, exc:Exception):
+        log.warning(f"Rendezvous shard {self.shard} socket error: {exc}")
+
+class RendezvousEngine:
+    """UDP rendezvous: records each member's public address from their join packet.
+
+    With shards > 1 every shard gets its own SO_REUSEPORT socket on the same port
+    and its own event loop thread, and the kernel spreads clients across them.
+    Members have to keep sending keepalives; the ones that go quiet for
+    MEMBER_TTL seconds are removed as if they had left. Membership changes are
+    pushed to the members through MemberNotifier from shard 0. With a relay,
+    members can ask for a relay port to a peer they cannot punch through to,
+    with an SFU members of big channels can subscribe to it.
+    """
+    def __init__(self, channels:ChannelRegistry|SQLiteRegistry, host:str="0.0.0.0", port:int=0, shards:int=1,
+                 relay:RelayEngine|None=None, sfu:SFUEngine|None=None):
+        self.channels = channels
+        self.presence = TimingWheel(int(MEMBER_TTL / PRESENCE_TICK))
+        self.notifier = MemberNotifier()
+        channels.add_listener(self.notifier.on_change)
+        self.relay = relay
+        if relay is not None:
+            channels.add_listener(relay.on_change)
+        self.sfu = sfu
+        if sfu is not None:
+            channels.add_listener(sfu.on_change)
+        self.host = host
+        if shards > 1 and not hasattr(socket, "SO_REUSEPORT"):
+            log.warning("SO_REUSEPORT is not supported on this platform, using a single rendezvous socket")
+            shards = 1
+        self.shards = shards
+        self.sockets = [self._bind(port)]
+        self.port = self.sockets[0].getsockname()[1]
+        for _ in range(shards - 1):
+            self.sockets.append(self._bind(self.port))
+
+    def _bind(self, port:int) -> socket.socket:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        if self.shards > 1:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        sock.bind((self.host, port))
+        sock.setblocking(False)
+        return sock
+
+    def handle(self, data:bytes, addr:tuple, transport:asyncio.DatagramTransport):
+        if data and data[0] == TIME_REQUEST:
+            self.handle_time_request(data, addr, transport, time.time())
+            return
+        if data and data[0] == KEEPALIVE:
+            self.handle_keepalive(data, addr)
+            return
+        if data and data[0] == NOTIFY_ACK:
+            self.notifier.handle_ack(data, addr)
+            return
+        if data and data[0] == RELAY_REQUEST:
+            self.handle_relay_request(data, addr, transport)
+            return
+        if data and data[0] == SFU_REQUEST:
+            self.handle_sfu_request(data, addr, transport)
+            return
+        JOIN_PACKETS.inc()
+        if len(data) < JOIN_HEADER.size:
+            log.debug(f"Dropped short packet from {addr}")
+            JOIN_RESULTS.inc("short_packet")
+            return
+        channel_id, username_length = JOIN_HEADER.unpack_from(data)
+        end = JOIN_HEADER.size + username_length
+        try:
+            name = data[JOIN_HEADER.size:end].decode('utf-8')
+        except UnicodeDecodeError:
+            log.debug(f"Dropped join packet with invalid username from {addr}")
+            JOIN_RESULTS.inc("invalid_username")
+            return
+        if not name:
+            JOIN_RESULTS.inc("invalid_username")
+            return
+        lan_ip = lan_port = None
+        if len(data) >= end + LAN_CANDIDATE.size:
+            packed_ip, lan_port = LAN_CANDIDATE.unpack_from(data, end)
+            lan_ip = socket.inet_ntoa(packed_ip)
+        ip, port = addr
+        log.debug(f"Received Join request from {name} for channel {channel_id} with IP {ip} and port {port}, LAN {lan_ip}:{lan_port}")
+
+        status = self.channels.join(channel_id, name, ip, port, lan_ip, lan_port)
+        JOIN_RESULTS.inc(JOIN_FAILURE_REASONS.get(status, "other") if status is not None else "ok")
+        if status is None:
+            self.presence.touch((channel_id, name))
+            transport.sendto(JOIN_OK, addr)
+        elif status == "Channel not found":
+            transport.sendto(CHANNEL_NOT_FOUND, addr)
+        else:
+            log.error(f"Failed to add member {name} to channel {channel_id}: {status}")
+            transport.sendto(JOIN_FAILED, addr)
+
+    def handle_time_request(self, data:bytes, addr:tuple, transport:asyncio.DatagramTransport, received:float):
+        if len(data) < TIME_REPLY_HEADER.size:
+            return
+        _, seq, client_time = TIME_REQUEST_HEADER.unpack_from(data)
+        transport.sendto(TIME_REPLY_HEADER.pack(TIME_REPLY, seq, client_time, received, time.time()), addr)
+
+    def handle_keepalive(self, data:bytes, addr:tuple):
+        if len(data) <= KEEPALIVE_HEADER.size:
+            return
+        _, channel_id = KEEPALIVE_HEADER.unpack_from(data)
+        name = data[KEEPALIVE_HEADER.size:].decode('utf-8', errors='replace')
+        member = self.channels.get_member(channel_id, name)
+        # Only the address that joined can keep a member alive
+        if member is None or (member.ip, member.port) != addr:
+            return
+        self.presence.touch((channel_id, name))
+
+    def handle_relay_request(self, data:bytes, addr:tuple, transport:asyncio.DatagramTransport):
+        if self.relay is None or len(data) <= RELAY_REQUEST_HEADER.size:
+            return
+        _, channel_id, name_length = RELAY_REQUEST_HEADER.unpack_from(data)
+        name = data[RELAY_REQUEST_HEADER.size:RELAY_REQUEST_HEADER.size + name_length].decode('utf-8', errors='replace')
+        peer = data[RELAY_REQUEST_HEADER.size + name_length:].decode('utf-8', errors='replace')
+        member = self.channels.get_member(channel_id, name)
+        # Only joined members get relay ports, and only to other members
+        if member is None or (member.ip, member.port) != addr or not peer or peer == name:
+            return
+        if self.channels.get_member(channel_id, peer) is None:
+            return
+        allocation = self.relay.allocate(channel_id, name, peer)
+        if allocation is None:
+            return
+        port, token = allocation
+        transport.sendto(RELAY_ALLOCATED_HEADER.pack(RELAY_ALLOCATED, channel_id, port, token) + peer.encode('utf-8'), addr)
+
+    def handle_sfu_request(self, data:bytes, addr:tuple, transport:asyncio.DatagramTransport):
+        if self.sfu is None or len(data) <= SFU_REQUEST_HEADER.size:
+            return
+        _, channel_id, name_length = SFU_REQUEST_HEADER.unpack_from(data)
+        name = data[SFU_REQUEST_HEADER.size:SFU_REQUEST_HEADER.size + name_length].decode('utf-8', errors='replace')
+        member = self.channels.get_member(channel_id, name)
+        if member is None or (member.ip, member.port) != addr:
+            return
+        token = self.sfu.subscribe(channel_id, name)
+        transport.sendto(SFU_ALLOCATED_HEADER.pack(SFU_ALLOCATED, channel_id, self.sfu.port, token), addr)
+
+    def expire_members(self):
+        for channel_id, name in self.presence.tick():
+            status = self.channels.leave(channel_id, name)
+            if status is None:
+                log.info(f"Member {name} timed out in channel {channel_id}")
+            else:
+                # Left over HTTP through another worker, or the channel was deleted: nothing to expire
+                log.debug(f"Member {name} of channel {channel_id} already gone: {status}")
+
+    def receive_queues(self) -> dict[int, int]|None:
+        """{shard: bytes waiting in its socket receive queue}, from /proc/net/udp (Linux only)."""
+        try:
+            inodes = {os.fstat(sock.fileno()).st_ino: shard for shard, sock in enumerate(self.sockets)}
+            with open("/proc/net/udp") as f:
+                lines = f.readlines()[1:]
+        except OSError:
+            return None
+        queues = {}
+        for line in lines:
+            fields = line.split()
+            shard = inodes.get(int(fields[9]))
+            if shard is not None:
+                queues[shard] = int(fields[4].split(":")[1], 16) # tx_queue:rx_queue
+        return queues
+
+    async def _serve_shard(self, shard:int, stop_event:threading.Event):
+        loop = asyncio.get_running_loop()
+        transport, _ = await loop.create_datagram_endpoint(lambda: RendezvousProtocol(self, shard), sock=self.sockets[shard])
+        if shard == 0:
+            self.notifier.attach(loop, transport)
+        try:
+            next_tick = loop.time() + PRESENCE_TICK
+            while not stop_event.is_set():
+                await asyncio.sleep(RETRANSMIT_INTERVAL)
+                if shard != 0:
+                    continue
+                self.channels.poll()
+                self.notifier.retransmit()
+                if loop.time() >= next_tick:
+                    self.expire_members()
+                    next_tick += PRESENCE_TICK
+        finally:
+            transport.close()
+
+    def _run_shard(self, shard:int, stop_event:threading.Event):
+        try:
+            asyncio.run(self._serve_shard(shard, stop_event))
+        except:
+            log.exception(f"Error in rendezvous shard {shard}")
+
+    def serve(self, stop_event:threading.Event):
+        """Run every shard until `stop_event` is set. Blocks the calling thread."""
+        threads = [threading.Thread(target=self._run_shard, args=(shard, stop_event), daemon=True) for shard in range(1, self.shards)]
+        for thread in threads:
+            thread.start()
+        log.info(f"Rendezvous listener started on port {self.port} with {self.shards} shard(s)")
+        self._run_shard(0, stop_event)
+        for thread in threads:
+            thread.join()
+        log.info("Rendezvous listener stopped")
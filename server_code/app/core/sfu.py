@@ -0,0 +1,170 @@
+import os
+import struct
+import socket
+import threading
+import selectors
+
+from app.utils.channel import Channel
+from app.utils.logger import setup_logger
+
+
+log = setup_logger(__name__)
+
+# Sent to the rendezvous socket once a channel is big enough for SFU mode.
+# type, channel_id, username length, followed by the username
+SFU_REQUEST = 0x87
+SFU_REQUEST_HEADER = struct.Struct(">BIB")
+# Reply: type, channel_id, SFU port, token
+SFU_ALLOCATED = 0x88
+SFU_ALLOCATED_HEADER = struct.Struct(">BIH8s")
+# Sent to the SFU port every second while in SFU mode, tells it our address and keeps the NAT mapping open
+SFU_BIND = 0x89
+SFU_BIND_HEADER = struct.Struct(">B8s") # type, token
+# Every forwarded datagram: type, sender slot, followed by the sender's datagram unchanged
+SFU_MEDIA = 0x8A
+SFU_MEDIA_HEADER = struct.Struct(">BH")
+
+BUFFER_SIZE = 65535
+BATCH = 256 # datagrams drained before checking for new subscribers
+SELECT_TIMEOUT = 0.5
+
+class Subscriber:
+    __slots__ = ("channel_id", "name", "slot", "addr")
+
+    def __init__(self, channel_id:int, name:str, slot:int):
+        self.channel_id = channel_id
+        self.name = name
+        self.slot = slot
+        self.addr:tuple|None = None
+
+class SFUEngine:
+    """Selective forwarding for big channels: one upload per client, fanned out here.
+
+    Every client of a channel in SFU mode sends its audio once to the SFU port.
+    The SFU forwards each datagram to every other subscriber of the channel,
+    prefixed with SFU_MEDIA and the sender's slot so receivers can still tell
+    speakers apart. All channels share one socket, so only one port has to be
+    reachable.
+
+    Subscriptions are made through the rendezvous socket (SFU_REQUEST), so only
+    joined members get a token. Receiving goes into a preallocated buffer just
+    behind room for the header, so forwarding never copies the payload.
+    """
+    def __init__(self, host:str="0.0.0.0", port:int=0):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 << 20)
+        self.sock.bind((host, port))
+        self.sock.setblocking(False)
+        self.port = self.sock.getsockname()[1]
+        self.lock = threading.Lock()
+        self.tokens:dict[bytes, Subscriber] = {}
+        self.members:dict[tuple, bytes] = {} # (channel_id, name) -> token
+        self.by_addr:dict[tuple, Subscriber] = {}
+        self.fanout:dict[int, list[tuple]] = {} # channel_id -> addresses of bound subscribers
+        self.next_slot:dict[int, int] = {}
+        self.buffer = bytearray(BUFFER_SIZE)
+        self.view = memoryview(self.buffer)
+        self.received = 0
+        self.forwarded = 0
+        self.dropped = 0
+
+    def subscribe(self, channel_id:int, name:str) -> bytes:
+        """Bind token for `name`, the same one on every request."""
+        with self.lock:
+            token = self.members.get((channel_id, name))
+            if token is None:
+                token = os.urandom(8)
+                slot = self.next_slot.get(channel_id, 0)
+                self.next_slot[channel_id] = (slot + 1) & 0xFFFF
+                self.tokens[token] = Subscriber(channel_id, name, slot)
+                self.members[(channel_id, name)] = token
+                log.info(f"{name} subscribed to the SFU in channel {channel_id}")
+            return token
+
+    def unsubscribe(self, channel_id:int, name:str):
+        with self.lock:
+            token = self.members.pop((channel_id, name), None)
+            if token is None:
+                return
+            subscriber = self.tokens.pop(token)
+            if subscriber.addr is not None:
+                del self.by_addr[subscriber.addr]
+                self._rebuild(channel_id)
+            if channel_id not in self.fanout and not any(key[0] == channel_id for key in self.members):
+                self.next_slot.pop(channel_id, None)
+
+    def on_change(self, channel:Channel, event:dict):
+        """Channel listener, called with the channel lock held."""
+        if event["type"] == "leave":
+            self.unsubscribe(channel.id, event["member"]["name"])
+
+    def subscribers(self, channel_id:int) -> int:
+        return len(self.fanout.get(channel_id, ()))
+
+    def _rebuild(self, channel_id:int):
+        # Caller holds self.lock. Readers get a new list, never a half updated one.
+        addrs = [s.addr for s in self.by_addr.values() if s.channel_id == channel_id]
+        if addrs:
+            self.fanout[channel_id] = addrs
+        else:
+            self.fanout.pop(channel_id, None)
+
+    def _bind(self, token:bytes, addr:tuple):
+        with self.lock:
+            subscriber = self.tokens.get(token)
+            if subscriber is None or subscriber.addr == addr:
+                return
+            if subscriber.addr is not None:
+                del self.by_addr[subscriber.addr]
+            subscriber.addr = addr
+            self.by_addr[addr] = subscriber
+            self._rebuild(subscriber.channel_id)
+
+    def _drain(self):
+        sock = self.sock
+        buffer = self.buffer
+        view = self.view
+        payload = view[SFU_MEDIA_HEADER.size:]
+        received = forwarded = dropped = 0
+        for _ in range(BATCH):
+            try:
+                size, addr = sock.recvfrom_into(payload)
+            except (BlockingIOError, InterruptedError):
+                break
+            except OSError:
+                continue # ICMP errors from a previous send show up here
+            received += 1
+            if size == SFU_BIND_HEADER.size and payload[0] == SFU_BIND:
+                self._bind(bytes(payload[1:size]), addr)
+                continue
+            sender = self.by_addr.get(addr)
+            if sender is None:
+                dropped += 1
+                continue
+            SFU_MEDIA_HEADER.pack_into(buffer, 0, SFU_MEDIA, sender.slot)
+            packet = view[:SFU_MEDIA_HEADER.size + size]
+            for target in self.fanout.get(sender.channel_id, ()):
+                if target == addr:
+                    continue
+                try:
+                    sock.sendto(packet, target)
+                    forwarded += 1
+                except OSError:
+                    dropped += 1 # Send buffer full, drop it like the network would
+        self.received += received
+        self.forwarded += forwarded
+        self.dropped += dropped
+
+    def serve(self, stop_event:threading.Event):
+        """Forward until `stop_event` is set. Blocks the calling thread."""
+        log.info(f"SFU started on port {self.port}")
+        selector = selectors.DefaultSelector()
+        selector.register(self.sock, selectors.EVENT_READ)
+        try:
+            while not stop_event.is_set():
+                if selector.select(SELECT_TIMEOUT):
+                    self._drain()
+        finally:
+            selector.close()
+            self.sock.close()
+            log.info("SFU stopped")
@@ -0,0 +1,367 @@
+import os
+import time
+import random
+import sqlite3
+import threading
+
+from app.core.registry import CHANNEL_ID_MIN, CHANNEL_ID_MAX
+from app.utils.channel import Channel, Member, EVENT_LOG_SIZE
+from app.utils.logger import setup_logger
+
+
+log = setup_logger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS channels (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    description TEXT NOT NULL,
+    author TEXT NOT NULL,
+    timestamp REAL NOT NULL,
+    created_at TEXT NOT NULL,
+    version INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS channels_name ON channels (lower(name), id);
+CREATE INDEX IF NOT EXISTS channels_author ON channels (lower(author), id);
+CREATE TABLE IF NOT EXISTS members (
+    channel_id INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    ip TEXT NOT NULL,
+    port INTEGER NOT NULL,
+    lan_ip TEXT,
+    lan_port INTEGER,
+    PRIMARY KEY (channel_id, name)
+);
+CREATE INDEX IF NOT EXISTS members_ip ON members (channel_id, ip);
+DROP TABLE IF EXISTS lan_members;
+CREATE TABLE IF NOT EXISTS events (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    channel_id INTEGER NOT NULL,
+    version INTEGER NOT NULL,
+    type TEXT NOT NULL,
+    name TEXT NOT NULL,
+    ip TEXT NOT NULL,
+    port INTEGER NOT NULL,
+    lan_ip TEXT,
+    lan_port INTEGER
+);
+CREATE INDEX IF NOT EXISTS events_channel ON events (channel_id, version);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+WAIT_INTERVAL = 0.05 # seconds between the watcher's checks for new events, only while someone waits
+EVENT_RETENTION = 100000 # events kept in the table for listeners and /members?since=
+
+class SQLiteRegistry:
+    """Multi-process state backend on a local SQLite database in WAL mode.
+
+    Same methods as ChannelRegistry, so gunicorn workers and the rendezvous
+    process can share channels and members. Every thread gets its
+    own connection. Channels returned by get()/all() are read-only snapshots.
+    Listeners run from poll(), which the rendezvous engine calls on its tick,
+    so membership changes made by any worker reach them.
+    """
+    def __init__(self, path:str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.local = threading.local()
+        self.listeners = []
+        self.last_event = None
+        # One watcher thread per process polls the events table for everyone waiting in wait_for_change()
+        self.changed = threading.Condition()
+        self.waiters = 0
+        self.bumps:dict[int, int] = {} # channel_id -> changes the watcher has seen
+        self.generation = 0 # channels the watcher has seen created or deleted
+        self.watcher:threading.Thread|None = None
+        self.watched_event = 0
+        self.watched_generation = None
+        self._migrate()
+        self.conn.executescript(SCHEMA)
+
+    def _migrate(self):
+        # Databases from before LAN candidates were stored on the member
+        for table in ("members", "events"):
+            columns = {row[1] for row in self.conn.execute(f"PRAGMA table_info({table})")}
+            if columns and "lan_ip" not in columns:
+                self.conn.execute(f"ALTER TABLE {table} ADD COLUMN lan_ip TEXT")
+                self.conn.execute(f"ALTER TABLE {table} ADD COLUMN lan_port INTEGER")
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+        return conn
+
+    def close(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self.local.conn = None
+
+    def save(self):
+        # Every write is already durable
+        pass
+
+    def add_listener(self, listener):
+        """Call listener(channel, event) for every membership change seen by poll()."""
+        self.listeners.append(listener)
+
+    def poll(self):
+        """Hand membership changes made by any process since the last poll to the listeners."""
+        if self.last_event is None:
+            self.last_event = self.conn.execute("SELECT COALESCE(MAX(seq), 0) FROM events").fetchone()[0]
+            return
+        rows = self.conn.execute("SELECT seq, channel_id, version, type, name, ip, port, lan_ip, lan_port FROM events WHERE seq > ? ORDER BY seq", (self.last_event,)).fetchall()
+        if not rows:
+            return
+        channels = {}
+        for seq, channel_id, version, event_type, *member in rows:
+            if channel_id not in channels:
+                channels[channel_id] = self.get(channel_id)
+            channel = channels[channel_id]
+            if channel is not None:
+                event = {"version": version, "type": event_type, "member": Member(*member).to_dict()}
+                for listener in self.listeners:
+                    listener(channel, event)
+            self.last_event = seq
+        self.conn.execute("DELETE FROM events WHERE seq <= ?", (self.last_event - EVENT_RETENTION,))
+
+    def reset_members(self):
+        """Members are ephemeral, drop the ones left over from the previous run."""
+        with self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")
+            # Bump the versions so long-polls and ETags from the previous run see the change
+            self.conn.execute("UPDATE channels SET version = version + 1 WHERE id IN (SELECT channel_id FROM members)")
+            self.conn.execute("DELETE FROM members")
+
+    def set_meta(self, key:str, value:str):
+        self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def get_meta(self, key:str) -> str|None:
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def __contains__(self, channel_id:int) -> bool:
+        return self.conn.execute("SELECT 1 FROM channels WHERE id = ?", (channel_id,)).fetchone() is not None
+
+    def __len__(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM channels").fetchone()[0]
+
+    def _bump_generation(self):
+        # Caller holds a write transaction
+        self.conn.execute("INSERT INTO meta (key, value) VALUES ('generation', '1') ON CONFLICT (key) DO UPDATE SET value = CAST(value AS INTEGER) + 1")
+
+    def etag(self, channel_id:int) -> str|None:
+        """Changes whenever the channel or its members change, None if there is no such channel."""
+        row = self.conn.execute("SELECT timestamp, version FROM channels WHERE id = ?", (channel_id,)).fetchone()
+        return f"{row[0]}-{row[1]}" if row else None
+
+    def list_etag(self) -> str:
+        return self.get_meta("generation") or "0"
+
+    def member_count(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM members").fetchone()[0]
+
+    def get(self, channel_id:int) -> Channel|None:
+        row = self.conn.execute("SELECT id, name, description, author, timestamp, created_at, version FROM channels WHERE id = ?", (channel_id,)).fetchone()
+        if row is None:
+            return None
+        channel = Channel(*row[:6])
+        channel.version = row[6]
+        for member in self.members(channel_id):
+            channel.members[member.name] = member
+        return channel
+
+    def all(self) -> list[Channel]:
+        rows = self.conn.execute("SELECT id, name, description, author, timestamp, created_at FROM channels ORDER BY id").fetchall()
+        return [Channel(*row) for row in rows]
+
+    def page(self, limit:int, cursor:tuple|None=None, name:str="", author:str="") -> tuple[list[Channel], tuple|None]:
+        # Range scans over the primary key or the channels_name / channels_author indexes
+        columns = "id, name, description, author, timestamp, created_at"
+        if not name and not author:
+            query = f"SELECT {columns}, '' FROM channels WHERE id > ? ORDER BY id LIMIT ?"
+            params = [cursor[1] if cursor else -1]
+        else:
+            key, prefix = ("lower(name)", name) if name else ("lower(author)", author)
+            query = f"SELECT {columns}, {key} FROM channels WHERE {key} >= lower(?) AND {key} < lower(?) || char(1114111)"
+            params = [prefix, prefix]
+            if cursor is not None:
+                query += f" AND ({key}, id) > (?, ?)"
+                params += cursor
+            if name and author:
+                query += " AND substr(lower(author), 1, length(?)) = lower(?)"
+                params += [author, author]
+            query += f" ORDER BY {key}, id LIMIT ?"
+        rows = self.conn.execute(query, (*params, limit + 1)).fetchall()
+        next_cursor = (rows[limit - 1][6], rows[limit - 1][0]) if len(rows) > limit else None
+        return [Channel(*row[:6]) for row in rows[:limit]], next_cursor
+
+    def members(self, channel_id:int) -> list[Member]|None:
+        rows = self.conn.execute("SELECT name, ip, port, lan_ip, lan_port FROM members WHERE channel_id = ?", (channel_id,)).fetchall()
+        if not rows and channel_id not in self:
+            return None
+        return [Member(*row) for row in rows]
+
+    def get_member(self, channel_id:int, name:str) -> Member|None:
+        row = self.conn.execute("SELECT name, ip, port, lan_ip, lan_port FROM members WHERE channel_id = ? AND name = ?", (channel_id, name)).fetchone()
+        return Member(*row) if row else None
+
+    def _version(self, channel_id:int) -> int|None:
+        row = self.conn.execute("SELECT version FROM channels WHERE id = ?", (channel_id,)).fetchone()
+        return row[0] if row else None
+
+    def changes_since(self, channel_id:int, since:int) -> dict|None:
+        with self.conn:
+            self.conn.execute("BEGIN")
+            version = self._version(channel_id)
+            if version is None:
+                return None
+            if since < version:
+                rows = self.conn.execute("SELECT version, type, name, ip, port, lan_ip, lan_port FROM events WHERE channel_id = ? AND version > ? ORDER BY version LIMIT ?", (channel_id, since, EVENT_LOG_SIZE)).fetchall()
+                if rows and rows[0][0] == since + 1 and rows[-1][0] == version:
+                    events = [{"version": v, "type": t, "member": Member(*member).to_dict()} for v, t, *member in rows]
+                    return {"version": version, "reset": False, "events": events}
+            elif since == version:
+                return {"version": version, "reset": False, "events": []}
+            members = [member.to_dict() for member in self.members(channel_id) or []]
+            return {"version": version, "reset": True, "members": members}
+
+    def wait_for_change(self, channel_id:int, since:int, timeout:float) -> bool:
+        """Block until the channel version moves past `since`, the channel is gone or `timeout` runs out.
+
+        Waiters do not query the database themselves: the process's watcher
+        thread looks for new events and wakes the ones whose channel changed.
+        """
+        deadline = time.monotonic() + timeout
+        with self.changed:
+            if self.watcher is None:
+                self._start_watcher()
+            # Taken before the version check, so a change right after it still wakes us
+            seen, generation = self.bumps.get(channel_id, 0), self.generation
+            self.waiters += 1
+            self.changed.notify_all() # The watcher idles while nobody waits
+        try:
+            version = self._version(channel_id)
+            if version is None or version != since:
+                return True
+            with self.changed:
+                while self.bumps.get(channel_id, 0) == seen and self.generation == generation:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return False
+                    self.changed.wait(remaining)
+        finally:
+            with self.changed:
+                self.waiters -= 1
+        version = self._version(channel_id)
+        return version is None or version != since
+
+    def _start_watcher(self):
+        # Caller holds self.changed. The baseline is read here so nothing committed from now on is missed
+        self.watched_event = self.conn.execute("SELECT COALESCE(MAX(seq), 0) FROM events").fetchone()[0]
+        self.watched_generation = self.get_meta("generation")
+        self.watcher = threading.Thread(target=self._watch, name="sqlite-watcher", daemon=True)
+        self.watcher.start()
+
+    def _watch(self):
+        while True:
+            with self.changed:
+                while not self.waiters:
+                    self.changed.wait()
+            time.sleep(WAIT_INTERVAL)
+            rows = self.conn.execute("SELECT seq, channel_id FROM events WHERE seq > ?", (self.watched_event,)).fetchall()
+            generation = self.get_meta("generation")
+            if not rows and generation == self.watched_generation:
+                continue
+            with self.changed:
+                for seq, channel_id in rows:
+                    self.bumps[channel_id] = self.bumps.get(channel_id, 0) + 1
+                    self.watched_event = max(self.watched_event, seq)
+                if generation != self.watched_generation:
+                    # A channel was created or deleted, its waiters find out which from their own version
+                    self.watched_generation = generation
+                    self.generation += 1
+                self.changed.notify_all()
+
+    def create(self, name:str, description:str, author:str, channel_id:int|None=None) -> Channel:
+        if channel_id is not None and not CHANNEL_ID_MIN <= channel_id <= CHANNEL_ID_MAX:
+            channel_id = None
+        while True:
+            if channel_id is None:
+                channel_id = random.randint(CHANNEL_ID_MIN, CHANNEL_ID_MAX)
+            channel = Channel(channel_id, name, description, author)
+            try:
+                with self.conn:
+                    self.conn.execute("BEGIN IMMEDIATE")
+                    self.conn.execute("INSERT INTO channels (id, name, description, author, timestamp, created_at) VALUES (?, ?, ?, ?, ?, ?)", channel.to_record())
+                    self._bump_generation()
+            except sqlite3.IntegrityError:
+                if len(self) > CHANNEL_ID_MAX - CHANNEL_ID_MIN:
+                    raise RuntimeError("No channel ID available")
+                channel_id = None
+                continue
+            log.info(f"Channel {channel_id} created by {author}")
+            return channel
+
+    def delete(self, channel_id:int) -> bool:
+        with self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")
+            deleted = self.conn.execute("DELETE FROM channels WHERE id = ?", (channel_id,)).rowcount
+            self.conn.execute("DELETE FROM members WHERE channel_id = ?", (channel_id,))
+            self.conn.execute("DELETE FROM events WHERE channel_id = ?", (channel_id,))
+            if deleted:
+                self._bump_generation()
+        if not deleted:
+            return False
+        log.info(f"Channel {channel_id} deleted")
+        return True
+
+    def _record(self, channel_id:int, event_type:str, member:Member):
+        # Caller holds a write transaction
+        self.conn.execute("UPDATE channels SET version = version + 1 WHERE id = ?", (channel_id,))
+        version = self._version(channel_id)
+        self.conn.execute("INSERT INTO events (channel_id, version, type, name, ip, port, lan_ip, lan_port) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                          (channel_id, version, event_type, member.name, member.ip, member.port, member.lan_ip, member.lan_port))
+
+    def join(self, channel_id:int, name:str, ip:str, port:int, lan_ip:str|None=None, lan_port:int|None=None) -> None|str:
+        member = Member(name, ip, port, lan_ip, lan_port)
+        with self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")
+            if channel_id not in self:
+                return "Channel not found"
+            try:
+                self.conn.execute("INSERT INTO members (channel_id, name, ip, port, lan_ip, lan_port) VALUES (?, ?, ?, ?, ?, ?)", (channel_id, name, ip, port, lan_ip, lan_port))
+            except sqlite3.IntegrityError:
+                log.error(f"Member {name} already exists in the channel.")
+                return "Member already exists"
+            self._record(channel_id, "join", member)
+
+    def leave(self, channel_id:int, name:str) -> None|str:
+        with self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")
+            if channel_id not in self:
+                return "Channel not found"
+            member = self.get_member(channel_id, name)
+            if member is None:
+                log.debug(f"Member {name} not found in the channel.") # Already gone, e.g. left over HTTP before timing out
+                return "Member not found"
+            self.conn.execute("DELETE FROM members WHERE channel_id = ? AND name = ?", (channel_id, name))
+            self._record(channel_id, "leave", member)
+        log.info(f"Member {name} removed from the channel.")
+
+    def same_nat(self, channel_id:int, ip:str) -> list[Member]|None:
+        """Members of the channel behind the public address `ip`."""
+        rows = self.conn.execute("SELECT name, ip, port, lan_ip, lan_port FROM members WHERE channel_id = ? AND ip = ?", (channel_id, ip)).fetchall()
+        if not rows and channel_id not in self:
+            return None
+        return [Member(*row) for row in rows]
@@ -1,53 +1,128 @@
 from app.utils.logger import setup_logger, INFO
 import datetime
+import threading
+from collections import deque
 
 log = setup_logger(__name__, INFO)
 
+EVENT_LOG_SIZE = 256 # Membership deltas kept per channel for /members?since=
+
 class Member:
-    def __init__(self, name: str, ip: str, port: int):
+    __slots__ = ("name", "ip", "port", "lan_ip", "lan_port")
+
+    def __init__(self, name: str, ip: str, port: int, lan_ip: str|None = None, lan_port: int|None = None):
         self.name = name
-        self.ip = ip
+        self.ip = ip # Public address seen by the rendezvous server
         self.port = port
-    
+        self.lan_ip = lan_ip # Host candidate sent with the join, used by peers behind the same NAT
+        self.lan_port = lan_port
+
     def get_user(self):
-        log.info(f"Getting user's info: {self.name} ({self.ip}:{self.port})")
         return f"{self.name} ({self.ip}:{self.port})"
 
+    def to_dict(self) -> dict:
+        return {"name": self.name, "ip": self.ip, "port": self.port, "lan_ip": self.lan_ip, "lan_port": self.lan_port}
+
 class Channel:
-    def __init__(self, channel_id: int, name: str, description: str, author: str):
+    __slots__ = ("id", "name", "description", "author", "members", "by_ip", "timestamp", "created_at", "lock",
+                 "changed", "version", "events", "closed", "listener")
+
+    def __init__(self, channel_id: int, name: str, description: str, author: str, timestamp: float|None = None, created_at: str|None = None):
         self.id = channel_id
         self.name = name
         self.description = description
         self.author = author
-        self.members:list[Member] = []
-        self.timestamp = datetime.datetime.now().timestamp()
-        self.created_at = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        self.members:dict[str, Member] = {}
+        self.by_ip:dict[str, dict[str, Member]] = {} # {public ip: {name: Member}}, members behind the same NAT
+        if timestamp is None:
+            now = datetime.datetime.now()
+            timestamp = now.timestamp()
+            created_at = now.strftime("%Y-%m-%d %H:%M:%S")
+        self.timestamp = timestamp
+        self.created_at = created_at
+        self.lock = threading.Lock()
+        self.changed:threading.Condition|None = None # Created by the first long-poll, idle channels never need one
+        self.version = 0
+        self.events:deque[dict] = deque(maxlen=EVENT_LOG_SIZE) # [{version: int, type: "join"|"leave", member: dict}]
+        self.closed = False
+        self.listener = None # listener(channel, event), called with self.lock held
+
+    def _record(self, event_type: str, member: Member):
+        # Caller holds self.lock
+        self.version += 1
+        event = {"version": self.version, "type": event_type, "member": member.to_dict()}
+        self.events.append(event)
+        if self.changed is not None:
+            self.changed.notify_all()
+        if self.listener is not None:
+            self.listener(self, event)
 
-    def add_member(self, name: str, ip: str, port: int) -> None|str:
-        for member in self.members:
-            if name == member.name:
+    def add_member(self, name: str, ip: str, port: int, lan_ip: str|None = None, lan_port: int|None = None) -> None|str:
+        with self.lock:
+            if name in self.members:
                 log.error(f"Member {name} already exists in the channel.")
                 return "Member already exists"
-        member = Member(name, ip, port)
-        self.members.append(member)
+            member = Member(name, ip, port, lan_ip, lan_port)
+            self.members[name] = member
+            self.by_ip.setdefault(ip, {})[name] = member
+            self._record("join", member)
 
     def remove_member(self, name: str):
-        temp = self.members.copy()
-        self.members = [member for member in self.members if member.name != name]
-        if len(temp) == len(self.members):
-            log.error(f"Member {name} not found in the channel.")
-            return "Member not found"
-        else:
-            log.info(f"Member {name} removed from the channel.")
-            return None
-
-class LAN_Member:
-    def __init__(self, name: str, ip: str, lan_ip: str, port: int):
-        self.name = name
-        self.ip = ip
-        self.lan_ip = lan_ip
-        self.port = port
+        with self.lock:
+            member = self.members.pop(name, None)
+            if member is None:
+                log.debug(f"Member {name} not found in the channel.") # Already gone, e.g. left over HTTP before timing out
+                return "Member not found"
+            same_ip = self.by_ip[member.ip]
+            del same_ip[name]
+            if not same_ip:
+                del self.by_ip[member.ip]
+            self._record("leave", member)
+        log.info(f"Member {name} removed from the channel.")
+        return None
 
-    def get_user(self):
-        log.info(f"Getting user's info: {self.name} ({self.ip}:{self.port})")
-        return f"{self.name} {self.ip} ({self.lan_ip}:{self.port})"
\ No newline at end of file
+    def close(self):
+        # Wake up every long-poll waiting on a deleted channel
+        with self.lock:
+            self.closed = True
+            if self.changed is not None:
+                self.changed.notify_all()
+
+    def changes_since(self, since: int) -> dict:
+        """Deltas after `since`, or the full member list if the event log no longer reaches back that far."""
+        with self.lock:
+            if since > self.version or (since < self.version and (not self.events or self.events[0]["version"] > since + 1)):
+                return {"version": self.version, "reset": True, "members": [member.to_dict() for member in self.members.values()]}
+            events = [event for event in self.events if event["version"] > since] if since < self.version else []
+            return {"version": self.version, "reset": False, "events": events}
+
+    def wait_for_change(self, since: int, timeout: float) -> bool:
+        """Block until the version moves past `since`, the channel is deleted or `timeout` runs out."""
+        with self.lock:
+            if self.changed is None:
+                self.changed = threading.Condition(self.lock)
+            return self.changed.wait_for(lambda: self.version != since or self.closed, timeout)
+
+    def member_list(self) -> list[Member]:
+        with self.lock:
+            return list(self.members.values())
+
+    def same_nat(self, ip: str) -> list[Member]:
+        """Members whose public address is `ip`."""
+        with self.lock:
+            return list(self.by_ip.get(ip, {}).values())
+
+    def to_record(self) -> list:
+        """Persistent part of the channel in constructor order, members are left out."""
+        return [self.id, self.name, self.description, self.author, self.timestamp, self.created_at]
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "name": self.name,
+            "description": self.description,
+            "author": self.author,
+            "members": [member.get_user() for member in self.member_list()],
+            "timestamp": self.timestamp,
+            "created_at": self.created_at,
+        }
@@ -0,0 +1,157 @@
+import threading
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+metrics:list = [] # every metric in registration order, rendered by render()
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _labels(names:tuple, values:tuple, extra:str="") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _number(value:float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+class _Sharded(ABC):
+    """Per-thread storage, so the hot path never takes a lock or fights over a cache line.
+
+    Each thread only ever writes its own shard; render() sums the shards. A
+    scrape can miss an increment that is happening at that moment, which is
+    fine for monitoring. Threads that have finished never write again, so
+    their shards are folded into one retired total whenever a thread makes
+    its first shard or a scrape comes in; servers that start a thread per
+    request (Werkzeug under --dev) do not pile up shards.
+
+    The totals are per process: under gunicorn every worker counts on its
+    own, and a scrape shows the counters of whichever worker answered it.
+    """
+    def __init__(self, name:str, documentation:str, labels:tuple=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = labels
+        self.local = threading.local()
+        self.shards:list[tuple[threading.Thread, dict]] = [] # live threads and their shards
+        self.retired:dict = {} # what finished threads counted
+        self.lock = threading.Lock() # Only taken when a thread makes its first shard, and by scrapes
+        metrics.append(self)
+
+    def _shard(self) -> dict:
+        try:
+            return self.local.shard
+        except AttributeError:
+            shard = self.local.shard = {}
+            with self.lock:
+                self._retire()
+                self.shards.append((threading.current_thread(), shard))
+            return shard
+
+    def _retire(self):
+        # Caller holds the lock
+        live = []
+        for thread, shard in self.shards:
+            if thread.is_alive():
+                live.append((thread, shard))
+            else:
+                self._add(self.retired, shard)
+        self.shards = live
+
+    def _totals(self) -> dict:
+        totals = {}
+        with self.lock:
+            self._retire()
+            self._add(totals, self.retired)
+            shards = [shard for _, shard in self.shards]
+        for shard in shards:
+            self._add(totals, shard)
+        return totals
+
+    @staticmethod
+    @abstractmethod
+    def _add(totals:dict, shard:dict):
+        """Add the counts of `shard` into `totals`."""
+
+class Counter(_Sharded):
+    def inc(self, *labels, amount:float=1):
+        shard = self._shard()
+        shard[labels] = shard.get(labels, 0) + amount
+
+    @staticmethod
+    def _add(totals:dict, shard:dict):
+        for labels, value in list(shard.items()):
+            totals[labels] = totals.get(labels, 0) + value
+
+    def collect(self) -> dict[tuple, float]:
+        return self._totals()
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self.collect().items()):
+            lines.append(f"{self.name}{_labels(self.label_names, labels)} {_number(value)}")
+        return lines
+
+class Histogram(_Sharded):
+    def __init__(self, name:str, documentation:str, labels:tuple=(), buckets:tuple=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = buckets
+
+    def observe(self, value:float, *labels):
+        shard = self._shard()
+        counts = shard.get(labels)
+        if counts is None:
+            counts = shard[labels] = [0] * (len(self.buckets) + 2) # one per bucket, +Inf, then the sum
+        counts[bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    @staticmethod
+    def _add(totals:dict, shard:dict):
+        for labels, counts in list(shard.items()):
+            total = totals.setdefault(labels, [0] * len(counts))
+            for i, count in enumerate(counts):
+                total[i] += count
+
+    def render(self) -> list[str]:
+        totals = self._totals()
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for labels, counts in sorted(totals.items()):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += count
+                le = 'le="+Inf"' if bound == "+Inf" else f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, labels)} {_number(counts[-1])}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, labels)} {cumulative}")
+        return lines
+
+class Gauge:
+    """Read at scrape time from `read()`, which returns a number, a {label values: number} dict or None."""
+    def __init__(self, name:str, documentation:str, read, labels:tuple=(), kind:str="gauge"):
+        self.name = name
+        self.documentation = documentation
+        self.read = read
+        self.label_names = labels
+        self.kind = kind # "counter" for totals kept elsewhere, like the relay's packet counts
+        metrics.append(self)
+
+    def render(self) -> list[str]:
+        value = self.read()
+        if value is None:
+            return []
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        values = value if isinstance(value, dict) else {(): value}
+        for labels, number in sorted(values.items()):
+            lines.append(f"{self.name}{_labels(self.label_names, labels)} {_number(number)}")
+        return lines
+
+def render() -> str:
+    """Every metric in the Prometheus text exposition format."""
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,64 @@
+import json
+import threading
+from collections import OrderedDict
+
+from flask import Response, request
+
+MAX_ENTRIES = 1024 # least recently used bodies beyond this are dropped
+
+class ResponseCache:
+    """Serialized JSON bodies, reused for as long as their ETag stays the same.
+
+    One entry per key (e.g. ("members", channel_id)). The backend hands out an
+    ETag that changes on every mutation, so a stale body is simply replaced the
+    next time somebody asks for it. Entries of deleted channels are discarded
+    by the delete routes, and the cache keeps at most `size` entries, dropping
+    the least recently used, for channels deleted where it cannot see (by
+    another worker, or by the rendezvous server).
+    """
+    def __init__(self, size:int=MAX_ENTRIES):
+        self.entries:OrderedDict[tuple, tuple[str, bytes]] = OrderedDict() # {key: (etag, body)}, least recently used first
+        self.size = size
+        self.lock = threading.Lock()
+
+    def get(self, key:tuple, etag:str, build) -> bytes:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] == etag:
+                self.entries.move_to_end(key)
+                return entry[1]
+        body = json.dumps(build(), separators=(",", ":")).encode()
+        with self.lock:
+            self.entries[key] = (etag, body)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+        return body
+
+    def discard(self, *keys:tuple):
+        with self.lock:
+            for key in keys:
+                self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+cache = ResponseCache()
+
+def cached_json(key:tuple|None, etag:str, build) -> Response:
+    """JSON response for `build()` with an ETag, 304 when the client already has it.
+
+    A `key` of None still answers with the ETag but does not keep the body, for
+    responses with too many variants to cache (like search results).
+    """
+    etag = f'"{etag}"'
+    if etag in request.headers.get("If-None-Match", ""):
+        response = Response(status=304)
+    elif key is None:
+        response = Response(json.dumps(build(), separators=(",", ":")), mimetype="application/json")
+    else:
+        response = Response(cache.get(key, etag, build), mimetype="application/json")
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "no-cache"
+    return response
@@ -0,0 +1,48 @@
+import threading
+from typing import Hashable
+
+
+class TimingWheel:
+    """Hashed timing wheel for member TTLs.
+
+    Each key lives in the slot its deadline falls into, so touching a key and
+    advancing the wheel by one tick are both O(1) regardless of how many keys
+    are tracked; a tick only looks at the keys that actually expire.
+    """
+    def __init__(self, ttl_ticks:int):
+        self.ttl_ticks = ttl_ticks
+        self.slots:list[set] = [set() for _ in range(ttl_ticks + 1)]
+        self.index:dict[Hashable, int] = {} # key -> slot
+        self.cursor = 0
+        self.lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def touch(self, key:Hashable):
+        """(Re)arm `key` to expire ttl_ticks ticks from now."""
+        with self.lock:
+            slot = self.index.get(key)
+            if slot is not None:
+                self.slots[slot].discard(key)
+            slot = (self.cursor + self.ttl_ticks) % len(self.slots)
+            self.slots[slot].add(key)
+            self.index[key] = slot
+
+    def remove(self, key:Hashable):
+        with self.lock:
+            slot = self.index.pop(key, None)
+            if slot is not None:
+                self.slots[slot].discard(key)
+
+    def tick(self) -> list:
+        """Advance one tick and return the keys whose TTL ran out."""
+        with self.lock:
+            self.cursor = (self.cursor + 1) % len(self.slots)
+            expired = self.slots[self.cursor]
+            if not expired:
+                return []
+            self.slots[self.cursor] = set()
+            for key in expired:
+                del self.index[key]
+            return list(expired)
@@ -1,94 +1,121 @@
-from flask import Blueprint, jsonify, request
+import json
+import time
+import threading
 
-from app.core import server
+from flask import Blueprint, Response, jsonify, request, stream_with_context
+
+from app.core import server, SFU_THRESHOLD, HELD_REQUESTS
+from app.utils.response_cache import cached_json
 from app.utils.logger import setup_logger
-from app.utils.channel import Channel, LAN_Member
 
 log = setup_logger(__name__)
 
 channel_api = Blueprint('channel', __name__, url_prefix="/api/channel")
 
+LONG_POLL_TIMEOUT = 25 # seconds
+SSE_KEEPALIVE = 15 # seconds
+SSE_DURATION = 300 # seconds a stream lasts, then the client reconnects with Last-Event-ID
+RETRY_AFTER = 5 # seconds, when every held slot is taken
+
+# Long-polls and streams sit on a server thread while they wait, so only a few at a time
+# may, and the rest of the threads stay free for ordinary requests
+held = threading.BoundedSemaphore(HELD_REQUESTS)
+
+def busy():
+    return "Too many waiting requests", 503, {"Retry-After": str(RETRY_AFTER)}
+
 @channel_api.route("/<int:channel_id>", methods=["GET"])
 def get_single_channel(channel_id):
-    for channel in server.channels:
-        if channel_id in channel:
-            channel = channel[channel_id].__dict__.copy()
-            channel["members"] = [member.get_user() for member in channel["members"]]
-            return jsonify({"channel": channel})
-    return "Channel not found", 404
+    etag = server.channels.etag(channel_id)
+    if etag is None:
+        return "Channel not found", 404
+    def build():
+        channel = server.channels.get(channel_id)
+        return {"channel": channel.to_dict() if channel is not None else None}
+    return cached_json(("channel", channel_id), etag, build)
 
 @channel_api.route("/<int:channel_id>/members", methods=["GET"])
 def get_channel_members(channel_id):
-    for channel in server.channels:
-        if channel_id in channel:
-            members = channel[channel_id].members.copy()
-            temp = []
-            for member in members:
-                temp.append(member.__dict__)
-            return jsonify(temp), 200
-    return "Channel not found", 404
+    since = request.args.get("since", type=int)
+    if since is None:
+        etag = server.channels.etag(channel_id)
+        if etag is None:
+            return "Channel not found", 404
+        return cached_json(("members", channel_id), etag, lambda: [member.to_dict() for member in server.channels.members(channel_id) or []])
+
+    # Long-poll: hold the request until membership moves past `since`
+    timeout = max(0, min(request.args.get("timeout", LONG_POLL_TIMEOUT, type=float), LONG_POLL_TIMEOUT))
+    if timeout > 0: # timeout=0 only asks for what changed so far, without holding a thread
+        if not held.acquire(blocking=False):
+            return busy()
+        try:
+            server.channels.wait_for_change(channel_id, since, timeout)
+        finally:
+            held.release()
+    changes = server.channels.changes_since(channel_id, since)
+    if changes is None:
+        return "Channel not found", 404
+    return jsonify(changes), 200
+
+@channel_api.route("/<int:channel_id>/members/stream", methods=["GET"])
+def stream_channel_members(channel_id):
+    if channel_id not in server.channels:
+        return "Channel not found", 404
+    since = request.headers.get("Last-Event-ID", type=int)
+    if since is None:
+        since = request.args.get("since", 0, type=int)
+
+    if not held.acquire(blocking=False):
+        return busy()
+
+    def event_stream(since):
+        deadline = time.monotonic() + SSE_DURATION
+        while time.monotonic() < deadline:
+            if not server.channels.wait_for_change(channel_id, since, min(SSE_KEEPALIVE, max(0, deadline - time.monotonic()))):
+                yield ": keepalive\n\n"
+                continue
+            changes = server.channels.changes_since(channel_id, since)
+            if changes is None:
+                break
+            since = changes["version"]
+            yield f"id: {since}\ndata: {json.dumps(changes)}\n\n"
+
+    response = Response(stream_with_context(event_stream(since)), mimetype="text/event-stream")
+    response.call_on_close(held.release)
+    return response
 
 # Channel join leave API
-@channel_api.route("/<channel_id>/join", methods=["POST"])
+@channel_api.route("/<int:channel_id>/join", methods=["POST"])
 def join_channel_api(channel_id):
-    for channel in server.channels:
-        if int(channel_id) in channel:
-            # Send the UDP port back to the client
-            return jsonify({"port": server.udp_socket_port}), 200
-    return jsonify({"status": "Channel not found"}), 404
+    if channel_id not in server.channels:
+        return jsonify({"status": "Channel not found"}), 404
+    port = server.udp_socket_port
+    if port is None:
+        return jsonify({"status": "Rendezvous server not running"}), 503
+    # Send the UDP port back to the client, channels with sfu_threshold or more members use the SFU
+    return jsonify({"port": port, "sfu_threshold": SFU_THRESHOLD or None}), 200
 
-@channel_api.route("/<channel_id>/leave", methods=["POST"])
+@channel_api.route("/<int:channel_id>/leave", methods=["POST"])
 def leave_channel_api(channel_id):
     name = request.json.get("name")
     ip = request.environ.get('HTTP_X_REAL_IP', request.remote_addr)
     log.info(f"{name} is leaving channel {channel_id} with ip {ip}")
     if not name or not ip:
         return "Missing parameters", 400
-    for channel in server.channels:
-        if int(channel_id) in channel:
-            status = channel[int(channel_id)].remove_member(name)
-            if status is None:
-                # Remove the member from channels_lan if they exist there
-                for channel_lan in server.channels_lan:
-                    if int(channel_id) in channel_lan:
-                        for member in channel_lan[int(channel_id)]:
-                            if member.name == name:
-                                channel_lan[int(channel_id)].remove(member)
-                                break
-                return jsonify({"status": "ok"}), 200
-            else:
-                return jsonify({"status": status}), 400
-    
-    return jsonify({"status": "Channel not found"}), 404
-
-@channel_api.route("/<channel_id>/lan_ip", methods=["POST"])
+    status = server.channels.leave(channel_id, name)
+    if status is None:
+        if server.rendezvous is not None:
+            server.rendezvous.presence.remove((channel_id, name))
+        return jsonify({"status": "ok"}), 200
+    if status == "Channel not found":
+        return jsonify({"status": status}), 404
+    return jsonify({"status": status}), 400
+
+@channel_api.route("/<int:channel_id>/lan_ip", methods=["GET", "POST"])
 def connect_lan(channel_id):
-    name = request.json.get("name")
+    # Members behind the caller's NAT, their LAN candidates came with their UDP join
     ip = request.environ.get('HTTP_X_REAL_IP', request.remote_addr)
-    lan_ip = request.json.get("lan_ip")
-    port = request.json.get("port")
-    if not name or not lan_ip or not port:
-        return "Missing parameters", 400
-    
-    channel_id = int(channel_id)
-    # Check if the channel exists
-    for channel in server.channels:
-        if channel_id in channel:
-            # Check if the channel already exists in channels_lan
-            for channel_lan in server.channels_lan:
-                if channel_id in channel_lan:
-                    # Check if the member already exists in the channel
-                    for member in channel_lan[channel_id]:
-                        if member.name == name:
-                            temp = [member.__dict__ for member in channel_lan[channel_id]]
-                            return jsonify(temp), 200
-                    channel_lan[channel_id].append(LAN_Member(name, ip, lan_ip, port))
-                    temp = [member.__dict__ for member in channel_lan[channel_id]]
-                    return jsonify(temp), 200
-            # If the channel doesn't exist in channels_lan, create it
-            channel_lan = {channel_id: [LAN_Member(name, ip, lan_ip, port)]}
-            server.channels_lan.append(channel_lan)
-            temp = [member.__dict__ for member in channel_lan[channel_id]]
-            return jsonify(temp), 200
-    # If the channel doesn't exist in channels, return an error
-    return jsonify({"status": "Channel not found"}), 404
\ No newline at end of file
+    members = server.channels.same_nat(channel_id, ip)
+    if members is None:
+        return jsonify({"status": "Channel not found"}), 404
+    return jsonify([{"name": member.name, "ip": member.ip, "lan_ip": member.lan_ip, "port": member.lan_port} for member in members if member.lan_ip]), 200
@@ -1,24 +1,63 @@
-import random
+import json
+import base64
+import binascii
 
 from flask import Blueprint, request, jsonify, redirect
 
 from app.core import server
+from app.utils.response_cache import cached_json, cache
 from app.utils.logger import setup_logger
-from app.utils.channel import Channel, LAN_Member
 
 log = setup_logger(__name__)
 
 channels_api = Blueprint('channels', __name__, url_prefix="/api/channels")
 
-# Get channel list
+PAGE_SIZE = 50
+PAGE_SIZE_MAX = 200
+
+def encode_cursor(cursor:tuple|None) -> str|None:
+    if cursor is None:
+        return None
+    return base64.urlsafe_b64encode(json.dumps(cursor, separators=(",", ":")).encode()).decode()
+
+def decode_cursor(value:str|None) -> tuple|None:
+    """Raises ValueError for a cursor we did not hand out."""
+    if not value:
+        return None
+    try:
+        key, channel_id = json.loads(base64.urlsafe_b64decode(value.encode()))
+    except (binascii.Error, UnicodeDecodeError, json.JSONDecodeError, TypeError) as e:
+        raise ValueError(value) from e
+    if not isinstance(key, str) or not isinstance(channel_id, int):
+        raise ValueError(value)
+    return key, channel_id
+
+# Get channel list, one page at a time: ?limit=&cursor=&name=&author= (name / author are prefixes)
 @channels_api.route("/", methods=["GET", "POST"])
 def get_channels():
-    channel_list = []
-    for channel in server.channels:
-        for channel_id in channel:
-            temp = channel[channel_id].__dict__
-            channel_list.append({"id": channel_id, "name": temp["name"], "author": temp["author"]})
-    return jsonify({"channels": channel_list})
+    try:
+        limit = min(max(int(request.args.get("limit", PAGE_SIZE)), 1), PAGE_SIZE_MAX)
+        cursor = decode_cursor(request.args.get("cursor"))
+    except ValueError:
+        return "Invalid limit or cursor", 400
+    name = request.args.get("name", "")
+    author = request.args.get("author", "")
+
+    def build():
+        channels, next_cursor = server.channels.page(limit, cursor, name, author)
+        return {
+            "channels": [{"id": channel.id, "name": channel.name, "author": channel.author} for channel in channels],
+            "next_cursor": encode_cursor(next_cursor),
+        }
+    # Only the first unfiltered page is worth keeping, searches and later pages vary too much
+    key = ("channels", limit) if cursor is None and not name and not author else None
+    return cached_json(key, server.channels.list_etag(), build)
+
+def parse_channel_id(value) -> int|None:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
 
 # Create channel
 @channels_api.route("/create", methods=["POST"])
@@ -29,65 +68,39 @@ def create_channel():
     if not name or not description or not author:
         log.error("Missing parameters")
         return "Missing parameters", 400
-    try:
-        channel_id = int(request.json.get("channel_id"))
-        if channel_id in server.channels:
-            channel_id = None
-        if channel_id < 10000 or channel_id > 99999:
-            channel_id = None
-    except:
-        channel_id = None
-    if not channel_id:
-        while True:
-            channel_id = random.randint(10000, 99999)
-            if channel_id not in server.channels:
-                break
-    channel = Channel(channel_id, name, description, author)
-    server.channels.append({channel_id: channel})
+    channel_id = parse_channel_id(request.json.get("channel_id"))
+    server.channels.create(name, description, author, channel_id)
     return "ok", 200
 
 @channels_api.route("/create", methods=["GET"])
 def create_channel_by_get():
-    if request.method == "GET":
-        name = request.args.get("name")
-        description = request.args.get("description")
-        author = request.args.get("author")
-        try:
-            channel_id = int(request.args.get("channel_id"))
-            if channel_id in server.channels:
-                channel_id = None
-            if channel_id < 10000 or channel_id > 99999:
-                channel_id = None
-        except:
-            channel_id = None
-        
-        if not name or not description or not author:
-            return "Missing parameters", 400
-        if not channel_id:
-            while True:
-                channel_id = random.randint(10000, 99999)
-                if channel_id not in server.channels:
-                    break
-        channel = Channel(channel_id, name, description, author)
-        server.channels.append({channel_id: channel})
-        return redirect("/channels")
+    name = request.args.get("name")
+    description = request.args.get("description")
+    author = request.args.get("author")
+    if not name or not description or not author:
+        return "Missing parameters", 400
+    channel_id = parse_channel_id(request.args.get("channel_id"))
+    server.channels.create(name, description, author, channel_id)
+    return redirect("/channels")
+
+def delete(channel_id:int) -> bool:
+    if not server.channels.delete(channel_id):
+        return False
+    cache.discard(("channel", channel_id), ("members", channel_id))
+    return True
 
 # Delete channel
 @channels_api.route("/delete/", methods=["POST"])
-def delete_channel(channel_id):
-    channel_id = request.json.get("channel_id")
+def delete_channel():
+    channel_id = parse_channel_id(request.json.get("channel_id"))
     if not channel_id:
         return "Missing parameters", 400
-    for channel in server.channels:
-        if channel_id in channel:
-            server.channels.remove(channel)
-            return jsonify({"status": "ok"}), 200
+    if delete(channel_id):
+        return jsonify({"status": "ok"}), 200
     return jsonify({"status": "Channel not found"}), 404
 
 @channels_api.route("/delete/<int:channel_id>", methods=["GET"])
 def delete_channel_by_get(channel_id):
-    for channel in server.channels:
-        if channel_id in channel:
-            server.channels.remove(channel)
-            return redirect("/channels")
-    return "Channel not found", 404
\ No newline at end of file
+    if delete(channel_id):
+        return redirect("/channels")
+    return "Channel not found", 404
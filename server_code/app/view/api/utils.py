@@ -1,6 +1,8 @@
 import time
 
-from flask import Blueprint, jsonify
+from flask import Blueprint, Response, jsonify
+
+from app.utils import metrics
 
 utils_api = Blueprint('util', __name__, url_prefix="/api")
 
@@ -8,4 +10,9 @@ utils_api = Blueprint('util', __name__, url_prefix="/api")
 @utils_api.route("/time")
 def get_time():
     current_time = time.time()
-    return jsonify({"time": current_time})
\ No newline at end of file
+    return jsonify({"time": current_time})
+
+# Prometheus scrape target
+@utils_api.route("/metrics")
+def get_metrics():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
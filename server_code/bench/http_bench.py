@@ -0,0 +1,78 @@
+"""req/s and tail latency of /api/channels and /members: dev server vs production serving modes.
+
+Run from server_code: python -m bench.http_bench --duration 10 --workers 4
+"""
+import os
+import sys
+import json
+import socket
+import struct
+import argparse
+import tempfile
+import subprocess
+import http.client
+
+from bench.worker_bench import load, wait_for_port
+
+
+PORT = 18002
+FIRST_CHANNEL_ID = 10000
+
+def post(path:str, body:dict|None=None) -> tuple[int, bytes]:
+    conn = http.client.HTTPConnection("127.0.0.1", PORT)
+    conn.request("POST", path, body=json.dumps(body or {}), headers={"Content-Type": "application/json"})
+    response = conn.getresponse()
+    data = response.read()
+    conn.close()
+    return response.status, data
+
+def populate(channel_count:int, members_per_channel:int) -> list[int]:
+    """Create channels over HTTP and join members through the rendezvous socket, like real clients."""
+    channel_ids = []
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.settimeout(2)
+    for i in range(channel_count):
+        channel_id = FIRST_CHANNEL_ID + i
+        post("/api/channels/create", {"name": f"channel {i}", "description": "http bench", "author": "bench", "channel_id": channel_id})
+        status, data = post(f"/api/channel/{channel_id}/join")
+        rendezvous_port = json.loads(data)["port"]
+        for m in range(members_per_channel):
+            name = f"user{m}".encode()
+            sock.sendto(struct.pack(">II", channel_id, len(name)) + name, ("127.0.0.1", rendezvous_port))
+            sock.recvfrom(1024)
+        channel_ids.append(channel_id)
+    sock.close()
+    return channel_ids
+
+def run(label:str, extra_args:list[str], env:dict, args):
+    process = subprocess.Popen([sys.executable, "server.py", "--host", "127.0.0.1", "--port", str(PORT), *extra_args], env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_for_port(PORT)
+        channel_ids = populate(args.channels, args.members)
+        rps, p99, errors = load(PORT, channel_ids, args.clients, args.duration)
+    finally:
+        process.terminate()
+        process.wait()
+    print(f"{label:<28} req/s: {rps:>8.0f}  p99: {p99:>7.2f} ms  errors: {errors}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--workers", type=int, default=0, help="Also run N gunicorn workers on the sqlite backend")
+    parser.add_argument("--clients", type=int, default=8, help="load generator processes")
+    parser.add_argument("--channels", type=int, default=100)
+    parser.add_argument("--members", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=10)
+    args = parser.parse_args()
+
+    print(f"{args.channels} channels x {args.members} members, {args.clients} client processes, {args.duration:.0f} s per run")
+    runs = [
+        ("dev server", ["--dev"], {}),
+        (f"waitress {args.threads} threads", ["--threads", str(args.threads)], {}),
+    ]
+    if args.workers > 1:
+        runs.append((f"gunicorn {args.workers}x{args.threads}", ["--workers", str(args.workers), "--threads", str(args.threads)], {"STATE_BACKEND": "sqlite"}))
+    for label, extra_args, extra_env in runs:
+        with tempfile.TemporaryDirectory() as path:
+            env = {**os.environ, "DATA_DIR": path, **extra_env}
+            run(label, extra_args, env, args)
@@ -0,0 +1,235 @@
+"""Synthetic client load for the signaling server, thousands of virtual clients in one process.
+
+Every virtual client follows the real client flow: join POST, UDP join packet,
+one /members snapshot then pushed notifications (acked) and keepalives,
+and a leave POST at the end of its session.
+
+Run from server_code:
+    python -m bench.loadgen --spawn --rate 50 --duration 60 --channel-size 8
+    python -m bench.loadgen --port 10001 --server-pid 1234 --rate 200
+"""
+import os
+import sys
+import json
+import time
+import random
+import struct
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from bisect import bisect_left
+from collections import defaultdict
+
+from bench.worker_bench import wait_for_port
+
+
+JOIN_HEADER = struct.Struct(">II")
+LAN_CANDIDATE = struct.Struct(">4sH")
+KEEPALIVE = 0x81
+KEEPALIVE_HEADER = struct.Struct(">BI")
+NOTIFY = 0x82
+NOTIFY_ACK = 0x83
+NOTIFY_ACK_HEADER = struct.Struct(">BI")
+KEEPALIVE_INTERVAL = 5
+FIRST_CHANNEL_ID = 10000
+BUCKETS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000]
+
+class Stats:
+    def __init__(self):
+        self.latencies = defaultdict(list) # endpoint -> seconds
+        self.errors = defaultdict(lambda: defaultdict(int)) # endpoint -> reason -> count
+        self.notifications = 0
+        self.active = 0
+        self.finished = 0
+
+    def record(self, endpoint:str, started:float, error:str|None=None):
+        if error is None:
+            self.latencies[endpoint].append(time.perf_counter() - started)
+        else:
+            self.errors[endpoint][error] += 1
+
+    def report(self):
+        endpoints = sorted(set(self.latencies) | set(self.errors))
+        for endpoint in endpoints:
+            values = sorted(self.latencies[endpoint])
+            errors = sum(self.errors[endpoint].values())
+            total = len(values) + errors
+            print(f"\n{endpoint}: {total} requests, {errors} errors ({errors / total * 100 if total else 0:.2f}%)")
+            for reason, count in self.errors[endpoint].items():
+                print(f"    error {reason}: {count}")
+            if not values:
+                continue
+            p = lambda q: values[min(len(values) - 1, int(len(values) * q))] * 1000
+            print(f"    p50 {p(0.5):.2f} ms  p90 {p(0.9):.2f} ms  p99 {p(0.99):.2f} ms  max {values[-1]*1000:.2f} ms")
+            counts = [0] * (len(BUCKETS_MS) + 1)
+            for value in values:
+                counts[bisect_left(BUCKETS_MS, value * 1000)] += 1
+            peak = max(counts)
+            for i, count in enumerate(counts):
+                if not count:
+                    continue
+                label = f"<= {BUCKETS_MS[i]} ms" if i < len(BUCKETS_MS) else f"> {BUCKETS_MS[-1]} ms"
+                print(f"    {label:>12} {count:>7} {'#' * max(1, count * 40 // peak)}")
+        print(f"\nnotifications received: {self.notifications}, sessions finished: {self.finished}")
+
+async def http(host:str, port:int, method:str, path:str, body:dict|None=None) -> tuple[int, bytes]:
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        payload = json.dumps(body).encode() if body is not None else b""
+        writer.write(
+            f"{method} {path} HTTP/1.1\r\nHost: {host}\r\nConnection: close\r\n"
+            f"Content-Type: application/json\r\nContent-Length: {len(payload)}\r\n\r\n".encode() + payload
+        )
+        await writer.drain()
+        head = await reader.readuntil(b"\r\n\r\n")
+        status = int(head.split(b" ", 2)[1])
+        return status, await reader.read()
+    finally:
+        writer.close()
+
+class UDPClient(asyncio.DatagramProtocol):
+    def __init__(self, stats:Stats):
+        self.stats = stats
+        self.transport = None
+        self.reply = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data:bytes, addr:tuple):
+        if data and data[0] == NOTIFY:
+            self.stats.notifications += 1
+            self.transport.sendto(NOTIFY_ACK_HEADER.pack(NOTIFY_ACK, struct.unpack_from(">I", data, 1)[0]))
+        elif self.reply is not None and not self.reply.done():
+            self.reply.set_result(data)
+
+async def timed_http(stats:Stats, endpoint:str, args, method:str, path:str, body:dict|None=None) -> bytes|None:
+    started = time.perf_counter()
+    try:
+        status, data = await asyncio.wait_for(http(args.host, args.port, method, path, body), args.timeout)
+    except asyncio.TimeoutError:
+        stats.record(endpoint, started, "timeout")
+        return None
+    except OSError as e:
+        stats.record(endpoint, started, type(e).__name__)
+        return None
+    if status != 200:
+        stats.record(endpoint, started, f"HTTP {status}")
+        return None
+    stats.record(endpoint, started)
+    return data
+
+async def virtual_client(client_id:int, channel_id:int, args, stats:Stats):
+    loop = asyncio.get_running_loop()
+    name = f"vc{client_id}"
+    stats.active += 1
+    try:
+        data = await timed_http(stats, "POST join", args, "POST", f"/api/channel/{channel_id}/join")
+        if data is None:
+            return
+        rendezvous = (args.host, json.loads(data)["port"])
+        transport, protocol = await loop.create_datagram_endpoint(lambda: UDPClient(stats), remote_addr=rendezvous)
+        try:
+            # UDP join, same packet as Fetch.join_channel
+            encoded = name.encode()
+            started = time.perf_counter()
+            protocol.reply = loop.create_future()
+            transport.sendto(JOIN_HEADER.pack(channel_id, len(encoded)) + encoded + LAN_CANDIDATE.pack(bytes([192, 168, 0, 2]), transport.get_extra_info("sockname")[1]))
+            try:
+                reply = await asyncio.wait_for(protocol.reply, args.timeout)
+            except asyncio.TimeoutError:
+                stats.record("UDP join", started, "timeout")
+                return
+            if reply != b"hello":
+                stats.record("UDP join", started, reply.decode(errors="replace"))
+                return
+            stats.record("UDP join", started)
+
+            await timed_http(stats, "GET members snapshot", args, "GET", f"/api/channel/{channel_id}/members?since=0&timeout=0")
+
+            # Stay in the channel, keeping the member alive like Fetch.keepalive_loop
+            session_end = loop.time() + random.expovariate(1 / args.session)
+            keepalive = KEEPALIVE_HEADER.pack(KEEPALIVE, channel_id) + encoded
+            while loop.time() < session_end:
+                await asyncio.sleep(min(KEEPALIVE_INTERVAL, max(0, session_end - loop.time())))
+                transport.sendto(keepalive)
+            await timed_http(stats, "POST leave", args, "POST", f"/api/channel/{channel_id}/leave", {"name": name})
+            stats.finished += 1
+        finally:
+            transport.close()
+    finally:
+        stats.active -= 1
+
+def read_proc(pid:int) -> tuple[float, int]:
+    """(CPU seconds, RSS bytes) of `pid` from /proc."""
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    cpu = (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    with open(f"/proc/{pid}/statm") as f:
+        rss = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    return cpu, rss
+
+async def monitor(pid:int, samples:list, stats:Stats):
+    last_cpu, _ = read_proc(pid)
+    last = time.monotonic()
+    while True:
+        await asyncio.sleep(1)
+        cpu, rss = read_proc(pid)
+        now = time.monotonic()
+        samples.append(((cpu - last_cpu) / (now - last) * 100, rss))
+        print(f"\ractive clients: {stats.active:>6}  server CPU: {samples[-1][0]:>6.1f}%  RSS: {rss / 1e6:>7.1f} MB", end="", flush=True)
+        last_cpu, last = cpu, now
+
+async def main(args):
+    stats = Stats()
+    channel_count = max(1, int(args.rate * args.duration / args.channel_size))
+    for i in range(channel_count):
+        await http(args.host, args.port, "POST", "/api/channels/create", {"name": f"load {i}", "description": "loadgen", "author": "loadgen", "channel_id": FIRST_CHANNEL_ID + i})
+
+    samples = []
+    monitor_task = asyncio.create_task(monitor(args.server_pid, samples, stats)) if args.server_pid else None
+    clients = []
+    loop = asyncio.get_running_loop()
+    end = loop.time() + args.duration
+    client_id = 0
+    # Poisson arrivals at args.rate clients/s, filling channels channel_size at a time
+    while loop.time() < end:
+        clients.append(asyncio.create_task(virtual_client(client_id, FIRST_CHANNEL_ID + (client_id // args.channel_size) % channel_count, args, stats)))
+        client_id += 1
+        await asyncio.sleep(random.expovariate(args.rate))
+    await asyncio.gather(*clients)
+    if monitor_task is not None:
+        monitor_task.cancel()
+
+    print(f"\n\n{client_id} virtual clients over {args.duration:.0f} s ({args.rate}/s), {channel_count} channels of {args.channel_size}")
+    stats.report()
+    if samples:
+        cpu = [s[0] for s in samples]
+        print(f"server CPU avg {sum(cpu) / len(cpu):.1f}% max {max(cpu):.1f}%, RSS max {max(s[1] for s in samples) / 1e6:.1f} MB")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=10001)
+    parser.add_argument("--rate", type=float, default=20, help="new virtual clients per second")
+    parser.add_argument("--duration", type=float, default=30, help="seconds of arrivals")
+    parser.add_argument("--session", type=float, default=20, help="mean session length in seconds")
+    parser.add_argument("--channel-size", type=int, default=8, help="virtual clients per channel")
+    parser.add_argument("--timeout", type=float, default=5)
+    parser.add_argument("--server-pid", type=int, help="sample this process's CPU and RSS (Linux)")
+    parser.add_argument("--spawn", action="store_true", help="start server.py on --port and monitor it")
+    args = parser.parse_args()
+
+    server_process = None
+    if args.spawn:
+        env = {**os.environ, "DATA_DIR": tempfile.mkdtemp()} # Don't leave load test channels behind
+        server_process = subprocess.Popen([sys.executable, "server.py", "--host", args.host, "--port", str(args.port)], env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        args.server_pid = server_process.pid
+        wait_for_port(args.port)
+    try:
+        asyncio.run(main(args))
+    finally:
+        if server_process is not None:
+            server_process.terminate()
+            server_process.wait()
@@ -0,0 +1,44 @@
+"""Startup cost of restoring the channel registry from snapshot + WAL.
+
+Run from server_code: python -m bench.persistence_bench --channels 100000
+"""
+import os
+import time
+import logging
+import argparse
+import tempfile
+
+from app.core.persistence import ChannelStore, COMPACT_AFTER
+from app.core.registry import ChannelRegistry
+from app.utils.channel import Channel
+
+
+def write_state(path:str, channel_count:int, wal_tail:int):
+    store = ChannelStore(path)
+    store.load()
+    # IDs are 5 digits in production, write records directly to go past 90k channels
+    records = [Channel(channel_id, f"channel {channel_id}", "persistence bench", "bench").to_record() for channel_id in range(channel_count)]
+    store.snapshot(records)
+    for channel_id in range(channel_count, channel_count + wal_tail):
+        store.append("create", channel_id, Channel(channel_id, f"channel {channel_id}", "persistence bench", "bench").to_record())
+    store.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--channels", type=int, default=100000)
+    parser.add_argument("--wal", type=int, default=COMPACT_AFTER - 1, help="WAL records on top of the snapshot")
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    with tempfile.TemporaryDirectory() as path:
+        write_state(path, args.channels, args.wal)
+        snapshot_size = os.path.getsize(os.path.join(path, "channels.snapshot"))
+
+        t0 = time.perf_counter()
+        registry = ChannelRegistry()
+        registry.attach_store(ChannelStore(path))
+        elapsed = time.perf_counter() - t0
+        registry.store.close()
+
+    print(f"snapshot: {args.channels} channels ({snapshot_size / 1e6:.1f} MB), WAL tail: {args.wal} records")
+    print(f"restored {len(registry)} channels in {elapsed*1000:.0f} ms")
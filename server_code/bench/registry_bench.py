@@ -0,0 +1,44 @@
+"""Channel lookup cost against registry size.
+
+Run from server_code: python -m bench.registry_bench
+"""
+import random
+import time
+import logging
+
+from app.core.registry import ChannelRegistry
+from app.utils.channel import Channel
+
+
+SIZES = [10, 100, 1_000, 10_000, 100_000]
+LOOKUPS = 200_000
+
+def build_registry(size:int) -> ChannelRegistry:
+    registry = ChannelRegistry()
+    # Channel IDs are 5 digits in production, so fill the dict directly to go past 90k channels
+    for channel_id in range(size):
+        registry.channels[channel_id] = Channel(channel_id, f"channel {channel_id}", "bench", "bench")
+    return registry
+
+def bench(size:int) -> tuple[float, float]:
+    registry = build_registry(size)
+    ids = [random.randrange(size) for _ in range(LOOKUPS)]
+
+    t0 = time.perf_counter()
+    for channel_id in ids:
+        registry.get(channel_id)
+    lookup = (time.perf_counter() - t0) / LOOKUPS
+
+    t0 = time.perf_counter()
+    for i, channel_id in enumerate(ids[:LOOKUPS // 10]):
+        registry.join(channel_id, f"user{i}", "127.0.0.1", 10000)
+        registry.leave(channel_id, f"user{i}")
+    join_leave = (time.perf_counter() - t0) / (LOOKUPS // 10)
+    return lookup, join_leave
+
+if __name__ == "__main__":
+    logging.disable(logging.INFO)
+    print(f"{'channels':>10} {'get (ns)':>10} {'join+leave (ns)':>16}")
+    for size in SIZES:
+        lookup, join_leave = bench(size)
+        print(f"{size:>10} {lookup*1e9:>10.0f} {join_leave*1e9:>16.0f}")
@@ -0,0 +1,150 @@
+"""Relay forwarding on localhost: relayed packets/second and the latency the extra hop adds.
+
+Run from server_code: python -m bench.relay_bench --duration 5 --size 172 --pings 2000
+"""
+import time
+import socket
+import logging
+import argparse
+import threading
+import multiprocessing
+
+from app.core.relay import RelayEngine, RELAY_BIND, RELAY_BIND_HEADER
+
+
+def run_relay(conn, stop_event):
+    logging.disable(logging.INFO)
+    relay = RelayEngine(host="127.0.0.1")
+    port, token_a = relay.allocate(0, "a", "b")
+    _, token_b = relay.allocate(0, "b", "a")
+    conn.send((port, token_a, token_b))
+    running = threading.Event()
+    threading.Thread(target=lambda: (stop_event.wait(), running.set()), daemon=True).start()
+    relay.serve(running)
+    conn.send((relay.forwarded, relay.dropped))
+
+def udp_socket() -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 << 20)
+    sock.bind(("127.0.0.1", 0))
+    return sock
+
+def bind(sock:socket.socket, relay:tuple, token:bytes):
+    sock.sendto(RELAY_BIND_HEADER.pack(RELAY_BIND, token), relay)
+
+def blast(relay:tuple, token:bytes, size:int, duration:float, ready):
+    """Send as fast as the socket takes it for `duration` seconds."""
+    sock = udp_socket()
+    bind(sock, relay, token)
+    ready.wait()
+    payload = bytes(size)
+    sent = 0
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        for _ in range(256):
+            sock.sendto(payload, relay)
+        sent += 256
+    print(f"sent:      {sent / duration:>10.0f} packets/s")
+
+def echo(target:tuple|None, token:bytes|None, stop_event, ready):
+    """Send every datagram back where it came from (through the relay if `target` is set)."""
+    sock = udp_socket()
+    sock.settimeout(0.2)
+    if target is not None:
+        bind(sock, target, token)
+    ready.put(sock.getsockname())
+    while not stop_event.is_set():
+        try:
+            data, addr = sock.recvfrom(2048)
+        except socket.timeout:
+            continue
+        sock.sendto(data, target or addr)
+
+def ping(sock:socket.socket, target:tuple, count:int, size:int) -> list[float]:
+    payload = bytearray(size)
+    rtts = []
+    sock.settimeout(1)
+    for i in range(count):
+        payload[:4] = i.to_bytes(4, "big")
+        t0 = time.perf_counter()
+        sock.sendto(payload, target)
+        try:
+            while sock.recv(2048)[:4] != payload[:4]:
+                pass
+        except socket.timeout:
+            continue
+        rtts.append(time.perf_counter() - t0)
+    return sorted(rtts)
+
+def throughput(relay:tuple, token_a:bytes, token_b:bytes, size:int, duration:float):
+    receiver = udp_socket()
+    receiver.settimeout(0.5)
+    ready = multiprocessing.Event()
+    sender = multiprocessing.Process(target=blast, args=(relay, token_a, size, duration, ready))
+    sender.start()
+    bind(receiver, relay, token_b)
+    time.sleep(0.2) # Let both binds land
+    ready.set()
+    received = 0
+    first = last = None
+    while True:
+        try:
+            receiver.recv(2048)
+        except socket.timeout:
+            break
+        last = time.perf_counter()
+        if first is None:
+            first = last
+        received += 1
+    sender.join()
+    elapsed = (last - first) if first is not None and last > first else duration
+    print(f"relayed:   {received / elapsed:>10.0f} packets/s ({received * size * 8 / elapsed / 1e6:.1f} Mbit/s of {size} byte payloads)")
+
+def latency(relay:tuple, token_a:bytes, token_b:bytes, size:int, count:int):
+    stop_event = multiprocessing.Event()
+    ready = multiprocessing.Queue()
+    results = {}
+    for mode in ("direct", "relay"):
+        sock = udp_socket()
+        if mode == "relay":
+            bind(sock, relay, token_a)
+            echoer = multiprocessing.Process(target=echo, args=(relay, token_b, stop_event, ready))
+        else:
+            echoer = multiprocessing.Process(target=echo, args=(None, None, stop_event, ready))
+        echoer.start()
+        target = relay if mode == "relay" else ready.get()
+        if mode == "relay":
+            ready.get()
+            time.sleep(0.2)
+        results[mode] = ping(sock, target, count, size)
+        stop_event.set()
+        echoer.join()
+        stop_event.clear()
+        sock.close()
+    p = lambda values, q: values[min(len(values) - 1, int(len(values) * q))] * 1e6
+    for mode, rtts in results.items():
+        print(f"{mode:<7} RTT p50 {p(rtts, 0.5):>7.1f} us  p99 {p(rtts, 0.99):>7.1f} us  ({len(rtts)}/{count} answered)")
+    # A relayed round trip crosses the relay twice, each crossing is one extra one-way hop
+    print(f"added one-way latency p50 {(p(results['relay'], 0.5) - p(results['direct'], 0.5)) / 2:.1f} us")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--duration", type=float, default=5, help="seconds of blasting")
+    parser.add_argument("--size", type=int, default=172, help="payload bytes per datagram")
+    parser.add_argument("--pings", type=int, default=2000)
+    args = parser.parse_args()
+
+    parent, child = multiprocessing.Pipe()
+    stop_event = multiprocessing.Event()
+    relay_process = multiprocessing.Process(target=run_relay, args=(child, stop_event))
+    relay_process.start()
+    port, token_a, token_b = parent.recv()
+    relay = ("127.0.0.1", port)
+    try:
+        throughput(relay, token_a, token_b, args.size, args.duration)
+        latency(relay, token_a, token_b, args.size, args.pings)
+    finally:
+        stop_event.set()
+        forwarded, dropped = parent.recv()
+        relay_process.join()
+    print(f"relay forwarded {forwarded} packets, dropped {dropped}")
@@ -0,0 +1,109 @@
+"""Local join burst against the rendezvous engine: joins/second and join latency percentiles.
+
+Run from server_code: python -m bench.rendezvous_load --joins 20000 --concurrency 256 --shards 4
+"""
+import time
+import asyncio
+import logging
+import argparse
+import threading
+import multiprocessing
+
+from app.core.registry import ChannelRegistry
+from app.core.rendezvous import RendezvousEngine, JOIN_HEADER, JOIN_OK
+from app.core.notifier import NOTIFY, NOTIFY_HEADER, NOTIFY_ACK, NOTIFY_ACK_HEADER
+
+
+FIRST_CHANNEL_ID = 10000
+
+def run_server(port_queue, stop_event, channel_count:int, shards:int):
+    logging.disable(logging.INFO)
+    registry = ChannelRegistry()
+    for i in range(channel_count):
+        registry.create("load", "load test", "bench", FIRST_CHANNEL_ID + i)
+    engine = RendezvousEngine(registry, host="127.0.0.1", shards=shards)
+    port_queue.put(engine.port)
+    running = threading.Event()
+    threading.Thread(target=lambda: (stop_event.wait(), running.set()), daemon=True).start()
+    engine.serve(running)
+
+class JoinClient(asyncio.DatagramProtocol):
+    def __init__(self):
+        self.waiter = None
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        if data and data[0] == NOTIFY:
+            # Someone else joined one of our channels: ack it like a client would, it is not our reply
+            if len(data) >= NOTIFY_HEADER.size:
+                _, seq = NOTIFY_ACK_HEADER.unpack_from(data)
+                self.transport.sendto(NOTIFY_ACK_HEADER.pack(NOTIFY_ACK, seq))
+            return
+        if self.waiter is not None and not self.waiter.done():
+            self.waiter.set_result(data)
+
+async def client_worker(worker:int, server:tuple, jobs:asyncio.Queue, channel_count:int, latencies:list, errors:list):
+    loop = asyncio.get_running_loop()
+    transport, protocol = await loop.create_datagram_endpoint(JoinClient, remote_addr=server)
+    try:
+        while True:
+            try:
+                i = jobs.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            name = f"user{worker}-{i}".encode()
+            packet = JOIN_HEADER.pack(FIRST_CHANNEL_ID + i % channel_count, len(name)) + name
+            protocol.waiter = loop.create_future()
+            t0 = time.perf_counter()
+            transport.sendto(packet)
+            try:
+                reply = await asyncio.wait_for(protocol.waiter, 2)
+            except asyncio.TimeoutError:
+                errors.append("timeout")
+                continue
+            latencies.append(time.perf_counter() - t0)
+            if reply != JOIN_OK:
+                errors.append(reply.decode(errors="replace"))
+    finally:
+        transport.close()
+
+async def load(server:tuple, joins:int, concurrency:int, channel_count:int) -> tuple[list, list, float]:
+    jobs = asyncio.Queue()
+    for i in range(joins):
+        jobs.put_nowait(i)
+    latencies, errors = [], []
+    t0 = time.perf_counter()
+    await asyncio.gather(*(client_worker(w, server, jobs, channel_count, latencies, errors) for w in range(concurrency)))
+    return latencies, errors, time.perf_counter() - t0
+
+def percentile(values:list, p:float) -> float:
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--joins", type=int, default=20000)
+    parser.add_argument("--concurrency", type=int, default=256)
+    parser.add_argument("--channels", type=int, default=1000)
+    parser.add_argument("--shards", type=int, default=1)
+    args = parser.parse_args()
+
+    port_queue = multiprocessing.Queue()
+    stop_event = multiprocessing.Event()
+    server_process = multiprocessing.Process(target=run_server, args=(port_queue, stop_event, args.channels, args.shards))
+    server_process.start()
+    try:
+        port = port_queue.get(timeout=10)
+        latencies, errors, elapsed = asyncio.run(load(("127.0.0.1", port), args.joins, args.concurrency, args.channels))
+    finally:
+        stop_event.set()
+        server_process.join()
+
+    latencies.sort()
+    print(f"shards={args.shards} joins={args.joins} concurrency={args.concurrency}")
+    print(f"joins/s: {len(latencies) / elapsed:.0f}")
+    if latencies:
+        print(f"latency p50: {percentile(latencies, 0.50)*1000:.2f} ms  p99: {percentile(latencies, 0.99)*1000:.2f} ms  max: {latencies[-1]*1000:.2f} ms")
+    print(f"errors: {len(errors)}")
@@ -0,0 +1,118 @@
+"""Full mesh vs SFU on localhost: per-client upload and the SFU's forwarding throughput.
+
+Every virtual client sends --fps frames of --size bytes a second (the defaults match
+the client: 2048 samples of 16 bit audio at 44.1 kHz plus the 8 byte timestamp).
+In mesh mode each frame goes to every other client, in SFU mode once to the SFU.
+--fps 0 blasts as fast as one process can send, to find the SFU's ceiling.
+
+Run from server_code: python -m bench.sfu_bench --clients 4 8 15 --duration 5
+"""
+import time
+import socket
+import logging
+import argparse
+import selectors
+import threading
+import multiprocessing
+
+from app.core.sfu import SFUEngine, SFU_BIND, SFU_BIND_HEADER
+
+
+def run_sfu(conn, stop_event, clients:int):
+    logging.disable(logging.INFO)
+    sfu = SFUEngine(host="127.0.0.1")
+    tokens = [sfu.subscribe(1, f"client{i}") for i in range(clients)]
+    conn.send((sfu.port, tokens))
+    running = threading.Event()
+    threading.Thread(target=lambda: (stop_event.wait(), running.set()), daemon=True).start()
+    sfu.serve(running)
+    conn.send((sfu.received, sfu.forwarded, sfu.dropped))
+
+def udp_socket() -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 << 20)
+    sock.bind(("127.0.0.1", 0))
+    sock.setblocking(False)
+    return sock
+
+def drain(selector:selectors.BaseSelector, timeout:float) -> int:
+    received = 0
+    for key, _ in selector.select(timeout):
+        while True:
+            try:
+                key.fileobj.recv(65535)
+            except BlockingIOError:
+                break
+            received += 1
+    return received
+
+def run_clients(mode:str, clients:int, fps:float, size:int, duration:float, sfu:tuple|None=None, tokens:list|None=None) -> tuple[int, int, int]:
+    """(bytes sent by client 0, datagrams sent by everyone, datagrams received by everyone)"""
+    socks = [udp_socket() for _ in range(clients)]
+    addrs = [sock.getsockname() for sock in socks]
+    selector = selectors.DefaultSelector()
+    for sock in socks:
+        selector.register(sock, selectors.EVENT_READ)
+    if mode == "sfu":
+        for sock, token in zip(socks, tokens):
+            sock.sendto(SFU_BIND_HEADER.pack(SFU_BIND, token), sfu)
+        time.sleep(0.2)
+    frame = bytes(size)
+    sent = received = client0_bytes = 0
+    interval = 1 / fps if fps else 0
+    start = time.perf_counter()
+    next_frame = start
+    while time.perf_counter() - start < duration:
+        if time.perf_counter() >= next_frame:
+            senders = socks if fps else socks[:1] # blast mode: one speaker, everyone else listens
+            for i, sock in enumerate(senders):
+                targets = [sfu] if mode == "sfu" else [addr for j, addr in enumerate(addrs) if j != i]
+                for target in targets:
+                    try:
+                        sock.sendto(frame, target)
+                    except BlockingIOError:
+                        continue
+                    sent += 1
+                    if i == 0:
+                        client0_bytes += size
+            next_frame += interval
+        received += drain(selector, max(0, min(next_frame - time.perf_counter(), 0.01)) if fps else 0)
+    received += drain(selector, 0.2)
+    for sock in socks:
+        sock.close()
+    return client0_bytes, sent, received
+
+def run(mode:str, clients:int, fps:float, size:int, duration:float):
+    stats = None
+    if mode == "sfu":
+        parent, child = multiprocessing.Pipe()
+        stop_event = multiprocessing.Event()
+        process = multiprocessing.Process(target=run_sfu, args=(child, stop_event, clients))
+        process.start()
+        port, tokens = parent.recv()
+        try:
+            client0_bytes, sent, received = run_clients(mode, clients, fps, size, duration, ("127.0.0.1", port), tokens)
+        finally:
+            stop_event.set()
+            stats = parent.recv()
+            process.join()
+    else:
+        client0_bytes, sent, received = run_clients(mode, clients, fps, size, duration)
+    expected = sent if mode == "mesh" else sent * (clients - 1)
+    line = (f"{mode:<5} clients={clients:<3} upload/client {client0_bytes * 8 / duration / 1e3:>9.1f} kbit/s  "
+            f"sent {sent / duration:>8.0f} pkt/s  delivered {received / duration:>8.0f} pkt/s ({received / expected * 100 if expected else 0:.1f}%)")
+    if stats is not None:
+        line += f"  SFU in {stats[0] / duration:.0f} pkt/s out {stats[1] / duration:.0f} pkt/s dropped {stats[2]}"
+    print(line)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, nargs="+", default=[4, 8, 15])
+    parser.add_argument("--fps", type=float, default=44100 / 2048, help="frames per second per client, 0 to blast")
+    parser.add_argument("--size", type=int, default=2048 * 2 + 8, help="bytes per frame")
+    parser.add_argument("--duration", type=float, default=5)
+    args = parser.parse_args()
+
+    for clients in args.clients:
+        for mode in ("mesh", "sfu"):
+            run(mode, clients, args.fps, args.size, args.duration)
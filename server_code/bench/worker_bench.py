@@ -0,0 +1,110 @@
+"""HTTP throughput of the API with 1 vs N gunicorn workers on the sqlite state backend.
+
+Run from server_code (needs gunicorn): python -m bench.worker_bench --workers 1 4 --duration 10
+"""
+import os
+import sys
+import time
+import socket
+import random
+import logging
+import argparse
+import tempfile
+import subprocess
+import http.client
+import multiprocessing
+
+from app.core.sqlite_registry import SQLiteRegistry
+
+
+PORT = 18001
+ENDPOINTS = ["/api/channels/", "/api/channel/{channel_id}/members"]
+
+def populate(path:str, channel_count:int, members_per_channel:int) -> list[int]:
+    registry = SQLiteRegistry(path)
+    channel_ids = []
+    for i in range(channel_count):
+        channel = registry.create(f"channel {i}", "worker bench", "bench")
+        for m in range(members_per_channel):
+            registry.join(channel.id, f"user{m}", "127.0.0.1", 20000 + m)
+        channel_ids.append(channel.id)
+    registry.close()
+    return channel_ids
+
+def wait_for_port(port:int, timeout:float=15):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), 0.5).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError("Server did not start")
+
+def client(args:tuple) -> tuple[int, int, list[float]]:
+    port, channel_ids, duration, seed = args
+    rng = random.Random(seed)
+    conn = http.client.HTTPConnection("127.0.0.1", port)
+    done = errors = 0
+    latencies = []
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        path = rng.choice(ENDPOINTS).format(channel_id=rng.choice(channel_ids))
+        t0 = time.perf_counter()
+        try:
+            conn.request("GET", path)
+            response = conn.getresponse()
+            response.read()
+            if response.status != 200:
+                errors += 1
+        except (OSError, http.client.HTTPException):
+            errors += 1
+            conn.close()
+            conn = http.client.HTTPConnection("127.0.0.1", port)
+            continue
+        latencies.append(time.perf_counter() - t0)
+        done += 1
+    conn.close()
+    return done, errors, latencies
+
+def load(port:int, channel_ids:list[int], clients:int, duration:float) -> tuple[float, float, int]:
+    """Hammer the server from `clients` processes, returns (req/s, p99 ms, errors)."""
+    with multiprocessing.Pool(clients) as pool:
+        results = pool.map(client, [(port, channel_ids, duration, seed) for seed in range(clients)])
+    done = sum(r[0] for r in results)
+    errors = sum(r[1] for r in results)
+    latencies = sorted(l for r in results for l in r[2])
+    p99 = latencies[int(len(latencies) * 0.99)] * 1000 if latencies else 0
+    return done / duration, p99, errors
+
+def run(workers:int, threads:int, env:dict, channel_ids:list[int], clients:int, duration:float):
+    process = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-w", str(workers), "-k", "gthread", "--threads", str(threads), "-b", f"127.0.0.1:{PORT}", "--log-level", "warning", "wsgi:app"],
+        env=env,
+    )
+    try:
+        wait_for_port(PORT)
+        rps, p99, errors = load(PORT, channel_ids, clients, duration)
+    finally:
+        process.terminate()
+        process.wait()
+    print(f"workers={workers:<3} req/s: {rps:>8.0f}  p99: {p99:>7.2f} ms  errors: {errors}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, os.cpu_count() or 4])
+    parser.add_argument("--threads", type=int, default=4, help="gthread threads per worker")
+    parser.add_argument("--clients", type=int, default=8, help="load generator processes")
+    parser.add_argument("--channels", type=int, default=200)
+    parser.add_argument("--members", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=10)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    with tempfile.TemporaryDirectory() as path:
+        db_path = os.path.join(path, "state.db")
+        channel_ids = populate(db_path, args.channels, args.members)
+        env = {**os.environ, "STATE_BACKEND": "sqlite", "SQLITE_PATH": db_path, "DATA_DIR": path}
+        print(f"{args.channels} channels x {args.members} members, {args.clients} client processes, {args.duration:.0f} s per run")
+        for workers in args.workers:
+            run(workers, args.threads, env, channel_ids, args.clients, args.duration)
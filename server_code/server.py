@@ -1,24 +1,82 @@
-import time
-import random
-import socket
-import struct
+import os
+import sys
+import signal
+import argparse
 import threading
-
-from flask import Flask, request, jsonify, render_template, redirect
+import subprocess
 
 from app import init_app
-from app.core import server
+from app.core import server, STATE_BACKEND
+from app.utils.logger import setup_logger
+
+
+log = setup_logger(__name__)
+
+def serve_dev(host:str, port:int):
+    # Werkzeug development server
+    app = init_app()
+    app.run(host=host, port=port)
+
+def serve_threaded(host:str, port:int, threads:int, connection_limit:int):
+    # Single process: waitress thread pool, shares the in-process state with the rendezvous listener
+    from waitress import create_server # Only needed here, --dev and gunicorn run without it
+    http_server = create_server(init_app(), host=host, port=port, threads=threads, connection_limit=connection_limit)
+    log.info(f"Serving HTTP on {host}:{port} with {threads} threads")
+    http_server.run() # Returns after closing on Ctrl+C / SIGTERM
+
+def serve_workers(host:str, port:int, workers:int, threads:int, connection_limit:int):
+    # Multi process: gunicorn workers on the sqlite backend, this process keeps the rendezvous listener
+    command = [
+        sys.executable, "-m", "gunicorn",
+        "-w", str(workers), "-k", "gthread", "--threads", str(threads),
+        "--worker-connections", str(connection_limit),
+        "-b", f"{host}:{port}", "wsgi:app",
+    ]
+    log.info(f"Serving HTTP on {host}:{port} with {workers} workers x {threads} threads")
+    gunicorn = subprocess.Popen(command, env=os.environ.copy())
+    try:
+        gunicorn.wait()
+    finally:
+        if gunicorn.poll() is None:
+            gunicorn.terminate() # Graceful: gunicorn lets in-flight requests finish
+            gunicorn.wait()
+
+def stop(signum, frame):
+    raise KeyboardInterrupt
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default=os.environ.get("HTTP_HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("HTTP_PORT", 10001)))
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("HTTP_WORKERS", 1)), help="HTTP worker processes, more than 1 needs STATE_BACKEND=sqlite")
+    parser.add_argument("--threads", type=int, default=int(os.environ.get("HTTP_THREADS", 8)), help="HTTP threads per worker")
+    parser.add_argument("--connection-limit", type=int, default=int(os.environ.get("HTTP_CONNECTION_LIMIT", 100)), help="Open connections per worker")
+    parser.add_argument("--dev", action="store_true", help="Use the Werkzeug development server")
+    parser.add_argument("--rendezvous-only", action="store_true", help="Only run the UDP rendezvous listener, HTTP is served by wsgi:app workers (STATE_BACKEND=sqlite)")
+    args = parser.parse_args()
+
+    if args.workers > 1 and STATE_BACKEND != "sqlite":
+        parser.error("--workers > 1 needs STATE_BACKEND=sqlite so the workers share state")
+
+    signal.signal(signal.SIGTERM, stop)
+    running = threading.Event()
+    server.set_event(running)
     try:
-        running = threading.Event()
-        server.set_event(running)
         server.run()
 
-        # Start the Flask server
-        app = init_app()
-        app.run(host="0.0.0.0", port=10001)
+        if args.rendezvous_only:
+            while server.nat_thread.is_alive():
+                server.nat_thread.join(1)
+        elif args.dev:
+            serve_dev(args.host, args.port)
+        elif args.workers > 1:
+            serve_workers(args.host, args.port, args.workers, args.threads, args.connection_limit)
+        else:
+            serve_threaded(args.host, args.port, args.threads, args.connection_limit)
+    except KeyboardInterrupt:
+        log.info("Shutting down")
     finally:
         running.set()
-        server.nat_thread.join()
+        if server.nat_thread.is_alive():
+            server.nat_thread.join()
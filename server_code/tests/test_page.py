@@ -0,0 +1,79 @@
+import random
+
+import pytest
+
+from app.core.registry import ChannelRegistry
+from app.core.sqlite_registry import SQLiteRegistry
+
+NAMES = ["Alpha", "alpine", "Beta", "bet", "Gamma", "gam", "Delta", "alps", "ALPHA 2", "b"]
+AUTHORS = ["alice", "Alan", "bob", "Bobby", "carol"]
+
+@pytest.fixture(params=["memory", "sqlite"])
+def registry(request, tmp_path):
+    if request.param == "memory":
+        yield ChannelRegistry()
+    else:
+        registry = SQLiteRegistry(str(tmp_path / "state.db"))
+        yield registry
+        registry.close()
+
+def populate(registry, count:int=60) -> dict:
+    rng = random.Random(1)
+    channels = {}
+    for i in range(count):
+        channel = registry.create(f"{rng.choice(NAMES)} {i % 7}" if i % 3 else rng.choice(NAMES), "", rng.choice(AUTHORS))
+        channels[channel.id] = channel
+    return channels
+
+def expected(channels:dict, name:str, author:str) -> set[int]:
+    return {
+        channel.id for channel in channels.values()
+        if channel.name.casefold().startswith(name.casefold()) and channel.author.casefold().startswith(author.casefold())
+    }
+
+def page_through(registry, limit:int, name:str="", author:str="") -> list[list[int]]:
+    pages = []
+    cursor = None
+    while True:
+        channels, cursor = registry.page(limit, cursor, name=name, author=author)
+        assert len(channels) <= limit
+        pages.append([channel.id for channel in channels])
+        if cursor is None:
+            return pages
+        assert len(channels) == limit # Only the last page may be short
+        assert len(pages) <= 100
+
+QUERIES = [("", ""), ("al", ""), ("ALP", ""), ("", "bob"), ("", "AL"), ("al", "a"), ("b", "BOB"), ("zzz", ""), ("", "zzz"), ("alpha", "carol")]
+
+@pytest.mark.parametrize("limit", [1, 2, 3, 7, 100])
+@pytest.mark.parametrize("name, author", QUERIES)
+def test_pages_are_complete_and_disjoint(registry, limit, name, author):
+    channels = populate(registry)
+    pages = page_through(registry, limit, name, author)
+    ids = [channel_id for page in pages for channel_id in page]
+    assert len(ids) == len(set(ids))
+    assert set(ids) == expected(channels, name, author)
+
+@pytest.mark.parametrize("name, author", QUERIES)
+def test_pages_after_a_delete(registry, name, author):
+    channels = populate(registry)
+    for channel_id in list(channels)[::4]:
+        assert registry.delete(channel_id)
+        del channels[channel_id]
+    ids = [channel_id for page in page_through(registry, 3, name, author) for channel_id in page]
+    assert len(ids) == len(set(ids))
+    assert set(ids) == expected(channels, name, author)
+
+def test_delete_between_pages(registry):
+    channels = populate(registry)
+    first, cursor = registry.page(5)
+    later, _ = registry.page(5, cursor)
+    for channel in (first[-1], later[2]): # The one the cursor points at, and one not seen yet
+        registry.delete(channel.id)
+        del channels[channel.id]
+    ids = [channel.id for channel in first[:-1]]
+    while cursor is not None:
+        page, cursor = registry.page(5, cursor)
+        ids += [channel.id for channel in page]
+    assert len(ids) == len(set(ids))
+    assert set(ids) == set(channels)
@@ -0,0 +1,53 @@
+import os
+import json
+
+from app.core.registry import ChannelRegistry
+from app.core.persistence import ChannelStore, WAL_FILE
+
+def start(path:str) -> ChannelRegistry:
+    registry = ChannelRegistry()
+    registry.attach_store(ChannelStore(path))
+    return registry
+
+def crash(registry:ChannelRegistry):
+    # Stop without the snapshot close() would write, as if the process died
+    registry.store.close()
+
+def test_torn_wal_tail_is_cut_off(tmp_path):
+    registry = start(tmp_path)
+    a = registry.create("a", "", "alice")
+    b = registry.create("b", "", "bob")
+    registry.delete(a.id)
+    crash(registry)
+    with open(os.path.join(tmp_path, WAL_FILE), "ab") as f:
+        f.write(b'{"op": "create", "id": 12345, "chan')
+
+    registry = start(tmp_path)
+    assert set(registry.channels) == {b.id}
+    c = registry.create("c", "", "carol")
+    crash(registry)
+
+    registry = start(tmp_path)
+    assert set(registry.channels) == {b.id, c.id}
+    assert registry.channels[c.id].name == "c"
+    crash(registry)
+    with open(os.path.join(tmp_path, WAL_FILE), "rb") as f:
+        lines = f.read().split(b"\n")
+    assert lines[-1] == b""
+    assert [json.loads(line)["op"] for line in lines[:-1]] == ["create", "create", "delete", "create"]
+
+def test_snapshot_and_wal_together(tmp_path):
+    registry = start(tmp_path)
+    a = registry.create("a", "", "alice")
+    b = registry.create("b", "", "bob")
+    registry.close() # Snapshot, empty WAL
+
+    registry = start(tmp_path)
+    assert set(registry.channels) == {a.id, b.id}
+    registry.delete(a.id)
+    c = registry.create("c", "", "carol")
+    crash(registry)
+
+    registry = start(tmp_path)
+    assert set(registry.channels) == {b.id, c.id}
+    crash(registry)
@@ -0,0 +1,7 @@
+# HTTP workers for multi-process deployments, e.g.
+#   STATE_BACKEND=sqlite python server.py --rendezvous-only
+#   STATE_BACKEND=sqlite gunicorn -w 4 -k gthread --threads 8 -b 0.0.0.0:10001 wsgi:app
+from app import init_app
+
+
+app = init_app()